@@ -1,10 +1,14 @@
 import multiprocessing
+import os
+
+from dotenv import load_dotenv
 
 # Gunicorn configuration for production
 bind = "127.0.0.1:8000"  # Only listen locally, Nginx will proxy
 workers = multiprocessing.cpu_count() * 2 + 1  # Number of worker processes
-worker_class = "sync"  # Use sync workers
-timeout = 3600  # Set timeout to 60 minutes for long-running pipelines
+worker_class = "gthread"  # Threaded workers, so open progress streams don't block a whole worker
+threads = 16  # Concurrent requests (incl. progress event streams) per worker
+timeout = 120  # Pipelines run in background job workers, requests stay short
 keepalive = 5  # Keepalive timeout
 max_requests = 1000  # Restart workers after this many requests
 max_requests_jitter = 50  # Add random jitter to max_requests
@@ -12,3 +16,11 @@ daemon = False  # Don't daemonize in production (let systemd handle it)
 accesslog = "data/log/gunicorn_access.log"  # Access log location
 errorlog = "data/log/gunicorn_error.log"  # Error log location
 loglevel = "info"  # Log level 
+
+# Sessions (and the jobs tied to them) must be readable by every worker, including
+# workers restarted after max_requests, so the cookie key cannot be per process
+load_dotenv(encoding='utf-8-sig')
+if workers > 1 and not os.getenv('FLASK_SECRET_KEY'):
+    raise RuntimeError("FLASK_SECRET_KEY is not set. With several Gunicorn workers every worker needs the same "
+                       "session key; set it in .env, e.g. to the output of: "
+                       "python -c \"import secrets; print(secrets.token_hex(32))\"")
@@ -16,39 +16,62 @@ Flow:
 3. Save results and calculate agreement metrics
 """
 
-from openai import OpenAI
-import pandas as pd
+import argparse
 import yaml
-from sklearn.metrics import cohen_kappa_score
 import os
 import json
-from typing import Dict, List, AsyncGenerator, Optional, Any
+from typing import Dict, Iterable, List, AsyncGenerator, Optional, Any, Callable, Tuple, Union, TYPE_CHECKING
 from pydantic import BaseModel, Field, model_validator
 import asyncio
 import logging
-from logging.handlers import RotatingFileHandler
 from datetime import datetime
 from enum import Enum
 import sys
+import time
 from collections import defaultdict
-from docx import Document
 import re
 
+from utils.async_logging import PayloadBuffer, PayloadLogger, setup_async_logging
+from utils.description_cleaning import DEFAULT_SETTINGS as DEFAULT_PREPROCESSING, DescriptionCleaner
+from utils.endpoint_pool import EndpointPool, load_endpoints
+from utils.exemplar_index import DEFAULT_SETTINGS as DEFAULT_EXAMPLES, ExemplarIndex
+from utils.fair_share import (DEFAULT_INTERACTIVE_MAX_TASKS, FairShareScheduler, JobShare, estimate_tokens,
+                              resolve_priority)
+from utils.metrics import (API_REQUESTS, API_RETRIES, METRICS, PROMPT_TOKENS_SAVED, TASKS, TOKENS, time_stage,
+                           write_run_summary)
+from utils.result_store import ResultStore
+from utils.run_report import DEFAULT_PRICES, build_run_report, write_calls_csv, write_run_report
+from utils.scheme_compiler import load_compiled_scheme, source_outdated
+from utils.sharding import file_sha256, parse_shard, select_shard, shard_suffix, write_shard_manifest
+from utils.tracing import SPAN_KIND_CLIENT, TRACER, JsonLinesSpanExporter
+from utils.value_only import (DEFAULT_SETTINGS as DEFAULT_VALUE_ONLY, EXPLAIN_INSTRUCTION, EXPLAIN_MAX_TOKENS,
+                              TOP_LOGPROBS, VALUE_MAX_TOKENS, LogprobsUnavailable, explain_messages,
+                              needs_explanation, validate_settings as validate_value_only, value_codes,
+                              value_from_logprobs, value_messages)
+from utils.work_queue import WorkQueue, new_worker_id, open_work_queue
+
+# Heavy dependencies (pandas, openai, python-docx) are imported by the stage that
+# needs them, so importing this module (e.g. from the web app) stays cheap.
+if TYPE_CHECKING:
+    import pandas as pd
+
 # Get the root directory path
 root_dir = os.path.dirname(os.path.abspath(__file__))
 
 # API key is loaded from env or can be provided at runtime (e.g. via web UI)
 api_key = os.getenv("OPENAI_API_KEY")
 
-# Debug: Print environment variables
-print("\n=== Environment Variables ===")
-print(f"Current directory: {os.getcwd()}")
-print(f"Root directory: {root_dir}")
-print(f"OPENAI_API_KEY exists: {'OPENAI_API_KEY' in os.environ}")
-if 'OPENAI_API_KEY' in os.environ:
-    print(f"OPENAI_API_KEY length: {len(api_key)}")
-    print(f"OPENAI_API_KEY first 8 chars: {api_key[:8]}...")
-print("==========================\n")
+def print_environment_debug():
+    """Print environment debug information (CLI runs only)"""
+    api_key = os.getenv("OPENAI_API_KEY")
+    print("\n=== Environment Variables ===")
+    print(f"Current directory: {os.getcwd()}")
+    print(f"Root directory: {root_dir}")
+    print(f"OPENAI_API_KEY exists: {'OPENAI_API_KEY' in os.environ}")
+    if 'OPENAI_API_KEY' in os.environ:
+        print(f"OPENAI_API_KEY length: {len(api_key)}")
+        print(f"OPENAI_API_KEY first 8 chars: {api_key[:8]}...")
+    print("==========================\n")
 
 # Configuration for file paths, logging, and GPT settings
 CONFIG = {
@@ -66,6 +89,11 @@ CONFIG = {
         'level': 'INFO',
         'max_bytes': 10 * 1024 * 1024,  # 10MB
         'backup_count': 5,
+        'payloads': {
+            'mode': 'sampled',      # all, sampled, errors or off
+            'sample_rate': 0.01,    # Fraction of calls whose prompt/response is logged in 'sampled' mode
+            'trace_file': True      # Write payloads to a separate compressed trace file
+        },
         'format': {
             'timestamp': '%(asctime)s',
             'level': '%(levelname)s',
@@ -78,7 +106,23 @@ CONFIG = {
     },
     'gpt': {
         'model': 'gpt-4',                              # GPT model to use
-        'temperature': 0.0                             # 0.0 for most consistent results
+        'temperature': 0.0,                            # 0.0 for most consistent results
+        'prices': DEFAULT_PRICES,                      # USD per million tokens, for the run report
+        'endpoints': [],                # API endpoints/keys to spread requests over (see utils/endpoint_pool.py);
+                                        # empty: OPENAI_API_KEY / OPENAI_BASE_URL
+        'max_concurrent_requests': None,  # Requests at a time; default: the endpoints' total concurrency
+        'value_only': dict(DEFAULT_VALUE_ONLY)  # Ask for the value only, reasoning on demand (see utils/value_only.py)
+    },
+    'preprocessing': dict(DEFAULT_PREPROCESSING),  # Description cleaning for the prompt (see utils/description_cleaning.py)
+    'examples': dict(DEFAULT_EXAMPLES),  # Few-shot examples chosen per entry by similarity (see utils/exemplar_index.py)
+    'queue': {
+        'batch_size': 10,       # Tasks a queue worker claims at a time
+        'lease_seconds': 300,   # Claimed tasks go back to the queue if not renewed within this time
+        'poll_seconds': 5       # Wait before asking again while other workers hold the remaining tasks
+    },
+    'tracing': {
+        'enabled': False,  # Export trace spans of each run (prompt build, HTTP attempts, waits, validation)
+        'file': None       # Default: data/log/pipeline_spans_<timestamp>.jsonl
     },
     'test_mode': {
         'enabled': True,
@@ -87,6 +131,16 @@ CONFIG = {
     }
 }
 
+DEFAULT_QUEUE_SETTINGS = dict(CONFIG['queue'])
+
+DEFAULT_MAX_TOKENS = 500  # Completion budget of categories without one (see utils/scheme_compiler.py)
+MAX_COMPLETION_TOKENS = 2000  # Upper limit when an answer was cut off and is asked for again
+
+
+def queue_fingerprint(data_path: str, categories: List[str], model: str) -> str:
+    """Identifies the work of a queue, so workers started with other inputs are refused"""
+    return json.dumps({'data_sha256': file_sha256(data_path), 'categories': categories, 'model': model})
+
 # ============================================================================
 # Data Structures - Define and validate data shapes throughout the pipeline
 # ============================================================================
@@ -99,6 +153,8 @@ class DataEntry(BaseModel):
     - title: Training title
     - description: Training description to classify
     - human_code: Optional human-assigned classification (0 or 1)
+    - clean_description: Description as the prompt shows it, if cleaned (see utils/description_cleaning.py)
+    - examples: Examples per category chosen for this entry, if selected (see utils/exemplar_index.py)
     """
     title: str
     description: str
@@ -107,6 +163,8 @@ class DataEntry(BaseModel):
         pattern="^[01]$",
         description="Human-assigned code (0 or 1)"
     )
+    clean_description: Optional[str] = None
+    examples: Optional[Dict[str, List[str]]] = None
 
 class ProcessingResult(BaseModel):
     """Model for classification results"""
@@ -157,6 +215,8 @@ class CodingSchemeCategory(BaseModel):
     criteria: str
     examples: List[str]
     values: str
+    max_tokens: Optional[int] = None  # Completion budget; from the value type unless set in the YAML
+    reasoning_sentences: Optional[int] = None  # Length of the requested reasoning, likewise
 
     @model_validator(mode='before')
     @classmethod
@@ -199,6 +259,26 @@ class CodingScheme(BaseModel):
             categories=scheme_data['categories']
         )
 
+    @classmethod
+    def from_compiled(cls, artifact: Dict) -> 'CodingScheme':
+        """Create CodingScheme from a compiled scheme artifact (already validated by the compiler)"""
+        categories = {}
+        for key, details in artifact['categories'].items():
+            category = CodingSchemeCategory.model_construct(
+                display_name=details['display_name'],
+                simplified_name=details['simplified_name'],
+                criteria=details['criteria'],
+                examples=details['examples'],
+                values=details['values'],
+                max_tokens=details['max_tokens'],
+                reasoning_sentences=details['reasoning_sentences']
+            )
+            categories[key] = category
+        # Categories are also reachable under their explicit simplified names
+        for alias, key in artifact['aliases'].items():
+            categories[alias] = categories[key]
+        return cls.model_construct(version=artifact['version'], categories=categories)
+
 # ============================================================================
 # Management Components
 # ============================================================================
@@ -213,8 +293,9 @@ class DataManager:
     3. Generate validated DataEntry objects
     """
     @staticmethod
-    async def load_data(path: str) -> pd.DataFrame:
-        """Load and validate data file (CSV or XLSX)"""
+    async def load_data(path: str) -> 'pd.DataFrame':
+        """Load and validate data file (CSV, XLSX or Parquet)"""
+        import pandas as pd
         try:
             # Determine file type from extension
             if path.endswith('.xlsx'):
@@ -222,6 +303,12 @@ class DataManager:
                 print(f"\nLoaded Excel file: {path}")
                 print(f"Columns found: {df.columns.tolist()}")
                 return df
+            elif path.endswith('.parquet'):
+                # Needs pyarrow or fastparquet, which are only required for Parquet input
+                try:
+                    return pd.read_parquet(path)
+                except ImportError:
+                    raise ValueError(f"Reading Parquet files requires pyarrow (pip install pyarrow): {path}")
             else:  # default to CSV
                 return pd.read_csv(path)
         except FileNotFoundError:
@@ -235,7 +322,7 @@ class DataManager:
             raise ValueError(f"Error loading data file: {str(e)}")
     
     @staticmethod
-    async def merge_datasets(main_df: pd.DataFrame, codes_df: pd.DataFrame) -> pd.DataFrame:
+    async def merge_datasets(main_df: 'pd.DataFrame', codes_df: 'pd.DataFrame') -> 'pd.DataFrame':
         """Merge training data with human codes"""
         # Merge on title
         merged = main_df.merge(codes_df, on='title', how='left')
@@ -246,7 +333,7 @@ class DataManager:
         return merged
     
     @staticmethod
-    async def iterate_entries(df: pd.DataFrame, category: str) -> AsyncGenerator[DataEntry, None]:
+    async def iterate_entries(df: 'pd.DataFrame', category: str) -> AsyncGenerator[DataEntry, None]:
         """
         Iterate through entries with correct human code for each category
         
@@ -267,29 +354,9 @@ class ResourceManager:
     
     @staticmethod
     async def load_scheme(path: str) -> CodingScheme:
-        """Load and validate coding scheme"""
+        """Load coding scheme from its compiled artifact (compiled from the YAML file when it changed)"""
         try:
-            with open(path, 'r', encoding='utf-8') as file:
-                data = yaml.safe_load(file)
-            
-            # Create a mapping of simplified names to original names
-            if 'coding_scheme' in data and 'categories' in data['coding_scheme']:
-                categories = data['coding_scheme']['categories']
-                simplified_map = {}
-                for key, value in categories.items():
-                    if 'simplified_name' in value:
-                        simplified_map[value['simplified_name']] = key
-                    
-                # Create new categories dict with both original and simplified keys
-                new_categories = {}
-                for key, value in categories.items():
-                    new_categories[key] = value  # Keep original key
-                    if 'simplified_name' in value:
-                        new_categories[value['simplified_name']] = value  # Add simplified key
-                
-                data['coding_scheme']['categories'] = new_categories
-            
-            return CodingScheme.from_yaml(data)
+            return CodingScheme.from_compiled(load_compiled_scheme(path))
             
         except Exception as e:
             print(f"Error loading coding scheme: {str(e)}")
@@ -315,10 +382,14 @@ class ResourceManager:
             # Replace placeholders in template
             prompt = template
             prompt = prompt.replace('[title]', entry.title)
-            prompt = prompt.replace('[description]', entry.description)
+            description = entry.description if entry.clean_description is None else entry.clean_description
+            prompt = prompt.replace('[description]', description)
             prompt = prompt.replace('[category_name]', display_name)
             prompt = prompt.replace('[criteria]', category.criteria)
-            prompt = prompt.replace('[examples]', '\n'.join(f'- {ex}' for ex in category.examples))
+            examples = category.examples
+            if entry.examples is not None and category_key in entry.examples:
+                examples = entry.examples[category_key]
+            prompt = prompt.replace('[examples]', '\n'.join(f'- {ex}' for ex in examples))
             prompt = prompt.replace('[values]', category.values)
             
             return prompt
@@ -344,40 +415,14 @@ class ResultsManager:
         # Return original value if no transformation needed
         return value
 
-    async def save_results(self, results: List[ProcessingResult], output_base: str):
-        """Save results in Excel format"""
-        # Group results by title
-        entries = {}
-        categories = set()
-        
-        for result in results:
-            if result.title not in entries:
-                clean_description = ' '.join(
-                    result.description
-                    .replace('\n', ' ')
-                    .split()
-                )
-                entries[result.title] = {
-                    'title': result.title,
-                    'description': clean_description
-                }
-            # Store AI code, confidence, and reasoning for each category
-            cat = result.category
-            entries[result.title][f'ai_{cat}'] = self._transform_value(result.ai_code)  # Now self is defined
-            entries[result.title][f'confidence_{cat}'] = f"{result.confidence:.2f}"
-            entries[result.title][f'reasoning_{cat}'] = result.reasoning
-            categories.add(cat)
-        
-        # Convert to DataFrame
-        df = pd.DataFrame.from_dict(entries, orient='index')
-        
-        # Organize columns
-        ai_cols = [f'ai_{cat}' for cat in sorted(categories)]
-        confidence_cols = [f'confidence_{cat}' for cat in sorted(categories)]
-        reasoning_cols = [f'reasoning_{cat}' for cat in sorted(categories)]
-        
-        columns = ['title', 'description'] + ai_cols + confidence_cols + reasoning_cols
-        df = df.reindex(columns=columns)
+    def build_results_frame(self, results: Union[ResultStore, Iterable[ProcessingResult]]) -> 'pd.DataFrame':
+        """One row per entry with ai_/confidence_/reasoning_ columns per category"""
+        return ResultStore.from_results(results).to_frame(self._transform_value)
+
+    async def save_results(self, results: Union[ResultStore, Iterable[ProcessingResult]], output_base: str,
+                           suffix: str = ''):
+        """Save results in Excel format (results_<timestamp><suffix>.xlsx)"""
+        df = self.build_results_frame(results)
         
         # Ensure results directory exists
         results_dir = os.path.join(root_dir, 'data', 'results')  # Use root_dir to get absolute path
@@ -385,14 +430,14 @@ class ResultsManager:
         
         # Save with timestamp
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        excel_path = os.path.join(results_dir, f"results_{timestamp}.xlsx")
+        excel_path = os.path.join(results_dir, f"results_{timestamp}{suffix}.xlsx")
         df.to_excel(excel_path, index=False)
         print(f"\nResults saved to Excel: {excel_path}")
         
         return excel_path
     
     @staticmethod
-    async def calculate_metrics(results: List[ProcessingResult]) -> Dict:
+    async def calculate_metrics(results: Iterable[ProcessingResult]) -> Dict:
         """Calculate basic statistics about AI classifications"""
         by_category = defaultdict(list)
         for r in results:
@@ -421,20 +466,39 @@ class GPTClassificationInput(BaseModel):
     prompt: str
     model: str
     temperature: float
+    max_tokens: int = DEFAULT_MAX_TOKENS  # Completion budget of the call
+    reasoning_sentences: Optional[int] = None  # Ask for a reasoning of at most this many sentences
+    value_codes: Optional[List[str]] = None  # Value-only mode: the category's allowed codes
 
 class GPTClassificationOutput(BaseModel):
     """Output structure for GPT classification"""
     response: str
 
+class CallRecord(BaseModel):
+    """Usage and latency of one classification call (all attempts), for the run report"""
+    title: str
+    category: str
+    model: str
+    success: bool = False
+    attempts: int = 0
+    latency_seconds: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    endpoint: str = ''  # API endpoint of the last attempt
+    followup_calls: int = 0  # Value-only mode: follow-up calls for the reasoning
+
 class ResponseValidator:
     """Validates and interprets GPT responses"""
     
-    def validate_response(self, response: str, logger: logging.Logger) -> ValidationResult:
+    def validate_response(self, response: str, logger: logging.Logger,
+                          payloads: Optional[PayloadBuffer] = None) -> ValidationResult:
         """Validate and interpret GPT response in JSON format"""
+        if payloads is None:
+            payloads = PayloadBuffer(logger, write=False, keep=False)
         try:
             # Debug raw response
-            logger.info(f"\n🔍 Raw GPT response:")
-            logger.info(response)
+            payloads.add("🔍 Raw GPT response", response)
             
             # Clean the response if it contains markdown code blocks
             if '```json' in response:
@@ -448,6 +512,7 @@ class ResponseValidator:
             except json.JSONDecodeError as e:
                 logger.error(f"Failed to parse JSON response: {str(e)}")
                 logger.error(f"Response content: {response[:200]}...")
+                payloads.flush_error()
                 return ValidationResult(
                     value="0",  # Default to 0 on error
                     confidence=0.0,
@@ -455,14 +520,14 @@ class ResponseValidator:
                     reasoning=f"Error parsing JSON response: {str(e)}"
                 )
             
-            logger.info(f"\n📋 Parsed JSON data:")
-            logger.info(response_data)
+            payloads.add("📋 Parsed JSON data", response_data)
             
             # Validate required fields
             required_fields = ['value', 'confidence', 'reasoning']
             missing_fields = [field for field in required_fields if field not in response_data]
             if missing_fields:
                 logger.error(f"Missing required fields in response: {missing_fields}")
+                payloads.flush_error()
                 return ValidationResult(
                     value="0",  # Default to 0 on error
                     confidence=0.0,
@@ -474,7 +539,7 @@ class ResponseValidator:
             value = str(response_data.get('value', ''))  # Just convert to string
             
             # Debug output
-            logger.info(f"\n🔄 Value from GPT: {value}")
+            logger.debug("🔄 Value from GPT: %s", value)
             
             # Get confidence and reasoning
             try:
@@ -497,6 +562,7 @@ class ResponseValidator:
             
         except Exception as e:
             logger.error(f"Unexpected error in response validation: {str(e)}")
+            payloads.flush_error()
             return ValidationResult(
                 value="0",  # Default to 0 on error
                 confidence=0.0,
@@ -513,111 +579,252 @@ class ResponseValidator:
         return ConfidenceLevel.HIGH
 
 # GPT agent handles the AI interaction
+class InvalidResponseError(Exception):
+    """The API answered, but not with a usable JSON classification"""
+
+
 class GPTClassificationAgent:
     """GPT agent for classifying training data entries"""
-    def __init__(self):
-        self.client = OpenAI(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            timeout=120.0  # Increase timeout to 120 seconds
-        )
+    def __init__(self, endpoints: Optional[List[Dict]] = None):
+        # Async clients, so cancelling the pipeline task also aborts in-flight requests.
+        # Without configured endpoints the pool holds one client for OPENAI_API_KEY.
+        self.pool = EndpointPool.from_config(endpoints, timeout=120.0)  # Increase timeout to 120 seconds
+        self.scheduler: Optional[JobShare] = None  # Fair share of an API budget shared with other jobs, if any
         self.logger = logging.getLogger('gpt_agent')  # Get a logger for GPT agent
 
-    async def process(self, input_data: GPTClassificationInput) -> GPTClassificationOutput:
+    @staticmethod
+    def _record_usage(response, record: Optional[CallRecord], span) -> None:
+        """Add the token usage reported with a response to the run metrics, the call record and the trace span"""
+        usage = getattr(response, 'usage', None)
+        if getattr(response, 'model', None):
+            span.set_attribute('gen_ai.response.model', response.model)
+            if record is not None:
+                record.model = response.model  # The model version that actually answered
+        if usage is None:
+            return
+        details = getattr(usage, 'prompt_tokens_details', None)
+        prompt_tokens = usage.prompt_tokens or 0
+        completion_tokens = usage.completion_tokens or 0
+        cached_tokens = getattr(details, 'cached_tokens', 0) or 0
+        TOKENS.inc(prompt_tokens, kind='prompt')
+        TOKENS.inc(completion_tokens, kind='completion')
+        TOKENS.inc(cached_tokens, kind='cached')
+        span.set_attribute('gen_ai.usage.input_tokens', prompt_tokens)
+        span.set_attribute('gen_ai.usage.output_tokens', completion_tokens)
+        if record is not None:
+            record.prompt_tokens += prompt_tokens
+            record.completion_tokens += completion_tokens
+            record.cached_tokens += cached_tokens
+
+    @staticmethod
+    async def _wait_before_retry(error: Exception, delay: float) -> None:
+        """Back off before the next attempt; waits after 429 responses count as rate-limit wait"""
+        API_RETRIES.inc(error_class=type(error).__name__)
+        stage = 'rate_limit_wait' if getattr(error, 'status_code', None) == 429 else 'retry_backoff'
+        with time_stage(stage), TRACER.span(stage, delay_seconds=float(delay), error_class=type(error).__name__):
+            await asyncio.sleep(delay)
+
+    def _json_content(self, choice) -> str:
+        """The JSON object of a regular classification answer"""
+        response_content = choice.message.content
+        # Clean the response if it contains markdown code blocks
+        if '```json' in response_content:
+            response_content = response_content.split('```json')[1].split('```')[0].strip()
+        elif '```' in response_content:
+            response_content = response_content.split('```')[1].split('```')[0].strip()
+        # Validate that the response is JSON
+        try:
+            json.loads(response_content)
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Failed to parse JSON response: {str(e)}")
+            self.logger.error(f"Response content: {response_content[:500]}...")
+            raise InvalidResponseError(f"GPT response is not valid JSON. Response content: {response_content[:200]}...")
+        return response_content
+
+    @staticmethod
+    def _value_content(choice, codes: List[str]) -> str:
+        """A value-only answer as the JSON object the validator expects, rated by its logprobs"""
+        tokens = getattr(choice.logprobs, 'content', None) if choice.logprobs is not None else None
+        if not tokens:
+            raise LogprobsUnavailable("The API answered without logprobs")
+        try:
+            value, confidence = value_from_logprobs(tokens, codes)
+        except ValueError as e:
+            raise InvalidResponseError(str(e))
+        return json.dumps({'value': value, 'confidence': round(confidence, 4), 'reasoning': ''})
+
+    async def process(self, input_data: GPTClassificationInput,
+                      payloads: Optional[PayloadBuffer] = None,
+                      record: Optional[CallRecord] = None) -> GPTClassificationOutput:
+        """
+        Classify one prompt, retrying failed or invalid answers
+
+        With `value_codes` set, only the value is asked for and its
+        confidence comes from the token logprobs (see utils/value_only.py);
+        raises LogprobsUnavailable if the API does not return them. If a
+        call record is given, the token usage of every attempt, the number
+        of attempts and the answering model are added to it.
+        """
+        if input_data.value_codes:
+            codes = input_data.value_codes
+            content = await self._complete(
+                input_data, value_messages(input_data.prompt, codes), VALUE_MAX_TOKENS,
+                lambda choice: self._value_content(choice, codes), payloads, record,
+                logprobs=True, top_logprobs=TOP_LOGPROBS
+            )
+        else:
+            reasoning = "Deine Begründung"
+            if input_data.reasoning_sentences == 1:
+                reasoning += " in einem Satz"
+            elif input_data.reasoning_sentences:
+                reasoning += f" in höchstens {input_data.reasoning_sentences} Sätzen"
+            messages = [
+                {
+                    "role": "system", 
+                    "content": "Du bist ein wissenschaftlicher Coder, spezialisiert auf strukturierte Daten. Bitte antworte immer im JSON-Format mit den Feldern 'value', 'confidence' und 'reasoning'."
+                },
+                {
+                    "role": "user",
+                    "content": input_data.prompt + "\n\nBitte antworte im folgenden JSON-Format:\n{\n  \"value\": \"0\" oder \"1\",\n  \"confidence\": Zahl zwischen 0 und 1,\n  \"reasoning\": \"" + reasoning + "\"\n}"
+                }
+            ]
+            content = await self._complete(input_data, messages, input_data.max_tokens, self._json_content,
+                                           payloads, record)
+        return GPTClassificationOutput(response=content)
+
+    async def explain(self, input_data: GPTClassificationInput, value: str,
+                      payloads: Optional[PayloadBuffer] = None,
+                      record: Optional[CallRecord] = None) -> str:
+        """Follow-up call for the reasoning behind a value-only answer"""
+        if record is not None:
+            record.followup_calls += 1
+        messages = explain_messages(input_data.prompt, input_data.value_codes, value)
+        return await self._complete(input_data, messages, EXPLAIN_MAX_TOKENS,
+                                    lambda choice: choice.message.content.strip(), payloads, record,
+                                    logged_prompt=("Follow-up prompt", EXPLAIN_INSTRUCTION))
+
+    async def _complete(self, input_data: GPTClassificationInput, messages: List[Dict[str, str]], max_tokens: int,
+                        parse: Callable[[Any], str], payloads: Optional[PayloadBuffer] = None,
+                        record: Optional[CallRecord] = None, logged_prompt: Optional[Tuple[str, str]] = None,
+                        **request_options) -> str:
+        """
+        Send one chat completion request, retrying failed or invalid answers
+
+        `parse` turns the first choice of a response into the returned text
+        and raises InvalidResponseError if the answer is unusable. An
+        unusable answer that was cut off at max_tokens is asked for again
+        with twice the budget (up to MAX_COMPLETION_TOKENS). The payload log
+        shows `logged_prompt` (label, text), by default the full
+        classification prompt.
+        """
         max_retries = 3
         retry_delay = 2  # seconds
+        if payloads is None:
+            payloads = PayloadBuffer(self.logger, write=False, keep=False)
+        previous_attempts = record.attempts if record is not None else 0
         
         for attempt in range(max_retries):
+            if record is not None:
+                record.attempts = previous_attempts + attempt + 1
             try:
-                # Debug output - safer parsing
-                self.logger.info("\n🔍 Sending to GPT:")
-                self.logger.info("=" * 50)
-                try:
-                    # Extract title from prompt
+                # Debug output - only the full prompt goes through the payload log
+                if self.logger.isEnabledFor(logging.DEBUG):
                     prompt_lines = input_data.prompt.split('\n')
                     title = next((line.split('Titel: ')[1] for line in prompt_lines 
                                 if 'Titel: ' in line), 'No title found')
-                    # Extract category from JSON template
-                    category = next((line.split('category": "')[1].split('"')[0] 
-                                   for line in prompt_lines if '"category": "' in line), 
-                                  'No category found')
-                    self.logger.info(f"Title: {title}")
-                    self.logger.info(f"Category: {category}")
-                except Exception as e:
-                    self.logger.error(f"Error parsing prompt for debug output: {str(e)}")
-                    self.logger.info("Raw prompt:")
-                    self.logger.info(input_data.prompt)
-                self.logger.info("-" * 50)
-                self.logger.info("Full Prompt:")
-                self.logger.info(input_data.prompt)
-                self.logger.info("=" * 50)
+                    self.logger.debug("🔍 Sending to GPT (attempt %d): %s", attempt + 1, title)
+                if attempt == 0:
+                    payloads.add(*(logged_prompt or ("Full Prompt", input_data.prompt)))
+                # Our turn in the budget shared with other jobs, then the endpoint with the
+                # most headroom / lowest latency; both wait while the budget or all endpoints are used up
+                grant = None
+                if self.scheduler is not None:
+                    grant = await self.scheduler.acquire(estimate_tokens(input_data.prompt, max_tokens))
+                endpoint = await self.pool.acquire()
+                model = endpoint.model or input_data.model
+                if record is not None:
+                    record.endpoint = endpoint.name
+                # One span per HTTP attempt; it also covers checking the answer
+                attempt_span = TRACER.span('chat.completions', kind=SPAN_KIND_CLIENT, attempt=attempt + 1,
+                                           **{'gen_ai.request.model': model, 'server.address': endpoint.name,
+                                              'gen_ai.request.max_tokens': max_tokens})
                 try:
-                    # Add response format specification to ensure JSON output
-                    response = self.client.chat.completions.create(
-                        model=input_data.model,
-                        temperature=input_data.temperature,
-                        messages=[
-                            {
-                                "role": "system", 
-                                "content": "Du bist ein wissenschaftlicher Coder, spezialisiert auf strukturierte Daten. Bitte antworte immer im JSON-Format mit den Feldern 'value', 'confidence' und 'reasoning'."
-                            },
-                            {
-                                "role": "user",
-                                "content": input_data.prompt + "\n\nBitte antworte im folgenden JSON-Format:\n{\n  \"value\": \"0\" oder \"1\",\n  \"confidence\": Zahl zwischen 0 und 1,\n  \"reasoning\": \"Deine Begründung\"\n}"
-                            }
-                        ],
-                        max_tokens=500,  # Limit response length
-                        timeout=120.0  # Timeout in seconds
-                    )
+                    request_started = time.perf_counter()
+                    try:
+                        with time_stage('api_call'):
+                            raw_response = await endpoint.client.chat.completions.with_raw_response.create(
+                                model=model,
+                                temperature=input_data.temperature,
+                                messages=messages,
+                                max_tokens=max_tokens,
+                                timeout=120.0,  # Timeout in seconds
+                                **request_options
+                            )
+                    except BaseException as e:
+                        self.pool.release(endpoint, error=e)
+                        raise
+                    self.pool.release(endpoint, latency=time.perf_counter() - request_started,
+                                      headers=raw_response.headers)
+                    response = raw_response.parse()
+                    self._record_usage(response, record, attempt_span)
+                    if grant is not None and getattr(response, 'usage', None) is not None:
+                        await self.scheduler.settle(grant, response.usage.total_tokens or 0)
                     # Check if we got a valid response
                     if not response.choices:
-                        raise Exception("No response received from GPT")
+                        raise InvalidResponseError("No response received from GPT")
                     response_content = response.choices[0].message.content
                     if not response_content:
-                        raise Exception("Empty response from GPT")
+                        raise InvalidResponseError("Empty response from GPT")
                     # Check for HTML in response
                     if response_content.strip().startswith('<'):
-                        raise Exception("Received HTML response instead of JSON. This might indicate a server error or timeout.")
+                        raise InvalidResponseError("Received HTML response instead of JSON. This might indicate a server error or timeout.")
                     # Debug raw response
-                    self.logger.info("\n📝 Raw GPT Response:")
-                    self.logger.info("=" * 50)
-                    self.logger.info(response_content)
-                    self.logger.info("=" * 50)
-                    # Clean the response if it contains markdown code blocks
-                    if '```json' in response_content:
-                        response_content = response_content.split('```json')[1].split('```')[0].strip()
-                    elif '```' in response_content:
-                        response_content = response_content.split('```')[1].split('```')[0].strip()
-                    # Validate that the response is JSON
+                    payloads.add("📝 Raw GPT Response", response_content)
                     try:
-                        json.loads(response_content)
-                    except json.JSONDecodeError as e:
-                        self.logger.error(f"Failed to parse JSON response: {str(e)}")
-                        self.logger.error(f"Response content: {response_content[:500]}...")
-                        raise Exception(f"GPT response is not valid JSON. Response content: {response_content[:200]}...")
-                    return GPTClassificationOutput(response=response_content)
+                        response_content = parse(response.choices[0])
+                    except InvalidResponseError:
+                        if response.choices[0].finish_reason == 'length' and max_tokens < MAX_COMPLETION_TOKENS:
+                            max_tokens = min(max_tokens * 2, MAX_COMPLETION_TOKENS)
+                            self.logger.warning(f"Answer cut off; asking again with max_tokens={max_tokens}")
+                        raise
+                    API_REQUESTS.inc(outcome='ok')
+                    attempt_span.end()
+                    if record is not None:
+                        record.success = True
+                    return response_content
+                except LogprobsUnavailable as e:
+                    # Asking again gives the same answer; the caller falls back to the JSON format
+                    attempt_span.end(e)
+                    API_REQUESTS.inc(outcome='invalid')
+                    raise
                 except Exception as e:
+                    attempt_span.end(e)
+                    API_REQUESTS.inc(outcome='invalid' if isinstance(e, InvalidResponseError) else 'error')
                     if attempt < max_retries - 1:
                         self.logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
                         self.logger.info(f"Retrying in {retry_delay} seconds...")
-                        await asyncio.sleep(retry_delay)
+                        await self._wait_before_retry(e, retry_delay)
                         retry_delay *= 2  # Exponential backoff
                         continue
                     else:
                         self.logger.error(f"\n❌ Error in GPT request after {max_retries} attempts: {str(e)}")
                         self.logger.error("Request details:")
-                        self.logger.error(f"Model: {input_data.model}")
+                        self.logger.error(f"Model: {model}")
                         self.logger.error(f"Temperature: {input_data.temperature}")
-                        self.logger.error(f"API Key (first 8 chars): {api_key[:8]}...")
+                        self.logger.error(f"Endpoint: {endpoint.name}")
                         # Add more detailed error information
-                        if hasattr(e, 'response'):
+                        if getattr(e, 'response', None) is not None:
                             self.logger.error(f"Response status: {e.response.status_code}")
                             self.logger.error(f"Response body: {e.response.text}")
+                        payloads.flush_error()
                         raise
+            except LogprobsUnavailable:
+                raise
             except Exception as e:
                 if attempt < max_retries - 1:
                     self.logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
                     self.logger.info(f"Retrying in {retry_delay} seconds...")
-                    await asyncio.sleep(retry_delay)
+                    await self._wait_before_retry(e, retry_delay)
                     retry_delay *= 2  # Exponential backoff
                     continue
                 else:
@@ -629,6 +836,7 @@ class GPTClassificationAgent:
                         self.logger.error("2. SSL certificate verification problems")
                         self.logger.error("3. Proxy or firewall settings")
                         self.logger.error("4. API key authentication issues")
+                    payloads.flush_error()
                     raise
 
 # ============================================================================
@@ -784,8 +992,8 @@ class YAMLManager:
         try:
             # Get the directory containing the coding scheme file
             doc_dir = os.path.dirname(self.config['paths']['coding_scheme'])
-            # Use the path from config
-            input_file = os.path.join(doc_dir, self.config['paths']['docx_file'])
+            # The DOCX path from config, like the other paths relative to the working directory
+            input_file = self.config['paths']['docx_file']
             output_file = os.path.join(doc_dir, "coding_scheme_imported.yml")
             
             self.logger.info(f"Generating YAML from DOCX: {input_file}")
@@ -796,6 +1004,7 @@ class YAMLManager:
                 return False
             
             # Load DOCX
+            from docx import Document
             doc = Document(input_file)
             table = doc.tables[0]
             codes = {}
@@ -1001,9 +1210,60 @@ class TrainingDataClassifier:
         self.data_manager = DataManager()
         self.resource_manager = ResourceManager()
         self.results_manager = ResultsManager()
-        self.classification_agent = GPTClassificationAgent()
+        self.classification_agent = GPTClassificationAgent(config['gpt'].get('endpoints'))
         self.response_validator = ResponseValidator()
         self.yaml_manager = YAMLManager(config)  # Add YAML manager
+        self.payload_logger = PayloadLogger.from_config(logging.getLogger('gpt_payloads'), config)
+        self.output_path: Optional[str] = None  # Set once results are saved
+        self.call_records: List[CallRecord] = []  # Usage of each classification call in the current run
+        self.shard_titles: List[str] = []  # Titles and categories assigned to this shard, for its manifest
+        self.shard_categories: List[str] = []
+        self.description_cleaner: Optional[DescriptionCleaner] = None  # Set per run from the 'preprocessing' settings
+        self._task_providers: Dict[str, Any] = {}  # Queue workers: provider of each title, for boilerplate removal
+        self.exemplar_index: Optional[ExemplarIndex] = None  # Set per run from the 'examples' settings
+        # Classification requests running at a time: one per endpoint slot unless configured
+        self.request_limit = (config['gpt'].get('max_concurrent_requests')
+                              or self.classification_agent.pool.capacity)
+        self._request_slots: Optional[asyncio.Semaphore] = None  # Created in the running event loop
+        self._logprobs_unavailable = False  # Set once the API answered a value-only call without logprobs
+        # Checked here rather than per task, so invalid settings fail before the first paid call
+        self.value_only = validate_value_only(config['gpt'].get('value_only'))
+        
+        # Progress of the current run
+        self.current_entry = 0
+        self.total_entries = 0
+        self.completed_tasks = 0
+        self.total_tasks = 0
+
+    def _report_progress(self, category: str = '') -> None:
+        """Forward progress to the status callback (e.g. the web job runner), if configured"""
+        if 'status_callback' not in self.config:
+            return
+        progress = int((self.completed_tasks / self.total_tasks) * 100) if self.total_tasks else 0
+        self.config['status_callback'](
+            entry_num=self.current_entry,
+            total_entries=self.total_entries,
+            category=category,
+            progress=progress,
+            completed_tasks=self.completed_tasks,
+            total_tasks=self.total_tasks
+        )
+
+    def _report_result(self, result: ProcessingResult) -> None:
+        """Forward a completed result to the result callback (e.g. the web job's result store), if configured"""
+        if 'result_callback' in self.config:
+            self.config['result_callback'](result)
+
+    def _task_done(self, category: str) -> None:
+        """Count a finished (entry, category) task and report progress"""
+        self.completed_tasks += 1
+        self._report_progress(category)
+
+    def _request_slot(self) -> asyncio.Semaphore:
+        """Semaphore limiting the classification tasks in progress to request_limit"""
+        if self._request_slots is None:
+            self._request_slots = asyncio.Semaphore(self.request_limit)
+        return self._request_slots
 
     async def process_entries(self, entries: List[DataEntry], scheme: CodingScheme) -> None:
         """Process all entries through the pipeline"""
@@ -1057,9 +1317,93 @@ class TrainingDataClassifier:
                     progress=progress
                 )
 
-    async def process_entry(self, entry: DataEntry, template: str, scheme: CodingScheme) -> List[ProcessingResult]:
-        """Process a single entry for selected categories"""
-        results = []
+    async def classify_task(self, entry: DataEntry, template: str, scheme: CodingScheme,
+                            category_key: str) -> ProcessingResult:
+        """Classify one entry for one category; raises if no valid classification could be obtained"""
+        # Generate prompt
+        with time_stage('prompt_build'), TRACER.span('prompt_build'):
+            prompt = await self.resource_manager.construct_prompt(
+                template, entry, scheme, category_key
+            )
+        PROMPT_TOKENS_SAVED.inc(DescriptionCleaner.tokens_saved(entry.description, entry.clean_description))
+
+        # Create GPT input; in value-only mode, categories with numeric codes are asked for the code only
+        category = scheme.categories[category_key]
+        value_only = self.value_only
+        codes = None
+        if value_only['enabled'] and not self._logprobs_unavailable:
+            codes = value_codes(category.values)
+        gpt_input = GPTClassificationInput(
+            prompt=prompt,
+            model=self.config['gpt']['model'],
+            temperature=self.config['gpt']['temperature'],
+            max_tokens=category.max_tokens or DEFAULT_MAX_TOKENS,
+            reasoning_sentences=category.reasoning_sentences,
+            value_codes=codes
+        )
+
+        # Get and validate classification
+        payloads = self.payload_logger.start()
+        record = CallRecord(title=entry.title, category=category_key, model=gpt_input.model)
+        started = time.perf_counter()
+        try:
+            try:
+                gpt_output = await self.classification_agent.process(gpt_input, payloads=payloads, record=record)
+            except LogprobsUnavailable:
+                if not self._logprobs_unavailable:
+                    self.logger.warning("The API returns no logprobs; classifying with reasoning instead of value-only")
+                self._logprobs_unavailable = True
+                gpt_input.value_codes = None
+                # The JSON call is a new request, not a retry of the value-only one (whose tokens stay counted)
+                record.attempts = 0
+                gpt_output = await self.classification_agent.process(gpt_input, payloads=payloads, record=record)
+        finally:
+            record.latency_seconds = round(time.perf_counter() - started, 4)
+            self.call_records.append(record)
+        with time_stage('validate'), TRACER.span('validate'):
+            validation_result = self.response_validator.validate_response(
+                gpt_output.response,
+                logger=self.logger,
+                payloads=payloads
+            )
+
+        # Reasoning for the value-only results that need one
+        if gpt_input.value_codes and needs_explanation(validation_result.value, validation_result.confidence,
+                                                       gpt_input.value_codes, value_only):
+            started = time.perf_counter()
+            try:
+                validation_result.reasoning = await self.classification_agent.explain(
+                    gpt_input, validation_result.value, payloads=payloads, record=record
+                )
+            except Exception as e:
+                # The value stands without its reasoning
+                self.logger.warning(f"No reasoning for {entry.title} / {category_key}: {str(e)}")
+            finally:
+                record.latency_seconds = round(record.latency_seconds + time.perf_counter() - started, 4)
+
+        # Add to results
+        result = ProcessingResult(
+            title=entry.title,
+            description=entry.description,
+            category=category_key,
+            ai_code=validation_result.value,  # Use the value as-is
+            confidence=validation_result.confidence,
+            reasoning=validation_result.reasoning or ""
+        )
+        print(f"Result: {validation_result.value} (confidence: {validation_result.confidence:.2f})")
+        return result
+
+    async def process_entry(self, entry: DataEntry, template: str, scheme: CodingScheme,
+                            results: Optional[Union[ResultStore, List[ProcessingResult]]] = None
+                            ) -> Union[ResultStore, List[ProcessingResult]]:
+        """
+        Process a single entry for selected categories
+        
+        Results are appended to `results` (a list or a ResultStore) as soon as
+        each category completes, so they are kept if the run is cancelled
+        halfway through the entry.
+        """
+        results = [] if results is None else results
         
         print(f"\n📊 Processing Entry:")
         print(f"Title: {entry.title}")
@@ -1072,88 +1416,216 @@ class TrainingDataClassifier:
             return results
         
         # Process each category only once
-        processed_categories = set()
-        for category_key in selected_categories:
-            if category_key in processed_categories:
-                continue
-                
+        categories = []
+        for category_key in dict.fromkeys(selected_categories):
             if category_key not in scheme.categories:
                 print(f"Warning: Category {category_key} not found in scheme")
+                TASKS.inc(outcome='skipped')
+                self._task_done(category_key)
                 continue
-            
-            print(f"\n📋 Category: {category_key}")
-            processed_categories.add(category_key)
-            
-            try:
-                # Generate prompt
-                prompt = await self.resource_manager.construct_prompt(
-                    template, entry, scheme, category_key
-                )
-                
-                # Create GPT input
-                gpt_input = GPTClassificationInput(
-                    prompt=prompt,
-                    model=self.config['gpt']['model'],
-                    temperature=self.config['gpt']['temperature']
-                )
-                
-                # Get and validate classification
-                gpt_output = await self.classification_agent.process(gpt_input)
-                validation_result = self.response_validator.validate_response(
-                    gpt_output.response,
-                    logger=self.logger
-                )
-                
-                # Add to results
-                results.append(ProcessingResult(
-                    title=entry.title,
-                    description=entry.description,
-                    category=category_key,
-                    ai_code=validation_result.value,  # Use the value as-is
-                    confidence=validation_result.confidence,
-                    reasoning=validation_result.reasoning or ""
-                ))
-                
-                print(f"Result: {validation_result.value} (confidence: {validation_result.confidence:.2f})")
-                
-            except Exception as e:
-                print(f"Error processing category {category_key}: {str(e)}")
-                continue
-                
+            categories.append(category_key)
+
+        async def classify(category_key: str) -> None:
+            async with self._request_slot():
+                print(f"\n📋 Category: {category_key}")
+                with TRACER.span('task', category=category_key) as task_span:
+                    try:
+                        result = await self.classify_task(entry, template, scheme, category_key)
+                        results.append(result)
+                        self._report_result(result)
+                        TASKS.inc(outcome='ok')
+                    except Exception as e:
+                        TASKS.inc(outcome='error')
+                        task_span.record_error(e)
+                        print(f"Error processing category {category_key}: {str(e)}")
+            self._task_done(category_key)
+
+        # Categories run one after another, or side by side when the endpoint pool takes
+        # several requests at a time (request_limit)
+        await asyncio.gather(*(classify(category_key) for category_key in categories))
         return results
 
+    def _write_run_files(self, started: float, completed: bool, base: Optional[str] = None, **extra) -> None:
+        """
+        Write the run's metrics summary, usage report and per-call records
+
+        The files are named after `base`, by default the results file
+        without its extension; `extra` details are added to both summaries.
+        """
+        if base is None:
+            if not self.output_path:
+                return
+            base = os.path.splitext(self.output_path)[0]
+        details = {
+            'results_file': os.path.basename(self.output_path) if self.output_path else None,
+            'completed': completed,
+            'model': self.config['gpt']['model'],
+            'entries': self.total_entries,
+            'tasks': self.completed_tasks,
+            'total_tasks': self.total_tasks,
+            **extra,
+        }
+        if self.description_cleaner is not None:
+            details['preprocessing'] = self.description_cleaner.summary()
+        if self.exemplar_index is not None:
+            details['examples'] = self.exemplar_index.summary()
+        wall_seconds = time.perf_counter() - started
+        try:
+            write_run_summary(f'{base}_metrics.json', METRICS.snapshot(), wall_seconds, **details)
+            records = [record.model_dump() for record in self.call_records]
+            write_calls_csv(f'{base}_calls.csv', records)
+            report = build_run_report(records, self.config['gpt'].get('prices', DEFAULT_PRICES),
+                                      wall_seconds=round(wall_seconds, 3), **details)
+            write_run_report(f'{base}_report.json', report)
+            if self.config.get('shard') and self.output_path:
+                index, count = parse_shard(self.config['shard'])
+                write_shard_manifest(self.output_path, index, count, self.config['paths']['data_csv'],
+                                     self.shard_categories, self.shard_titles,
+                                     completed=completed, model=self.config['gpt']['model'])
+            totals = report['totals']
+            self.logger.info(
+                f"Run report saved to: {base}_report.json "
+                f"({totals['prompt_tokens'] + totals['completion_tokens']} tokens, ${totals['cost_usd']:.4f}, "
+                f"p95 latency {totals['latency_ms']['p95']:.0f} ms)"
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not write run report: {str(e)}")
+
+    def _apply_temp_files(self) -> None:
+        """Use uploaded temporary files (web interface) instead of the configured paths"""
+        if self.config.get('temp_files', {}).get('data_csv'):
+            self.config['paths']['data_csv'] = self.config['temp_files']['data_csv']
+        if self.config.get('temp_files', {}).get('coding_scheme'):
+            self.config['paths']['coding_scheme'] = self.config['temp_files']['coding_scheme']
+        if self.config.get('temp_files', {}).get('prompt_template'):
+            self.config['paths']['prompt_template'] = self.config['temp_files']['prompt_template']
+
+    def _results_suffix(self) -> str:
+        """Results of a shard run are named results_<timestamp>_shard<i>of<N>.xlsx"""
+        return shard_suffix(*parse_shard(self.config['shard'])) if self.config.get('shard') else ''
+
+    def _start_tracing(self) -> bool:
+        """Start exporting trace spans for this run if tracing is enabled; returns whether it was started"""
+        tracing = self.config.get('tracing') or {}
+        if not tracing.get('enabled') or TRACER.enabled:
+            return False
+        path = tracing.get('file') or os.path.join(
+            self.config['paths']['log_dir'], f"pipeline_spans_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl"
+        )
+        TRACER.start(JsonLinesSpanExporter(path))
+        self.logger.info(f"Writing trace spans to: {path}")
+        return True
+
+    def _join_fair_share(self) -> Optional[JobShare]:
+        """Take part in fair sharing of the API budget with other jobs, if configured (web jobs)"""
+        settings = self.config.get('fair_share') or {}
+        if not settings.get('enabled'):
+            return None
+        priority = resolve_priority(settings.get('priority'), self.total_tasks,
+                                    settings.get('interactive_max_tasks', DEFAULT_INTERACTIVE_MAX_TASKS))
+        scheduler = FairShareScheduler(settings['path'], rpm=settings.get('rpm', 0), tpm=settings.get('tpm', 0))
+        share = scheduler.join(settings.get('job_id') or new_worker_id(), priority)
+        self.classification_agent.scheduler = share
+        self.logger.info(f"Sharing the API budget with other jobs at {priority} priority")
+        return share
+
+    def _clean_descriptions(self, full_dataset: 'pd.DataFrame', dataset: 'pd.DataFrame') -> List[Optional[str]]:
+        """Cleaned description of each row of `dataset` (None if cleaning is off), learning from `full_dataset`"""
+        settings = self.config.get('preprocessing')
+        self.description_cleaner = DescriptionCleaner.from_config(settings, full_dataset)
+        cleaner = self.description_cleaner
+        if cleaner is None:
+            return [None] * len(dataset)
+        column = cleaner.settings['provider_column']
+        providers = dataset[column] if column and column in dataset.columns else [None] * len(dataset)
+        cleaned = [cleaner.clean(description, provider)
+                   for description, provider in zip(dataset['description'], providers)]
+        summary = cleaner.summary()
+        self.logger.info(f"Description cleaning removed {summary['chars_removed']['total']} of "
+                         f"{summary['chars_before']} characters ({summary['share_removed']:.1%}) "
+                         f"from {summary['descriptions']} distinct descriptions")
+        if cleaner.model is not None:
+            learned = sum(len(sentences) for sentences in cleaner.model.sentences.values())
+            self.logger.info(f"Removing {learned} boilerplate sentences of {len(cleaner.model.sentences)} providers")
+        return cleaned
+
+    async def _build_exemplar_index(self, scheme: CodingScheme, categories: List[str],
+                                    codes: Optional['pd.DataFrame'], dataset: Optional['pd.DataFrame']) -> None:
+        """Index the examples to choose from per entry, if the 'examples' settings enable it"""
+        settings = {**DEFAULT_EXAMPLES, **(self.config.get('examples') or {})}
+        self.exemplar_index = None
+        if not settings['enabled']:
+            return
+        if codes is None and settings['human_codes']:
+            human_codes_path = self.config['paths'].get('human_codes')
+            if human_codes_path and os.path.exists(human_codes_path):
+                codes = await self.data_manager.load_data(human_codes_path)
+        self.exemplar_index = ExemplarIndex.build(scheme, categories, settings, codes=codes, dataset=dataset)
+        summary = self.exemplar_index.summary()
+        self.logger.info(f"Choosing up to {settings['top_k']} of {summary['exemplars']} examples per category "
+                         f"and entry by similarity")
+
+    def _select_examples(self, titles: List[str], descriptions: List[str],
+                         categories: List[str]) -> List[Optional[Dict[str, List[str]]]]:
+        """Examples per category for each entry (None for each without an exemplar index)"""
+        if self.exemplar_index is None:
+            return [None] * len(titles)
+        with time_stage('example_select'), TRACER.span('example_select', entries=len(titles)):
+            return self.exemplar_index.select(titles, descriptions, categories)
+
     async def run(self):
         """Run the complete classification process"""
         self.logger.info("Starting classification")
+        all_results = ResultStore()  # Compact columns instead of one result object per task
+        METRICS.reset()
+        self.call_records = []
+        self._request_slots = None
+        started = time.perf_counter()
+        tracing_started = self._start_tracing()
+        share: Optional[JobShare] = None
+        run_span = TRACER.span('run', **{'gen_ai.request.model': self.config['gpt']['model'],
+                                         **(self.config.get('tracing') or {}).get('attributes', {})})
         try:
-            # Check if we have temporary files to use
-            if self.config.get('temp_files', {}).get('data_csv'):
-                self.config['paths']['data_csv'] = self.config['temp_files']['data_csv']
-            if self.config.get('temp_files', {}).get('coding_scheme'):
-                self.config['paths']['coding_scheme'] = self.config['temp_files']['coding_scheme']
-            if self.config.get('temp_files', {}).get('prompt_template'):
-                self.config['paths']['prompt_template'] = self.config['temp_files']['prompt_template']
-
-            # Generate YAML from DOCX if needed
-            if not os.path.exists(self.config['paths']['coding_scheme']):
+            self._apply_temp_files()
+
+            # Generate YAML from DOCX if needed (missing, or the configured DOCX changed since)
+            docx_path = None if self.config.get('temp_files', {}).get('coding_scheme') else self.config['paths'].get('docx_file')
+            if source_outdated(self.config['paths']['coding_scheme'], docx_path):
                 self.logger.info("Found DOCX file, updating coding scheme...")
                 if not await self.yaml_manager.update_coding_scheme():
-                    self.logger.error("Failed to update coding scheme")
-                    return False
+                    if not os.path.exists(self.config['paths']['coding_scheme']):
+                        self.logger.error("Failed to update coding scheme")
+                        return False
+                    self.logger.warning("Failed to update coding scheme from the DOCX, using the existing "
+                                        f"{self.config['paths']['coding_scheme']}")
             
             # Load and validate resources
-            dataset = await self.data_manager.load_data(self.config['paths']['data_csv'])
-            human_codes_path = self.config['paths'].get('human_codes')
-            if human_codes_path and os.path.exists(human_codes_path):
-                codes = await self.data_manager.load_data(human_codes_path)
-                dataset = await self.data_manager.merge_datasets(dataset, codes)
+            with time_stage('data_load'), TRACER.span('data_load'):
+                dataset = await self.data_manager.load_data(self.config['paths']['data_csv'])
+                human_codes_path = self.config['paths'].get('human_codes')
+                codes = None
+                if human_codes_path and os.path.exists(human_codes_path):
+                    codes = await self.data_manager.load_data(human_codes_path)
+                    dataset = await self.data_manager.merge_datasets(dataset, codes)
+                full_dataset = dataset
+                if self.config.get('shard'):
+                    # Only this shard's slice of the entries (see utils/sharding.py)
+                    index, count = parse_shard(self.config['shard'])
+                    total = len(dataset)
+                    dataset = select_shard(dataset, index, count)
+                    self.shard_titles = dataset['title'].astype(str).tolist()
+                    self.logger.info(f"Shard {index}/{count}: {len(dataset)} of {total} entries")
+
+            # Clean descriptions for the prompts; boilerplate is learned from all entries, not just this shard's
+            with time_stage('preprocess'), TRACER.span('preprocess'):
+                clean_descriptions = self._clean_descriptions(full_dataset, dataset)
             
             # Load scheme
-            scheme = await self.resource_manager.load_scheme(self.config['paths']['coding_scheme'])
-            template = await self.resource_manager.load_template(self.config['paths']['prompt_template'])
+            with time_stage('scheme_load'), TRACER.span('scheme_load'):
+                scheme = await self.resource_manager.load_scheme(self.config['paths']['coding_scheme'])
+                template = await self.resource_manager.load_template(self.config['paths']['prompt_template'])
             
             # Process entries
-            all_results = []
             entry_count = 0
             
             # Get selected categories
@@ -1161,31 +1633,92 @@ class TrainingDataClassifier:
             if not selected_categories:
                 self.logger.error("No categories selected in config")
                 return False
+            self.shard_categories = [key for key in dict.fromkeys(selected_categories) if key in scheme.categories]
+
+            # Index the examples once; entries are matched against it a batch at a time below
+            with time_stage('example_index'), TRACER.span('example_index'):
+                await self._build_exemplar_index(scheme, self.shard_categories, codes, full_dataset)
+            example_batch = max(int(self.exemplar_index.settings['batch_size']), 1) if self.exemplar_index else 1
+            entry_examples: List[Optional[Dict[str, List[str]]]] = []
                 
-            # Process each entry once
-            for _, row in dataset.iterrows():
-                entry = DataEntry(
-                    title=row["title"],
-                    description=row["description"],
-                    human_code="0"  # Default value
-                )
-                entry_count += 1
-                self.logger.info(f"Processing entry {entry_count}: {entry.title}")
-                
+            self.total_entries = len(dataset)
+            self.total_tasks = self.total_entries * len(dict.fromkeys(selected_categories))
+            self.completed_tasks = 0
+            run_span.set_attributes(entries=self.total_entries, tasks=self.total_tasks)
+            endpoints = self.classification_agent.pool.endpoints
+            if len(endpoints) > 1:
+                self.logger.info(f"Spreading requests over {len(endpoints)} API endpoints "
+                                 f"({', '.join(endpoint.name for endpoint in endpoints)}), "
+                                 f"up to {self.request_limit} at a time")
+            share = self._join_fair_share()
+            if share is not None:
+                run_span.set_attribute('job.priority', share.priority)
+            
+            async def process(entry: DataEntry, number: int) -> None:
                 # Process all selected categories for this entry
-                results = await self.process_entry(entry, template, scheme)
-                all_results.extend(results)
+                with TRACER.span('entry', entry=number, title=entry.title):
+                    await self.process_entry(entry, template, scheme, results=all_results)
+
+            # Process each entry once. While fewer than request_limit entries are in
+            # progress the next one starts, so its requests fill free endpoint slots.
+            in_progress = set()
+            try:
+                for (_, row), clean_description in zip(dataset.iterrows(), clean_descriptions):
+                    if not entry_examples:
+                        batch = dataset.iloc[entry_count:entry_count + example_batch]
+                        entry_examples = self._select_examples(batch['title'].tolist(), batch['description'].tolist(),
+                                                               self.shard_categories)
+                    entry = DataEntry(
+                        title=row["title"],
+                        description=row["description"],
+                        human_code="0",  # Default value
+                        clean_description=clean_description,
+                        examples=entry_examples.pop(0)
+                    )
+                    entry_count += 1
+                    self.logger.info(f"Processing entry {entry_count}: {entry.title}")
+                    self.current_entry = entry_count
+                    self._report_progress()
+                    in_progress.add(asyncio.ensure_future(process(entry, entry_count)))
+                    if len(in_progress) >= self.request_limit:
+                        done, in_progress = await asyncio.wait(in_progress, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            task.result()
+                await asyncio.gather(*in_progress)
+            finally:
+                # Entries still running when the run stops (e.g. cancelled) are cancelled with it
+                for task in in_progress:
+                    task.cancel()
+                await asyncio.gather(*in_progress, return_exceptions=True)
             
             # Save results with timestamp
-            output_path = await self.results_manager.save_results(
-                all_results, 
-                self.config['paths']['output_base']
-            )
+            with time_stage('result_write'), TRACER.span('result_write'):
+                output_path = await self.results_manager.save_results(
+                    all_results, 
+                    self.config['paths']['output_base'],
+                    suffix=self._results_suffix()
+                )
+            self.output_path = output_path
             self.logger.info(f"Results saved to: {output_path}")
+            self._write_run_files(started, completed=True)
             
             self.logger.info("Pipeline completed successfully")
             return True
             
+        except asyncio.CancelledError:
+            # Cancelling the run task aborts in-flight requests and retry sleeps;
+            # keep whatever completed before the cancellation
+            self.logger.warning(f"Pipeline cancelled after {len(all_results)} completed results")
+            if all_results:
+                with time_stage('result_write'), TRACER.span('result_write'):
+                    self.output_path = await self.results_manager.save_results(
+                        all_results,
+                        self.config['paths']['output_base'],
+                        suffix=self._results_suffix()
+                    )
+                self.logger.info(f"Partial results saved to: {self.output_path}")
+                self._write_run_files(started, completed=False)
+            raise
         except KeyboardInterrupt:
             print("\n\n🛑 Process interrupted by user")
             print("Cleaning up and shutting down...")
@@ -1194,8 +1727,153 @@ class TrainingDataClassifier:
             self.logger.error(f"Pipeline failed: {str(e)}")
             raise
         finally:
+            run_span.end(sys.exc_info()[1])  # The exception the run stops with, if any
+            if share is not None:
+                share.close()
+                self.classification_agent.scheduler = None
+            if tracing_started:
+                TRACER.stop()
             print("\n✨ Pipeline finished")
 
+    async def _renew_leases(self, queue: WorkQueue, worker_id: str, held: set, lease_seconds: float) -> None:
+        """Keep the leases of claimed tasks alive while this worker is busy with them"""
+        while True:
+            await asyncio.sleep(lease_seconds / 3)
+            if not held:
+                continue
+            try:
+                lost = held - set(await asyncio.to_thread(queue.renew, worker_id, list(held), lease_seconds))
+            except Exception as e:
+                self.logger.warning(f"Could not renew task leases: {str(e)}")
+                continue
+            if lost:
+                # Another worker may take them over; completing them here is still harmless
+                self.logger.warning(f"Lost the lease of {len(lost)} tasks")
+
+    async def _work_on_task(self, queue: WorkQueue, worker_id: str, task: Dict[str, Any],
+                            template: str, scheme: CodingScheme,
+                            examples: Optional[Dict[str, List[str]]] = None) -> bool:
+        """Classify one claimed task and store its result or failure; returns whether it was completed"""
+        entry = DataEntry(title=task['title'], description=task['description'], examples=examples)
+        if self.description_cleaner is not None:
+            entry.clean_description = self.description_cleaner.clean(entry.description,
+                                                                     self._task_providers.get(entry.title))
+        async with self._request_slot():
+            with TRACER.span('task', category=task['category'], attempt=task['attempts'],
+                             **{'queue.task_id': task['task_id']}) as task_span:
+                try:
+                    result = await self.classify_task(entry, template, scheme, task['category'])
+                except Exception as e:
+                    TASKS.inc(outcome='error')
+                    task_span.record_error(e)
+                    await asyncio.to_thread(queue.fail, worker_id, task['task_id'], str(e))
+                    return False
+        TASKS.inc(outcome='ok')
+        if not await asyncio.to_thread(queue.complete, worker_id, task['task_id'], result.model_dump()):
+            return False
+        self._report_result(result)
+        return True
+
+    async def run_queue_worker(self, queue: WorkQueue, worker_id: Optional[str] = None) -> int:
+        """
+        Work on (entry, category) tasks from a shared work queue until none are left
+
+        The first worker fills the queue from the configured dataset and
+        selected categories; later workers check that they were started with
+        the same data. Tasks are claimed in batches under a lease that is
+        renewed in the background, so tasks of a worker that dies are picked
+        up by others once the lease runs out. Results are stored in the queue
+        (export them with `run_pipeline.py queue PATH --export`); the
+        worker's own metrics summary and usage report are written to
+        data/results/results_<timestamp>_worker_<id>_* when it exits.
+        Returns the number of tasks this worker completed.
+        """
+        settings = {**DEFAULT_QUEUE_SETTINGS, **(self.config.get('queue') or {})}
+        worker_id = worker_id or new_worker_id()
+        started = time.perf_counter()
+        METRICS.reset()
+        self.call_records = []
+        self.output_path = None
+        self._request_slots = None
+        self._apply_temp_files()
+        selected_categories = list(dict.fromkeys(self.config.get('selected_categories', [])))
+        if not selected_categories:
+            raise ValueError("No categories selected in config")
+
+        with time_stage('scheme_load'):
+            scheme = await self.resource_manager.load_scheme(self.config['paths']['coding_scheme'])
+            template = await self.resource_manager.load_template(self.config['paths']['prompt_template'])
+        categories = [key for key in selected_categories if key in scheme.categories]
+        fingerprint = queue_fingerprint(self.config['paths']['data_csv'], categories, self.config['gpt']['model'])
+        preprocessing = {**DEFAULT_PREPROCESSING, **(self.config.get('preprocessing') or {})}
+        examples = {**DEFAULT_EXAMPLES, **(self.config.get('examples') or {})}
+        dataset = None
+        # Queue calls wait for the file lock of other workers (up to BUSY_TIMEOUT), so they run in a
+        # thread: the event loop keeps serving in-flight requests and the lease renewer meanwhile
+        queued_fingerprint = await asyncio.to_thread(queue.fingerprint)
+        if queued_fingerprint is None or preprocessing['strip_boilerplate'] or examples['enabled']:
+            # Boilerplate is learned from the whole dataset, so every worker removes the same sentences;
+            # coded exemplars take their descriptions from it
+            with time_stage('data_load'):
+                dataset = await self.data_manager.load_data(self.config['paths']['data_csv'])
+        with time_stage('preprocess'):
+            self.description_cleaner = DescriptionCleaner.from_config(preprocessing, dataset)
+            column = preprocessing['provider_column']
+            self._task_providers = (dict(zip(dataset['title'], dataset[column]))
+                                    if dataset is not None and column in dataset.columns else {})
+        with time_stage('example_index'):
+            await self._build_exemplar_index(scheme, categories, None, dataset)
+        if queued_fingerprint is None:
+            if await asyncio.to_thread(queue.populate, zip(dataset['title'], dataset['description']),
+                                       categories, fingerprint):
+                self.logger.info(f"Work queue filled with {len(dataset) * len(categories)} tasks")
+        elif queued_fingerprint != fingerprint:
+            raise ValueError("The work queue holds tasks for other data, categories or model")
+
+        self.logger.info(f"Queue worker {worker_id} started",
+                         extra={'queue_counts': await asyncio.to_thread(queue.counts)})
+        held = set()
+        renewer = asyncio.create_task(self._renew_leases(queue, worker_id, held, settings['lease_seconds']))
+        completed = claimed = 0
+        finished = False
+        try:
+            while True:
+                tasks = await asyncio.to_thread(queue.claim, worker_id,
+                                                max(settings['batch_size'], self.request_limit),
+                                                settings['lease_seconds'])
+                if not tasks:
+                    if not await asyncio.to_thread(queue.has_open_tasks):
+                        break
+                    # Other workers hold the remaining tasks; wait in case their leases run out
+                    await asyncio.sleep(settings['poll_seconds'])
+                    continue
+                held.update(task['task_id'] for task in tasks)
+                claimed += len(tasks)
+                task_examples = self._select_examples([task['title'] for task in tasks],
+                                                      [task['description'] for task in tasks],
+                                                      sorted({task['category'] for task in tasks}))
+                outcomes = await asyncio.gather(*(
+                    self._work_on_task(queue, worker_id, task, template, scheme, examples)
+                    for task, examples in zip(tasks, task_examples)
+                ))
+                held.difference_update(task['task_id'] for task in tasks)
+                completed += sum(outcomes)
+                self.logger.info(f"Queue worker {worker_id}: {completed} tasks completed",
+                                 extra={'queue_counts': await asyncio.to_thread(queue.counts)})
+            finished = True
+        finally:
+            renewer.cancel()
+            # Tasks claimed but not worked on (e.g. after a cancellation) go back to the queue
+            await asyncio.to_thread(queue.release, worker_id)
+            self.completed_tasks, self.total_tasks = completed, claimed
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            worker_name = re.sub(r'[^\w.-]+', '_', worker_id)  # 'host:pid:id' -> 'host_pid_id'
+            base = os.path.join(root_dir, 'data', 'results', f"results_{timestamp}_worker_{worker_name}")
+            os.makedirs(os.path.dirname(base), exist_ok=True)
+            self._write_run_files(started, completed=finished, base=base, worker_id=worker_id, entries=None)
+            self.call_records = []  # Written above; a worker process may run many queues
+        return completed
+
     async def validate_data_consistency(self):
         """Validate consistency between data files"""
         try:
@@ -1226,10 +1904,121 @@ class TrainingDataClassifier:
             print(f"\n❌ Data consistency error: {str(e)}")
             return False
 
-async def main():
+def _shard_arg(value: str) -> str:
+    try:
+        parse_shard(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+    return value.strip()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Command-line options; without a subcommand the pipeline runs with CONFIG and these overrides"""
+    parser = argparse.ArgumentParser(
+        description="Classify course descriptions with the coding scheme.",
+        epilog="Examples:\n"
+               "  python run_pipeline.py --categories all\n"
+               "  python run_pipeline.py --categories all --shard 2/4   # on each of 4 machines\n"
+               "  python run_pipeline.py merge data/results/results_*_shard*of4.xlsx\n"
+               "  python run_pipeline.py --categories all --queue /shared/queue.db   # on any number of machines\n"
+               "  python run_pipeline.py queue /shared/queue.db --export",
+        formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    split = parser.add_mutually_exclusive_group()
+    split.add_argument('--shard', type=_shard_arg,
+                       help="Process only shard i of N (e.g. 2/4); entries are split by a hash of their title")
+    parser.add_argument('--categories',
+                        help="Comma-separated category keys to classify, or 'all' for every selectable category")
+    parser.add_argument('--data', help=f"Input data file (default: {CONFIG['paths']['data_csv']})")
+    parser.add_argument('--endpoints', metavar='FILE',
+                        help="JSON file listing the API endpoints/keys to spread requests over "
+                             "(see utils/endpoint_pool.py)")
+    parser.add_argument('--value-only', action='store_true',
+                        help="Ask only for the value (confidence from logprobs); reasoning in a follow-up call "
+                             "for positive or uncertain results")
+    parser.add_argument('--strip-boilerplate', action='store_true',
+                        help="Remove sentences that most descriptions of a provider share from the prompts")
+    parser.add_argument('--max-description-chars', type=int, metavar='N',
+                        help="Cut longer descriptions at a sentence end before building the prompts")
+    parser.add_argument('--select-examples', type=int, metavar='K',
+                        help="List only the K human-coded examples most similar to the entry per category "
+                             "(besides the anchor examples)")
+    split.add_argument('--queue', metavar='PATH',
+                       help="Work on tasks from a shared work queue (SQLite file) together with other workers")
+    subparsers = parser.add_subparsers(dest='command')
+    merge = subparsers.add_parser('merge', help='Combine the results of shard runs into one results file and run report')
+    merge.add_argument('files', nargs='+', help='Results files of the shard runs (or any file written next to them)')
+    merge.add_argument('--output', help='Merged results file (default: data/results/results_<timestamp>_merged.xlsx)')
+    merge.add_argument('--allow-incomplete', action='store_true',
+                       help='Write the merged files even if shards or tasks are missing or duplicated')
+    queue = subparsers.add_parser('queue', help='Show the progress of a work queue and export its results')
+    queue.add_argument('path', help='Work queue file')
+    queue.add_argument('--export', action='store_true', help='Save the completed results as a results file')
+    return parser.parse_args(argv)
+
+
+def queue_status(args: argparse.Namespace) -> int:
+    """The `queue` subcommand; returns 1 while tasks are still open or some failed"""
+    queue = open_work_queue(args.path)
+    counts = queue.counts()
+    print(f"Tasks: {sum(counts.values())} ({', '.join(f'{n} {state}' for state, n in counts.items())})")
+    for failure in queue.failures()[:20]:
+        print(f"   failed: {failure['title']} / {failure['category']} after {failure['attempts']} attempts: "
+              f"{failure['error']}")
+    if args.export:
+        results = [ProcessingResult(**result) for result in queue.results()]
+        path = asyncio.run(ResultsManager().save_results(results, CONFIG['paths']['output_base'], suffix='_queue'))
+        if counts['pending'] or counts['leased']:
+            print("⚠️ Tasks are still open; the results file is incomplete")
+        print(f"Results saved to: {path}")
+    return 1 if counts['pending'] or counts['leased'] or counts['failed'] else 0
+
+
+def merge_shard_results(args: argparse.Namespace) -> int:
+    """The `merge` subcommand; returns the exit status"""
+    from utils.sharding import merge_shards
+
+    output = args.output or os.path.join(
+        root_dir, CONFIG['paths']['output_dir'], f"results_{datetime.now().strftime('%Y%m%d_%H%M%S')}_merged.xlsx"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    check = merge_shards(args.files, output, CONFIG['gpt']['prices'], allow_incomplete=args.allow_incomplete)
+    print(f"Shards: {check['shards_present']} of {check['shards']}")
+    print(f"Tasks with results: {check['tasks_present']} of {check['tasks_expected']}")
+    for problem in check['problems']:
+        print(f"⚠️ {problem}")
+    for example in check['missing_task_examples']:
+        print(f"   missing: {example['title']} / {example['category']}")
+    for title in check['duplicated_title_examples']:
+        print(f"   duplicated: {title}")
+    if check['output']:
+        print(f"Merged results saved to: {check['output']}")
+    else:
+        print("Nothing written; pass --allow-incomplete to merge anyway")
+    return 1 if check['problems'] else 0
+
+
+async def main(args: Optional[argparse.Namespace] = None):
     """Main entry point for the classification pipeline"""
-    # Check for API key before proceeding
-    if not os.getenv("OPENAI_API_KEY"):
+    args = args if args is not None else parse_args([])
+    if args.data:
+        CONFIG['paths']['data_csv'] = args.data
+    if args.shard:
+        CONFIG['shard'] = args.shard
+    if args.endpoints:
+        CONFIG['gpt']['endpoints'] = load_endpoints(args.endpoints)
+    if args.value_only:
+        CONFIG['gpt']['value_only']['enabled'] = True
+    if args.strip_boilerplate:
+        CONFIG['preprocessing']['strip_boilerplate'] = True
+    if args.max_description_chars:
+        CONFIG['preprocessing']['max_description_chars'] = args.max_description_chars
+    if args.select_examples is not None:
+        CONFIG['examples'].update(enabled=True, top_k=args.select_examples)
+    print_environment_debug()
+    
+    # Check for API key before proceeding (configured endpoints name their own keys)
+    if not os.getenv("OPENAI_API_KEY") and not CONFIG['gpt'].get('endpoints'):
         print("Error: OPENAI_API_KEY environment variable is not set. Please check your .env file.")
         sys.exit(1)
         
@@ -1241,6 +2030,9 @@ async def main():
     
     # Create run-specific log file with rotation
     log_file = os.path.join(CONFIG['paths']['log_dir'], f'pipeline_run_{timestamp}.log')
+    trace_file = None
+    if CONFIG['logging']['payloads'].get('trace_file'):
+        trace_file = os.path.join(CONFIG['paths']['log_dir'], f'pipeline_trace_{timestamp}.jsonl.gz')
     
     # Setup logging with custom formatting and rotation
     formatter = logging.Formatter(
@@ -1248,30 +2040,15 @@ async def main():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     
-    # File handler with rotation
-    file_handler = RotatingFileHandler(
+    # File and console output are written by a background thread
+    setup_async_logging(
         log_file,
-        maxBytes=CONFIG['logging']['max_bytes'],
-        backupCount=CONFIG['logging']['backup_count'],
-        encoding='utf-8'
+        formatter,
+        level=getattr(logging, CONFIG['logging']['level']),
+        max_bytes=CONFIG['logging']['max_bytes'],
+        backup_count=CONFIG['logging']['backup_count'],
+        trace_file=trace_file
     )
-    file_handler.setFormatter(formatter)
-    
-    # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    
-    # Setup root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(getattr(logging, CONFIG['logging']['level']))
-    
-    # Remove any existing handlers
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-    
-    # Add our handlers
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
     
     # Get our specific logger
     logger = logging.getLogger('pipeline_run')
@@ -1311,9 +2088,21 @@ async def main():
             logger.error("Missing required files", extra={'missing_files': missing_files})
             return
         
+        if args.categories == 'all':
+            artifact = load_compiled_scheme(CONFIG['paths']['coding_scheme'])
+            CONFIG['selected_categories'] = [
+                key for key in artifact['order'] if artifact['categories'][key]['selectable']
+            ]
+        elif args.categories:
+            CONFIG['selected_categories'] = [key.strip() for key in args.categories.split(',') if key.strip()]
+        
         # Create and run classifier
         classifier = TrainingDataClassifier(CONFIG)
-        await classifier.run()
+        if args.queue:
+            completed = await classifier.run_queue_worker(open_work_queue(args.queue))
+            logger.info(f"Queue worker finished after completing {completed} tasks")
+        else:
+            await classifier.run()
         
         logger.info("Pipeline Run Completed", extra={'timestamp': datetime.now().isoformat()})
         
@@ -1327,4 +2116,9 @@ async def main():
         logger.info("Run finished", extra={'timestamp': datetime.now().isoformat()})
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    cli_args = parse_args()
+    if cli_args.command == 'merge':
+        sys.exit(merge_shard_results(cli_args))
+    if cli_args.command == 'queue':
+        sys.exit(queue_status(cli_args))
+    asyncio.run(main(cli_args))
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput benchmark of the classification pipeline.
+
+Runs TrainingDataClassifier.run against the local mock chat-completions
+server (scripts/mock_openai_server.py), so no network access or API key is
+needed. Each combination of dataset size and category count runs in a
+fresh interpreter, which keeps peak RSS figures comparable.
+
+Reported per run:
+- tasks/s over the whole run (including data and scheme loading)
+- task latency percentiles (prompt build, API call incl. retries, validation)
+- peak RSS of the pipeline process
+- retries: extra requests seen by the server (client and pipeline retries)
+  and the pipeline's own retry attempts
+
+Run from project root:
+    python scripts/benchmark_pipeline.py
+    python scripts/benchmark_pipeline.py --entries 50,200 --categories 1,10 --latency lognormal:200:0.5 --json
+    python scripts/benchmark_pipeline.py --rate-429 0.05 --malformed-rate 0.02 --output bench.json
+    python scripts/benchmark_pipeline.py --min-tasks-per-s 20   # exit 1 below this throughput
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Project root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from scripts.mock_openai_server import MockOpenAIServer  # noqa: E402
+
+SCHEME_PATH = os.path.join(ROOT, 'data', 'DOC_coding_scheme', 'coding_scheme_imported.yml')
+PROMPT_PATH = os.path.join(ROOT, 'data', 'prompt.txt')
+
+PERCENTILES = (50, 90, 95, 99)
+
+RESULT_MARKER = 'BENCHMARK_RESULT '
+
+
+def percentile(values, p: float) -> float:
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(p / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def write_dataset(path: str, entries: int, seed: int):
+    """Synthetic training data CSV (see scripts/generate_sample_data.py)"""
+    import numpy as np
+    from scripts.generate_sample_data import synthetic_courses
+
+    courses, _ = synthetic_courses(entries, 0.0, np.random.default_rng(seed))
+    courses.to_csv(path, index=False)
+
+
+def selectable_categories(count: int):
+    """First `count` selectable categories of the sample scheme, in display order"""
+    from utils.scheme_compiler import load_compiled_scheme
+
+    artifact = load_compiled_scheme(SCHEME_PATH)
+    keys = [key for key in artifact['order'] if artifact['categories'][key]['selectable']]
+    if count > len(keys):
+        raise ValueError(f"The scheme has only {len(keys)} selectable categories")
+    return keys[:count]
+
+
+def run_worker(spec: dict) -> dict:
+    """Run the pipeline once in this process and measure it (called in a fresh interpreter)"""
+    import asyncio
+    import contextlib
+    import copy
+    import logging
+    import resource
+
+    from run_pipeline import CONFIG, TrainingDataClassifier
+
+    class RetryCounter(logging.Handler):
+        def __init__(self):
+            super().__init__(logging.WARNING)
+            self.count = 0
+
+        def emit(self, record):
+            if record.getMessage().startswith('Attempt '):
+                self.count += 1
+
+    # Pipeline log output is not part of the benchmark; only pipeline retries are counted
+    logging.getLogger().addHandler(logging.NullHandler())
+    retries = RetryCounter()
+    logging.getLogger('gpt_agent').addHandler(retries)
+
+    task_latencies = []
+    last_mark = [time.perf_counter()]
+
+    def status_callback(entry_num, total_entries, category, progress, completed_tasks=0, total_tasks=0):
+        # Tasks run one after another, so a task took the time since the previous report
+        now = time.perf_counter()
+        if category:
+            task_latencies.append(now - last_mark[0])
+        last_mark[0] = now
+
+    config = copy.deepcopy(CONFIG)
+    config['paths']['human_codes'] = None
+    config['temp_files'] = {
+        'data_csv': spec['dataset'],
+        'coding_scheme': SCHEME_PATH,
+        'prompt_template': PROMPT_PATH,
+    }
+    config['selected_categories'] = spec['categories']
+    config['logging']['payloads'] = {'mode': 'off'}
+    config['status_callback'] = status_callback
+
+    classifier = TrainingDataClassifier(config)
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        completed = asyncio.run(classifier.run())
+    elapsed = time.perf_counter() - start
+    if classifier.output_path:
+        # Benchmark results and their run reports are not kept
+        base = os.path.splitext(classifier.output_path)[0]
+        for path in (classifier.output_path, f'{base}_metrics.json', f'{base}_report.json', f'{base}_calls.csv'):
+            if os.path.exists(path):
+                os.remove(path)
+
+    return {
+        'completed': bool(completed),
+        'tasks': classifier.completed_tasks,
+        'wall_seconds': round(elapsed, 3),
+        'tasks_per_s': round(classifier.completed_tasks / elapsed, 2) if elapsed > 0 else 0.0,
+        'task_latency_ms': {
+            **{f"p{p}": round(percentile(task_latencies, p) * 1000, 1) for p in PERCENTILES},
+            'max': round(max(task_latencies, default=0.0) * 1000, 1),
+        },
+        # ru_maxrss is in kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                             / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1),
+        'pipeline_retries': retries.count,
+    }
+
+
+def run_case(server: MockOpenAIServer, dataset: str, entries: int, categories: list) -> dict:
+    """Run one benchmark case in a fresh interpreter against the running mock server"""
+    server.reset_stats()
+    spec = {'dataset': dataset, 'categories': categories}
+    env = dict(os.environ, OPENAI_BASE_URL=server.base_url, OPENAI_API_KEY='mock-benchmark')
+    result = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(spec)],
+        capture_output=True, text=True, cwd=ROOT, env=env
+    )
+    line = next((l for l in result.stderr.splitlines() if l.startswith(RESULT_MARKER)), None)
+    if result.returncode != 0 or line is None:
+        raise RuntimeError(f"Benchmark run failed:\n{result.stderr}")
+    measured = json.loads(line[len(RESULT_MARKER):])
+    server_stats = server.stats()
+    return {
+        'entries': entries,
+        'categories': len(categories),
+        **measured,
+        'retries': max(server_stats['requests'] - measured['tasks'], 0),
+        'server': server_stats,
+    }
+
+
+def parse_sizes(value: str):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=parse_sizes, default=[20, 100], help='Dataset sizes, comma-separated')
+    parser.add_argument('--categories', type=parse_sizes, default=[1, 5], help='Category counts, comma-separated')
+    parser.add_argument('--latency', default='fixed:5',
+                        help="Mock latency: fixed:MS, uniform:MIN:MAX, lognormal:MEDIAN:SIGMA or exponential:MEAN")
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='Fraction of requests answered with 5xx')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Fraction of completions with malformed JSON')
+    parser.add_argument('--rpm-limit', type=int, default=10000, help='Mock requests-per-minute limit')
+    parser.add_argument('--tpm-limit', type=int, default=2000000, help='Mock tokens-per-minute limit')
+    parser.add_argument('--enforce-limits', action='store_true', help='Mock answers requests over the limits with 429')
+    parser.add_argument('--seed', type=int, default=42, help='Seed for the dataset and the mock server')
+    parser.add_argument('--min-tasks-per-s', type=float, default=None,
+                        help='Exit with status 1 if any run is slower than this')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    parser.add_argument('--output', help='Also write the JSON results to this file')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_worker(json.loads(args.worker))
+        sys.stderr.write('\n' + RESULT_MARKER + json.dumps(result) + '\n')
+        return 0
+
+    server = MockOpenAIServer(
+        latency=args.latency, rate_429=args.rate_429, rate_5xx=args.rate_5xx,
+        malformed_rate=args.malformed_rate, rpm_limit=args.rpm_limit, tpm_limit=args.tpm_limit,
+        enforce_limits=args.enforce_limits, seed=args.seed
+    ).start()
+    runs = []
+    try:
+        with tempfile.TemporaryDirectory(prefix='pipeline_benchmark_') as tmp:
+            for entries in args.entries:
+                dataset = os.path.join(tmp, f'training_data_{entries}.csv')
+                write_dataset(dataset, entries, args.seed)
+                for count in args.categories:
+                    runs.append(run_case(server, dataset, entries, selectable_categories(count)))
+    finally:
+        server.stop()
+
+    failed = args.min_tasks_per_s is not None and any(r['tasks_per_s'] < args.min_tasks_per_s for r in runs)
+    report = {
+        'mock': {
+            'latency': args.latency,
+            'rate_429': args.rate_429,
+            'rate_5xx': args.rate_5xx,
+            'malformed_rate': args.malformed_rate,
+            'rpm_limit': args.rpm_limit,
+            'tpm_limit': args.tpm_limit,
+            'enforce_limits': args.enforce_limits,
+            'seed': args.seed,
+        },
+        'min_tasks_per_s': args.min_tasks_per_s,
+        'ok': not failed,
+        'runs': runs,
+    }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print("=== Pipeline benchmark ===\n")
+        for r in runs:
+            latency = r['task_latency_ms']
+            print(f"  {r['entries']:>6} entries x {r['categories']:>3} categories: "
+                  f"{r['tasks_per_s']:>8.1f} tasks/s  p50 {latency['p50']:.0f} ms  p99 {latency['p99']:.0f} ms  "
+                  f"RSS {r['peak_rss_mb']:.0f} MB  retries {r['retries']}")
+        if failed:
+            print(f"\n  ✗ Throughput below {args.min_tasks_per_s} tasks/s")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
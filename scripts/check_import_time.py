@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Measure import time of the pipeline entry points and fail if a budget is exceeded.
+
+Each module is imported in a fresh interpreter several times; the median
+import time is compared with its budget. Heavy dependencies that must only
+be loaded by the stage that needs them are reported as well.
+
+Run from project root:
+    python scripts/check_import_time.py
+    python scripts/check_import_time.py --runs 7 --budget run_pipeline=300
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# Project root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import-time budgets in milliseconds (median of fresh interpreter runs)
+IMPORT_BUDGETS_MS = {
+    'run_pipeline': 300,
+    'web_interface.app': 500,
+}
+
+# Modules that must not be loaded just by importing the entry points
+LAZY_MODULES = ['pandas', 'sklearn', 'docx', 'openai']
+
+MEASURE_SNIPPET = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+loaded = sorted(m for m in {lazy!r} if m in sys.modules)
+sys.stderr.write('\\nIMPORT_TIME_RESULT ' + json.dumps({{'seconds': elapsed, 'loaded': loaded}}) + '\\n')
+"""
+
+
+def measure(module: str, runs: int) -> dict:
+    """Import a module in fresh interpreters and return timing and loaded heavy modules"""
+    timings = []
+    loaded = []
+    code = MEASURE_SNIPPET.format(root=ROOT, module=module, lazy=LAZY_MODULES)
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', code],
+            capture_output=True, text=True, cwd=ROOT, timeout=120
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"Importing {module} failed:\n{result.stderr}")
+        line = next(l for l in result.stderr.splitlines() if l.startswith('IMPORT_TIME_RESULT '))
+        data = json.loads(line.split(' ', 1)[1])
+        timings.append(data['seconds'] * 1000)
+        loaded = data['loaded']
+    return {
+        'median_ms': statistics.median(timings),
+        'min_ms': min(timings),
+        'loaded_heavy_modules': loaded
+    }
+
+
+def parse_budgets(values) -> dict:
+    budgets = dict(IMPORT_BUDGETS_MS)
+    for value in values or []:
+        module, _, budget = value.partition('=')
+        budgets[module] = float(budget)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Fresh interpreter runs per module')
+    parser.add_argument('--budget', action='append', metavar='MODULE=MS',
+                        help='Override the budget of a module (repeatable)')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    budgets = parse_budgets(args.budget)
+    results = {}
+    failed = False
+
+    # Warm up the bytecode cache so the first run isn't an outlier
+    measure('run_pipeline', 1)
+
+    for module, budget in budgets.items():
+        stats = measure(module, args.runs)
+        stats['budget_ms'] = budget
+        stats['ok'] = stats['median_ms'] <= budget and not stats['loaded_heavy_modules']
+        failed = failed or not stats['ok']
+        results[module] = stats
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print("=== Import time ===\n")
+        for module, stats in results.items():
+            status = "✓" if stats['ok'] else "✗"
+            print(f"  {status} {module}: {stats['median_ms']:.0f} ms (budget {stats['budget_ms']:.0f} ms)")
+            if stats['loaded_heavy_modules']:
+                print(f"      eagerly loaded: {', '.join(stats['loaded_heavy_modules'])}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,30 @@
 #!/usr/bin/env python3
 """
-Generate sample training data (Excel format) for researchers to try the pipeline.
-Run from project root: python scripts/generate_sample_data.py
+Generate sample training data (Excel format) for researchers to try the pipeline,
+and reproducible synthetic datasets for load-testing it.
+
+Without --rows, the one-course sample data/training_data_sample.xlsx is written.
+
+With --rows N, a seeded synthetic dataset is written to --output-dir:
+- training_data.<format>: N course descriptions (title, description, provider)
+  with a long-tailed length distribution, provider boilerplate and planted
+  exact and near duplicates
+- human_codes.<format>:   human codes (one row per unique title) for the first
+  --coded-categories categories, consistent with the derived categories
+- coding_scheme.yml:      synthetic coding scheme with --categories categories,
+  including _DERIVED_ area categories (any_in_range) and provider-dependent
+  categories (equals)
+- duplicates.csv:         planted duplicates (row, duplicate_of, kind)
+- manifest.json:          parameters and summary statistics
+
+The same seed always produces the same files.
+
+Run from project root:
+    python scripts/generate_sample_data.py
+    python scripts/generate_sample_data.py --rows 100000 --categories 300 --formats csv,parquet --seed 7
 """
+import argparse
+import json
 import os
 import sys
 
@@ -11,7 +33,9 @@ project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
 try:
+    import numpy as np
     import pandas as pd
+    import yaml
 except ImportError:
     print("Error: pandas is required. Run: pip install -r requirements.txt")
     sys.exit(1)
@@ -35,11 +59,81 @@ SAMPLE_DATA = [
     },
 ]
 
+OUTPUT_FORMATS = ('xlsx', 'csv', 'parquet')
 
-def main():
-    output_dir = os.path.join(project_root, "data")
-    os.makedirs(output_dir, exist_ok=True)
+# Rows per worksheet in Excel (one row is the header)
+EXCEL_MAX_ROWS = 1048575
+
+TOPICS = [
+    "digitale Lehre", "Moodle", "E-Prüfungen", "Lernvideos", "Künstliche Intelligenz", "Feedback",
+    "Gruppenarbeit", "Hochschuldidaktik", "Barrierefreiheit", "Zeitmanagement", "Konfliktmanagement",
+    "Präsentationstechniken", "Stimmtraining", "Forschendes Lernen", "Inverted Classroom", "Lehrportfolio",
+    "Prüfungsrecht", "kompetenzorientiertes Prüfen", "Lernplattformen", "Open Educational Resources",
+    "Videokonferenzen", "Urheberrecht in der Lehre", "Diversität", "Studierendenberatung", "Lernziele",
+    "aktivierende Methoden", "Blended Learning", "Lehrevaluation", "Gamification", "Peer Review",
+    "wissenschaftliches Schreiben", "Lehrforschung", "Datenschutz", "Online-Kollaboration", "E-Portfolios",
+    "Audience Response Systeme", "Screencasts", "Lerntagebücher", "Prompt Engineering", "Learning Analytics",
+]
+
+TITLE_TEMPLATES = [
+    "{Topic} in der Hochschullehre", "Einführung in {topic}", "Workshop: {Topic}", "{Topic} kompakt",
+    "Praxisseminar {topic}", "{Topic} für Lehrende", "Online-Kurs: {Topic}", "{Topic} und {topic2}",
+    "Grundlagen: {Topic}", "{Topic} – Vertiefung", "Selbstlernkurs {topic}", "Fit für {topic}",
+]
+
+SENTENCES = [
+    "In diesem Workshop lernen die Teilnehmenden, wie sie {topic} gezielt in ihrer Lehre einsetzen können.",
+    "Die Veranstaltung gibt einen Überblick über aktuelle Ansätze zu {topic}.",
+    "Anhand von Praxisbeispielen wird gezeigt, wie {topic} die Lernprozesse der Studierenden unterstützt.",
+    "Sie reflektieren Ihre eigene Lehrpraxis im Hinblick auf {topic}.",
+    "Im Mittelpunkt stehen konkrete Methoden und Werkzeuge rund um {topic}.",
+    "Nach einer kurzen Einführung erproben die Teilnehmenden {topic} in Kleingruppen.",
+    "Der Kurs richtet sich an Lehrende aller Fachrichtungen, die sich mit {topic} beschäftigen möchten.",
+    "Gemeinsam entwickeln wir Ideen, wie {topic} in bestehende Lehrveranstaltungen integriert werden kann.",
+    "Rechtliche und organisatorische Rahmenbedingungen von {topic} werden ebenfalls thematisiert.",
+    "Zwischen den Präsenzterminen bearbeiten die Teilnehmenden eine Praxisaufgabe zu {topic}.",
+    "Die Teilnehmenden erhalten Feedback zu ihren eigenen Konzepten für {topic}.",
+    "Vorkenntnisse zu {topic} sind nicht erforderlich.",
+    "Es werden sowohl Chancen als auch Grenzen von {topic} diskutiert.",
+    "Zum Abschluss entwickeln alle einen Umsetzungsplan für {topic} in ihrer eigenen Lehrveranstaltung.",
+    "Die Inhalte orientieren sich an aktuellen Erkenntnissen der Forschung zu {topic}.",
+    "Materialien zu {topic} stehen im Anschluss auf der Lernplattform zur Verfügung.",
+]
+
+# Provider name, course code prefix, "Anbieter" code (1 = Hochschule, 2 = extern), share of all courses
+# and boilerplate appended to most of its descriptions
+PROVIDERS = [
+    ("ProfiLehrePlus Universität", "PLP", 1, 0.30,
+     "Die Veranstaltung ist im Rahmen des Zertifikats Hochschullehre anrechenbar. Anmeldung über das Portal."),
+    ("Zentrum für Hochschuldidaktik (DIZ)", "DIZ", 2, 0.25,
+     "Für Lehrende an bayerischen Hochschulen ist die Teilnahme kostenfrei. Bitte melden Sie sich online an."),
+    ("BayLern", "BL", 2, 0.15,
+     "Weitere Informationen und Termine finden Sie auf unserer Webseite. Die Plätze sind begrenzt."),
+    ("Hochschule für angewandte Wissenschaften", "HAW", 1, 0.20,
+     "Die Teilnahmebestätigung wird nach vollständiger Teilnahme ausgestellt."),
+    ("Virtuelle Hochschule Bayern (vhb)", "VHB", 2, 0.10,
+     "Der Kurs wird vollständig online angeboten und kann zeitlich flexibel bearbeitet werden."),
+]
 
+BOILERPLATE_RATE = 0.8
+
+AREAS = [
+    "Berufliches Engagement", "Digitale Ressourcen", "Lehren und Lernen", "Evaluation", "Lernendenorientierung",
+    "Förderung der digitalen Kompetenz", "Prüfen und Bewerten", "Kommunikation", "Organisation der Lehre",
+    "Hochschulentwicklung", "Beratung", "Forschung",
+]
+
+BINARY_VALUES = "Ja (1), Nein (0)"
+ENUMERATED_VALUES = "Nicht thematisiert (0), Randthema (1), Schwerpunkt (2); -99"
+OPEN_VALUES = "Offen; -99"
+
+# Area children per area and areas per section of the synthetic scheme
+ITEMS_PER_AREA = 8
+AREAS_PER_SECTION = 6
+
+
+def write_sample(output_dir: str):
+    """One-course sample workbook for trying the pipeline"""
     df = pd.DataFrame(SAMPLE_DATA)
     xlsx_path = os.path.join(output_dir, "training_data_sample.xlsx")
     df.to_excel(xlsx_path, index=False)
@@ -47,5 +141,290 @@ def main():
     print("Copy to data/training_data.xlsx to use as default, or upload via the web interface.")
 
 
+def _slug(text: str) -> str:
+    return ''.join(c if c.isalnum() else '_' for c in text).strip('_').replace('__', '_')
+
+
+def synthetic_scheme(categories: int, rng) -> dict:
+    """
+    Coding scheme with `categories` categories in the layout of coding_scheme_imported.yml
+
+    Section 1 holds the provider categories (two of them derived by an equals
+    condition on "Anbieter"); sections 2+ are split into areas, each with a
+    _DERIVED_ area category that is 1 if any of its items is 1.
+    """
+    scheme = {
+        "Anbieter": {
+            "display_name": "1.0.1 Anbieter",
+            "criteria": "1: Hochschulen und ihre Einrichtungen 2: externe Einrichtungen der Lehrendenfortbildung",
+            "examples": [],
+            "values": "Hochschule (1), externer Anbieter (2)",
+        },
+        "Format": {
+            "display_name": "1.0.2 Format",
+            "criteria": "Durchführungsform der Veranstaltung",
+            "examples": ["„findet im Videokonferenzraum statt“ = Online (2)"],
+            "values": "Präsenz (1), Online (2), Hybrid (3); -99",
+        },
+        "_DERIVED_Hochschulart": {
+            "display_name": "1.0.3 Hochschulart",
+            "criteria": "Art der anbietenden Hochschule",
+            "examples": [],
+            "values": "Wenn „1.0.1 Anbieter“ = 1; sonst -99\nUniversität (1); Hochschule für angewandte Wissenschaften (2)",
+            "condition": {"type": "equals", "reference": "„1.0.1 anbieter“", "value": "1"},
+        },
+        "_DERIVED_Externer_Anbieter_Name": {
+            "display_name": "1.0.4 Externer Anbieter Name",
+            "criteria": "Name der externen Einrichtung",
+            "examples": ["z.B. DIZ, BayLern, vhb"],
+            "values": "Wenn „Anbieter“ = 2\nOffen; -99",
+            "condition": {"type": "equals", "reference": "„anbieter“", "value": "2"},
+        },
+    }
+    keys = list(scheme)[:categories]
+    scheme = {key: scheme[key] for key in keys}
+
+    remaining = categories - len(scheme)
+    section, area = 2, 0
+    while remaining > 0:
+        area += 1
+        if area > AREAS_PER_SECTION:
+            section, area = section + 1, 1
+        # An area needs its derived category and at least one item; a single leftover category stands alone
+        items = max(min(ITEMS_PER_AREA, remaining - 1), 0)
+        area_name = AREAS[(section * AREAS_PER_SECTION + area) % len(AREAS)]
+        if items:
+            scheme[f"_DERIVED_{_slug(area_name)}_{section}_{area}"] = {
+                "display_name": f"{section}.{area} {area_name}",
+                "criteria": f"Kriterium: Im Segment wird mindestens eine Kompetenz des Bereichs {area_name} angesprochen",
+                "examples": [],
+                "values": f"Ja (1) wenn min. eine der Kategorien {section}.{area}.1-{section}.{area}.{items} = 1\noder Nein (0)",
+                "condition": {
+                    "type": "any_in_range",
+                    "range_start": f"{section}.{area}.1",
+                    "range_end": f"{section}.{area}.{items}",
+                    "value": "1\noder nein (0)",
+                },
+            }
+            remaining -= 1
+        topics = rng.choice(len(TOPICS), size=max(items, 1), replace=False)
+        for item in range(1, max(items, 1) + 1):
+            topic = TOPICS[int(topics[item - 1])]
+            kind = rng.random()
+            values = BINARY_VALUES if kind < 0.8 else ENUMERATED_VALUES if kind < 0.95 else OPEN_VALUES
+            examples = [SENTENCES[int(i)].format(topic=topic)
+                        for i in rng.choice(len(SENTENCES), size=int(rng.integers(0, 4)), replace=False)]
+            scheme[f"{_slug(topic)}_{section}_{area}_{item}"] = {
+                "display_name": f"{section}.{area}.{item} {topic[0].upper() + topic[1:]} ({area_name})",
+                "criteria": f"Kriterium: Im Segment wird {topic} im Kontext {area_name} angesprochen.",
+                "examples": examples,
+                "values": values,
+            }
+            remaining -= 1
+    return {"coding_scheme": {"version": "1.0", "categories": scheme}}
+
+
+def synthetic_courses(rows: int, duplicate_rate: float, rng):
+    """Training data frame and the planted duplicates (row, duplicate_of, kind)"""
+    originals = rows - int(round(rows * duplicate_rate))
+
+    providers = rng.choice(len(PROVIDERS), size=originals, p=[p[3] for p in PROVIDERS])
+    # Long-tailed description lengths: most courses have a few sentences, some very many
+    sentence_counts = np.clip(np.rint(rng.lognormal(np.log(5), 0.7, originals)), 1, 80).astype(int)
+    main_topics = rng.integers(len(TOPICS), size=originals)
+    second_topics = rng.integers(len(TOPICS), size=originals)
+    title_templates = rng.integers(len(TITLE_TEMPLATES), size=originals)
+    boilerplate = rng.random(originals) < BOILERPLATE_RATE
+
+    # All sentences at once; each description takes the next sentence_counts[i] of them
+    total = int(sentence_counts.sum())
+    sentence_ids = rng.integers(len(SENTENCES), size=total)
+    # Mostly the course's main topic, sometimes another one
+    own_topic = rng.random(total) < 0.7
+    sentence_topics = np.where(own_topic, np.repeat(main_topics, sentence_counts), rng.integers(len(TOPICS), size=total))
+    grid = [[sentence.format(topic=topic) for topic in TOPICS] for sentence in SENTENCES]
+
+    titles, descriptions, provider_names = [], [], []
+    offset = 0
+    for i in range(originals):
+        count = sentence_counts[i]
+        text = ' '.join(grid[s][t] for s, t in zip(sentence_ids[offset:offset + count],
+                                                     sentence_topics[offset:offset + count]))
+        offset += count
+        name, prefix, _, _, footer = PROVIDERS[providers[i]]
+        if boilerplate[i]:
+            text += '\n' + footer
+        topic, topic2 = TOPICS[main_topics[i]], TOPICS[second_topics[i]]
+        title = TITLE_TEMPLATES[title_templates[i]].format(topic=topic, Topic=topic[0].upper() + topic[1:], topic2=topic2)
+        # Catalogue numbers keep titles unique; human codes are merged on the title
+        titles.append(f"{title} ({prefix}-{i + 1:07d})")
+        descriptions.append(text)
+        provider_names.append(name)
+
+    # Planted duplicates: exact copies and near copies (whitespace/case changes) of earlier rows
+    duplicates = []
+    for row in range(originals, rows):
+        source = int(rng.integers(originals))
+        if rng.random() < 0.5:
+            kind, description = 'exact', descriptions[source]
+        else:
+            kind = 'near'
+            description = descriptions[source].replace('. ', '.  ', 1).replace('\n', '\n\n') + ' '
+        titles.append(titles[source])
+        descriptions.append(description)
+        provider_names.append(provider_names[source])
+        duplicates.append((row, source, kind))
+
+    # Duplicates are spread over the file rather than appended at the end
+    order = rng.permutation(rows)
+    position = np.empty(rows, dtype=int)
+    position[order] = np.arange(rows)
+    df = pd.DataFrame({'title': titles, 'description': descriptions, 'provider': provider_names}).iloc[order]
+    df = df.reset_index(drop=True)
+    duplicates = [(int(position[row]), int(position[source]), kind) for row, source, kind in duplicates]
+    return df, sorted(duplicates)
+
+
+def synthetic_human_codes(courses, scheme: dict, coded_categories: int, rng):
+    """Human codes per unique title for the first coded categories, consistent with derived categories"""
+    from utils.scheme_compiler import parse_value_options
+
+    categories = scheme['coding_scheme']['categories']
+    titles = courses.drop_duplicates('title')
+    n = len(titles)
+    external = titles['provider'].map({p[0]: p[2] == 2 for p in PROVIDERS}).to_numpy()
+    keys = list(categories)[:coded_categories or None]
+    codes = {}
+
+    def code(key):
+        if key in codes:
+            return codes[key]
+        details = categories[key]
+        condition = details.get('condition') or {}
+        value_type, options = parse_value_options(details['values'])
+        if key == 'Anbieter':
+            values = np.where(external, '2', '1')
+        elif condition.get('type') == 'any_in_range':
+            prefix = condition['range_start'].rsplit('.', 1)[0] + '.'
+            children = [k for k, d in categories.items()
+                        if d['display_name'].split()[0].startswith(prefix) and not d.get('condition')]
+            child_codes = [code(child) for child in children]
+            values = np.where(np.any([c == '1' for c in child_codes], axis=0), '1', '0')
+        elif condition.get('type') == 'equals':
+            applies = external if condition['value'] == '2' else ~external
+            if value_type == 'open':
+                answer = titles['provider'].to_numpy()
+            else:
+                answer = rng.choice(['1', '2'], size=n)
+            values = np.where(applies, answer, '-99')
+        elif value_type == 'binary':
+            values = np.where(rng.random(n) < rng.uniform(0.05, 0.4), '1', '0')
+        elif value_type == 'enumerated':
+            values = rng.choice([o['code'] for o in options if o['code'] is not None], size=n)
+        else:
+            values = np.full(n, '-99', dtype=object)
+        codes[key] = values
+        return values
+
+    columns = {'title': titles['title'].to_numpy()}
+    for key in keys:
+        columns[f'human_code_{key}'] = code(key)
+    return pd.DataFrame(columns)
+
+
+def write_frame(df, path_base: str, formats) -> list:
+    paths = []
+    for fmt in formats:
+        path = f"{path_base}.{fmt}"
+        if fmt == 'xlsx':
+            df.to_excel(path, index=False)
+        elif fmt == 'csv':
+            df.to_csv(path, index=False)
+        else:
+            df.to_parquet(path, index=False)
+        paths.append(path)
+    return paths
+
+
+def write_synthetic(args):
+    """Write a seeded synthetic dataset, human codes and coding scheme to args.output_dir"""
+    formats = [f.strip() for f in args.formats.split(',') if f.strip()]
+    unknown = [f for f in formats if f not in OUTPUT_FORMATS]
+    if unknown:
+        print(f"Error: unknown format(s) {unknown}, use {', '.join(OUTPUT_FORMATS)}")
+        return 1
+    if 'xlsx' in formats and args.rows > EXCEL_MAX_ROWS:
+        print(f"Error: Excel worksheets hold at most {EXCEL_MAX_ROWS} rows, use csv or parquet")
+        return 1
+    if 'parquet' in formats:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("Error: writing Parquet requires pyarrow. Run: pip install pyarrow")
+            return 1
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    rng = np.random.default_rng(args.seed)
+
+    scheme = synthetic_scheme(args.categories, rng)
+    scheme_path = os.path.join(args.output_dir, 'coding_scheme.yml')
+    with open(scheme_path, 'w', encoding='utf-8') as f:
+        yaml.dump(scheme, f, allow_unicode=True, default_flow_style=False, sort_keys=False,
+                  indent=2, width=1000, default_style='"')
+    print(f"Created {scheme_path} ({args.categories} categories)")
+
+    courses, duplicates = synthetic_courses(args.rows, args.duplicate_rate, rng)
+    files = write_frame(courses, os.path.join(args.output_dir, 'training_data'), formats)
+    print(f"Created {', '.join(files)} ({len(courses)} rows, {len(duplicates)} planted duplicates)")
+
+    duplicates_path = os.path.join(args.output_dir, 'duplicates.csv')
+    pd.DataFrame(duplicates, columns=['row', 'duplicate_of', 'kind']).to_csv(duplicates_path, index=False)
+
+    human_codes = synthetic_human_codes(courses, scheme, args.coded_categories, rng)
+    code_files = write_frame(human_codes, os.path.join(args.output_dir, 'human_codes'), formats)
+    print(f"Created {', '.join(code_files)} ({len(human_codes)} titles, {len(human_codes.columns) - 1} categories)")
+
+    words = courses['description'].str.count(' ') + 1
+    manifest = {
+        'seed': args.seed,
+        'rows': args.rows,
+        'categories': args.categories,
+        'coded_categories': len(human_codes.columns) - 1,
+        'duplicate_rate': args.duplicate_rate,
+        'duplicates': {'exact': sum(1 for d in duplicates if d[2] == 'exact'),
+                       'near': sum(1 for d in duplicates if d[2] == 'near')},
+        'unique_titles': len(human_codes),
+        'description_words': {'p50': float(words.quantile(0.5)), 'p95': float(words.quantile(0.95)),
+                              'max': int(words.max())},
+        'files': [os.path.basename(p) for p in [scheme_path, duplicates_path] + files + code_files],
+    }
+    with open(os.path.join(args.output_dir, 'manifest.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    print(f"Created {os.path.join(args.output_dir, 'manifest.json')}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, help='Write a synthetic dataset with this many course descriptions')
+    parser.add_argument('--categories', type=int, default=200, help='Categories in the synthetic coding scheme')
+    parser.add_argument('--coded-categories', type=int, default=20,
+                        help='Categories with human codes (0 = all)')
+    parser.add_argument('--duplicate-rate', type=float, default=0.05, help='Fraction of rows that are duplicates')
+    parser.add_argument('--formats', default='csv', help=f"Comma-separated output formats ({', '.join(OUTPUT_FORMATS)})")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output-dir', default=os.path.join(project_root, 'data', 'synthetic'))
+    args = parser.parse_args()
+
+    if args.rows is None:
+        output_dir = os.path.join(project_root, "data")
+        os.makedirs(output_dir, exist_ok=True)
+        write_sample(output_dir)
+        return 0
+    if args.categories < 1:
+        parser.error('--categories must be at least 1')
+    return write_synthetic(args)
+
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of the pipeline's CPU-bound functions, with stored baselines.
+
+Covers prompt construction, response validation, the pydantic models,
+result writing, category filtering/sorting and the YAML utilities. Each
+benchmark is measured twice:
+- time:   best per-call time over several calibrated repeats
+- memory: peak traced allocation of a single call (tracemalloc)
+
+Results are compared with benchmarks/micro_baseline.json (or the median of
+the recent runs in benchmarks/micro_history.jsonl) and slowdowns or memory
+growth beyond a threshold are flagged; the exit status is 1 if anything was
+flagged. Every run is appended to the history file. Baselines are machine
+specific: save one on the machine that runs the comparison.
+
+Run from project root:
+    python scripts/microbenchmarks.py
+    python scripts/microbenchmarks.py --filter validate_response --json
+    python scripts/microbenchmarks.py --compare history --threshold 0.15
+    python scripts/microbenchmarks.py --save-baseline
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+# Project root
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCHMARK_DIR = os.path.join(ROOT, 'benchmarks')
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, 'micro_baseline.json')
+HISTORY_FILE = os.path.join(BENCHMARK_DIR, 'micro_history.jsonl')
+
+SCHEME_PATH = os.path.join(ROOT, 'data', 'DOC_coding_scheme', 'coding_scheme_imported.yml')
+PROMPT_PATH = os.path.join(ROOT, 'data', 'prompt.txt')
+
+# Flag a benchmark when it is this much slower / allocates this much more than the reference
+TIME_THRESHOLD = 0.25
+MEMORY_THRESHOLD = 0.10
+# Memory differences below this are noise (bytes)
+MEMORY_NOISE = 1024
+
+# Results written by the save_results benchmark: entries x categories
+RESULT_ENTRIES = 50
+RESULT_CATEGORIES = 10
+
+
+def run_sync(coro):
+    """Run a coroutine that never suspends, without the overhead of an event loop"""
+    try:
+        coro.send(None)
+    except StopIteration as stop:
+        return stop.value
+    coro.close()
+    raise RuntimeError("Benchmarked coroutine suspended; it needs an event loop")
+
+
+def build_benchmarks(workdir: str):
+    """Name -> zero-argument callable; all inputs are prepared here, outside the measurement"""
+    import numpy as np
+    import yaml
+
+    from run_pipeline import (CodingScheme, DataEntry, GPTClassificationInput, ProcessingResult,
+                              ResourceManager, ResponseValidator, ResultsManager, ValidationResult)
+    from scripts.generate_sample_data import SAMPLE_DATA, synthetic_scheme
+    from utils.fix_yaml_format import fix_yaml_format
+    from utils.result_store import ResultStore
+    from utils.scheme_compiler import compile_scheme, filter_categories, get_category_sort_key, load_compiled_scheme
+    from utils.validate_yaml import validate_yaml
+
+    with open(SCHEME_PATH, encoding='utf-8') as f:
+        scheme_data = yaml.safe_load(f)
+    with open(PROMPT_PATH, encoding='utf-8') as f:
+        template = f.read()
+
+    synthetic_path = os.path.join(workdir, 'synthetic_scheme.yml')
+    synthetic_data = synthetic_scheme(300, np.random.default_rng(0))
+    with open(synthetic_path, 'w', encoding='utf-8') as f:
+        yaml.dump(synthetic_data, f, allow_unicode=True, sort_keys=False, width=1000, default_style='"')
+    prefixes = [c['display_name'].split()[0] for c in synthetic_data['coding_scheme']['categories'].values()]
+
+    artifact = load_compiled_scheme(SCHEME_PATH, write=False)
+    scheme = CodingScheme.from_compiled(artifact)
+    category_key = next(key for key in artifact['order'] if artifact['categories'][key]['examples'])
+    entry = DataEntry(title=SAMPLE_DATA[0]['title'], description=SAMPLE_DATA[0]['description'])
+
+    validator = ResponseValidator()
+    quiet = logging.getLogger('microbenchmarks')
+    response = json.dumps({'value': '1', 'confidence': 0.87, 'reasoning': 'Die Beschreibung nennt Moodle-Kurse. ' * 4})
+    fenced = f"```json\n{response}\n```"
+    malformed = response[:len(response) // 2]
+
+    results_manager = ResultsManager()
+    results = [
+        ProcessingResult(title=f"Kurs {e}", description=SAMPLE_DATA[0]['description'], category=key,
+                         ai_code=str(e % 2), confidence=0.8, reasoning='Begründung ' * 10)
+        for e in range(RESULT_ENTRIES) for key in artifact['order'][:RESULT_CATEGORIES]
+    ]
+    result_fields = results[0].model_dump()
+    result_store = ResultStore.from_results(results)
+
+    def save_results():
+        # save_results always writes to data/results; the file is removed again right away
+        with contextlib.redirect_stdout(io.StringIO()):
+            path = run_sync(results_manager.save_results(results, 'unused'))
+        os.remove(path)
+
+    fixed_path = os.path.join(workdir, 'fixed.yml')
+
+    def fix_yaml():
+        with contextlib.redirect_stdout(io.StringIO()):
+            fix_yaml_format(SCHEME_PATH, fixed_path)
+
+    return {
+        'construct_prompt': lambda: run_sync(ResourceManager.construct_prompt(template, entry, scheme, category_key)),
+        'validate_response.json': lambda: validator.validate_response(response, quiet),
+        'validate_response.fenced': lambda: validator.validate_response(fenced, quiet),
+        'validate_response.malformed': lambda: validator.validate_response(malformed, quiet),
+        'models.data_entry': lambda: DataEntry(title=entry.title, description=entry.description),
+        'models.gpt_input': lambda: GPTClassificationInput(prompt=template, model='gpt-4', temperature=0.0),
+        'models.validation_result': lambda: ValidationResult(value='1', confidence=0.8, confidence_level='high',
+                                                             reasoning='Begründung'),
+        'models.processing_result_dump': lambda: ProcessingResult(**result_fields).model_dump(),
+        'models.coding_scheme_validate': lambda: CodingScheme.from_yaml(scheme_data),
+        'models.coding_scheme_from_compiled': lambda: CodingScheme.from_compiled(artifact),
+        'results.build_frame': lambda: results_manager.build_results_frame(results),
+        'results.save_results': save_results,
+        'results.store_append': lambda: ResultStore.from_results(results),
+        'results.store_frame': lambda: results_manager.build_results_frame(result_store),
+        'categories.filter_imported': lambda: filter_categories(scheme_data),
+        'categories.filter_synthetic_300': lambda: filter_categories(synthetic_data),
+        'categories.sort_keys_300': lambda: [get_category_sort_key(p) for p in prefixes],
+        'yaml.fix_format': fix_yaml,
+        'yaml.validate': lambda: validate_yaml(SCHEME_PATH),
+        'yaml.compile_synthetic_300': lambda: compile_scheme(synthetic_path),
+    }
+
+
+def measure_time(fn, repeat: int, min_time: float) -> dict:
+    """Best and median per-call time (seconds) over calibrated repeats"""
+    fn()  # Warm-up (imports, caches)
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 20:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    timings = [elapsed / number]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - start) / number)
+    return {'best_s': min(timings), 'median_s': statistics.median(timings), 'calls': number}
+
+
+def measure_memory(fn) -> dict:
+    """Peak and retained traced allocation of a single call (bytes)"""
+    fn()
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        fn()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'peak_bytes': peak - before, 'retained_bytes': max(after - before, 0)}
+
+
+def load_reference(mode: str, window: int):
+    """Reference results per benchmark from the baseline or the median of recent history"""
+    if mode == 'baseline':
+        if not os.path.exists(BASELINE_FILE):
+            return None
+        with open(BASELINE_FILE, encoding='utf-8') as f:
+            return json.load(f)['benchmarks']
+    if not os.path.exists(HISTORY_FILE):
+        return None
+    with open(HISTORY_FILE, encoding='utf-8') as f:
+        runs = [json.loads(line) for line in f if line.strip()][-window:]
+    reference = {}
+    for name in {name for run in runs for name in run['benchmarks']}:
+        values = [run['benchmarks'][name] for run in runs if name in run['benchmarks']]
+        reference[name] = {
+            'best_s': statistics.median(v['best_s'] for v in values),
+            'peak_bytes': statistics.median(v['peak_bytes'] for v in values),
+        }
+    return reference or None
+
+
+def compare(current: dict, reference: dict, threshold: float, memory_threshold: float) -> dict:
+    """Ratios to the reference and regression flags"""
+    time_ratio = current['best_s'] / reference['best_s'] if reference['best_s'] else None
+    memory_ratio = current['peak_bytes'] / reference['peak_bytes'] if reference['peak_bytes'] else None
+    memory_growth = current['peak_bytes'] - reference['peak_bytes']
+    return {
+        'time_ratio': round(time_ratio, 3) if time_ratio is not None else None,
+        'memory_ratio': round(memory_ratio, 3) if memory_ratio is not None else None,
+        'slower': time_ratio is not None and time_ratio > 1 + threshold,
+        'more_memory': (memory_ratio is not None and memory_ratio > 1 + memory_threshold
+                        and memory_growth > MEMORY_NOISE),
+    }
+
+
+def environment() -> dict:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--filter', help='Only run benchmarks whose name contains this text')
+    parser.add_argument('--repeat', type=int, default=5, help='Timed repeats per benchmark')
+    parser.add_argument('--min-time', type=float, default=0.05, help='Minimum duration of one repeat (seconds)')
+    parser.add_argument('--compare', choices=['baseline', 'history'], default='baseline',
+                        help='Compare with the saved baseline or the median of recent history')
+    parser.add_argument('--history-window', type=int, default=5, help='Recent runs used by --compare history')
+    parser.add_argument('--threshold', type=float, default=TIME_THRESHOLD,
+                        help='Flag benchmarks slower than the reference by more than this fraction')
+    parser.add_argument('--memory-threshold', type=float, default=MEMORY_THRESHOLD,
+                        help='Flag benchmarks allocating more than the reference by more than this fraction')
+    parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+    parser.add_argument('--no-history', action='store_true', help='Do not append this run to the history')
+    parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+    args = parser.parse_args()
+
+    # Keep log output of the benchmarked functions (e.g. validation errors) off the console
+    logging.getLogger().addHandler(logging.NullHandler())
+    logging.getLogger('microbenchmarks').addHandler(logging.NullHandler())
+    logging.getLogger('microbenchmarks').propagate = False
+
+    reference = load_reference(args.compare, args.history_window)
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='microbenchmarks_') as workdir:
+        benchmarks = build_benchmarks(workdir)
+        for name, fn in benchmarks.items():
+            if args.filter and args.filter not in name:
+                continue
+            stats = {**measure_time(fn, args.repeat, args.min_time), **measure_memory(fn)}
+            if reference and name in reference:
+                stats.update(compare(stats, reference[name], args.threshold, args.memory_threshold))
+            results[name] = stats
+
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'environment': environment(),
+        'benchmarks': results,
+    }
+    flagged = sorted(name for name, stats in results.items() if stats.get('slower') or stats.get('more_memory'))
+
+    os.makedirs(BENCHMARK_DIR, exist_ok=True)
+    if not args.no_history:
+        with open(HISTORY_FILE, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(run) + '\n')
+    if args.save_baseline:
+        baseline = {**run, 'benchmarks': {
+            name: {'best_s': stats['best_s'], 'peak_bytes': stats['peak_bytes']} for name, stats in results.items()
+        }}
+        if args.filter and os.path.exists(BASELINE_FILE):
+            # Only the selected benchmarks are replaced
+            with open(BASELINE_FILE, encoding='utf-8') as f:
+                stored = json.load(f)
+            baseline['benchmarks'] = {**stored['benchmarks'], **baseline['benchmarks']}
+        with open(BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write('\n')
+
+    if args.json:
+        print(json.dumps({**run, 'compared_with': args.compare if reference else None, 'flagged': flagged}, indent=2))
+    else:
+        print(f"=== Micro-benchmarks (compared with {args.compare if reference else 'nothing'}) ===\n")
+        for name, stats in results.items():
+            status = "✗" if name in flagged else "✓"
+            line = (f"  {status} {name:<38} {stats['best_s'] * 1e6:>11.1f} µs  "
+                    f"peak {stats['peak_bytes'] / 1024:>9.1f} KiB")
+            if stats.get('time_ratio') is not None:
+                line += f"  time x{stats['time_ratio']:.2f}"
+            if stats.get('memory_ratio') is not None:
+                line += f"  memory x{stats['memory_ratio']:.2f}"
+            print(line)
+        if args.save_baseline:
+            print(f"\n  Baseline saved to {os.path.relpath(BASELINE_FILE, ROOT)}")
+
+    return 1 if flagged else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the OpenAI chat-completions endpoint.
+
+Answers POST /v1/chat/completions with a classification in the JSON format
+the pipeline asks for, after a delay drawn from a configurable latency
+distribution. Failures can be injected at fixed rates:
+- 429 responses with a retry-after header
+- 5xx responses
+- completions whose content is malformed JSON
+
+Requests with `logprobs` get only the value and its token logprobs (the
+pipeline's value-only mode); a request that continues a conversation
+after an assistant message gets a plain-text reasoning. With
+--ms-per-output-token, longer answers take longer, as with the real API.
+Answers longer than the request's max_tokens are cut off there
+(finish_reason 'length').
+
+Every response carries x-ratelimit-* headers computed from a sliding one
+minute window; with --enforce-limits requests over the RPM/TPM limits are
+answered with 429 like the real API. GET /stats returns the request
+counters as JSON, POST /stats/reset clears them.
+
+Used by scripts/benchmark_pipeline.py, or on its own:
+    python scripts/mock_openai_server.py --port 8089 --latency lognormal:300:0.4 --rate-429 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8089/v1 OPENAI_API_KEY=mock python run_pipeline.py
+"""
+import argparse
+import collections
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+# Latency distributions: name -> parameters after the name (in milliseconds, sigma unitless)
+LATENCY_DISTRIBUTIONS = {
+    'fixed': ['ms'],
+    'uniform': ['min_ms', 'max_ms'],
+    'lognormal': ['median_ms', 'sigma'],
+    'exponential': ['mean_ms'],
+}
+
+# Rough token estimate for usage and TPM accounting (characters per token)
+CHARS_PER_TOKEN = 4
+
+
+class LatencyModel:
+    """Draws response delays from a distribution given as 'name:param[:param]'"""
+
+    def __init__(self, spec: str, rng: random.Random):
+        name, *params = spec.split(':')
+        if name not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution '{name}', use one of {list(LATENCY_DISTRIBUTIONS)}")
+        expected = LATENCY_DISTRIBUTIONS[name]
+        if len(params) != len(expected):
+            raise ValueError(f"Latency '{name}' takes {len(expected)} parameter(s): {':'.join([name] + expected)}")
+        self.spec = spec
+        self.name = name
+        self.params = [float(p) for p in params]
+        self.rng = rng
+
+    def sample(self) -> float:
+        """Delay in seconds"""
+        if self.name == 'fixed':
+            ms = self.params[0]
+        elif self.name == 'uniform':
+            ms = self.rng.uniform(*self.params)
+        elif self.name == 'lognormal':
+            median, sigma = self.params
+            ms = self.rng.lognormvariate(math.log(max(median, 1e-3)), sigma)
+        else:
+            ms = self.rng.expovariate(1.0 / max(self.params[0], 1e-3))
+        return max(ms, 0.0) / 1000.0
+
+
+class MockOpenAIServer:
+    """Threaded HTTP server imitating the chat-completions API"""
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: str = 'fixed:0',
+                 rate_429: float = 0.0, rate_5xx: float = 0.0, malformed_rate: float = 0.0,
+                 rpm_limit: int = 10000, tpm_limit: int = 2000000, enforce_limits: bool = False,
+                 positive_rate: float = 0.3, ms_per_output_token: float = 0.0, seed: Optional[int] = None):
+        """
+        Args:
+            host, port: Address to listen on (port 0 picks a free port)
+            latency: Latency distribution spec, e.g. 'fixed:200', 'uniform:100:400',
+                'lognormal:300:0.5' or 'exponential:250'
+            rate_429: Fraction of requests answered with 429
+            rate_5xx: Fraction of requests answered with 500/502/503
+            malformed_rate: Fraction of completions whose content is not valid JSON
+            rpm_limit, tpm_limit: Limits reported in the rate-limit headers
+            enforce_limits: Answer requests over the limits with 429
+            positive_rate: Fraction of classifications with value "1"
+            ms_per_output_token: Delay added per completion token, on top of the latency
+            seed: Seed for latencies, injected failures and answers
+        """
+        self.rng = random.Random(seed)
+        self.latency = LatencyModel(latency, self.rng)
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        self.malformed_rate = malformed_rate
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.enforce_limits = enforce_limits
+        self.positive_rate = positive_rate
+        self.ms_per_output_token = ms_per_output_token
+        self._lock = threading.Lock()
+        self._window = collections.deque()  # (timestamp, tokens) of requests in the last minute
+        self._stats: Dict[str, Any] = {}
+        self.reset_stats()
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {
+                'requests': 0,
+                'ok': 0,
+                'malformed': 0,
+                'rate_limited': 0,
+                'server_errors': 0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'delay_seconds': 0.0,
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+    def _count(self, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+
+    def _rate_limit_state(self, tokens: int):
+        """Record a request in the sliding window; returns (headers, over_limit)"""
+        now = time.monotonic()
+        with self._lock:
+            while self._window and now - self._window[0][0] >= 60.0:
+                self._window.popleft()
+            used_requests = len(self._window)
+            used_tokens = sum(t for _, t in self._window)
+            over_limit = used_requests + 1 > self.rpm_limit or used_tokens + tokens > self.tpm_limit
+            if not (over_limit and self.enforce_limits):
+                self._window.append((now, tokens))
+                used_requests += 1
+                used_tokens += tokens
+            reset = 60.0 - (now - self._window[0][0]) if self._window else 0.0
+        headers = {
+            'x-ratelimit-limit-requests': str(self.rpm_limit),
+            'x-ratelimit-remaining-requests': str(max(self.rpm_limit - used_requests, 0)),
+            'x-ratelimit-reset-requests': f"{reset:.3f}s",
+            'x-ratelimit-limit-tokens': str(self.tpm_limit),
+            'x-ratelimit-remaining-tokens': str(max(self.tpm_limit - used_tokens, 0)),
+            'x-ratelimit-reset-tokens': f"{reset:.3f}s",
+        }
+        return headers, over_limit and self.enforce_limits
+
+    def _draw(self):
+        """Outcome and delay of one request, drawn under the lock so runs are reproducible per seed"""
+        with self._lock:
+            roll = self.rng.random()
+            delay = self.latency.sample()
+            positive = self.rng.random() < self.positive_rate
+            confidence = round(self.rng.uniform(0.55, 0.99), 2)
+        if roll < self.rate_429:
+            outcome = 'rate_limited'
+        elif roll < self.rate_429 + self.rate_5xx:
+            outcome = 'server_error'
+        elif roll < self.rate_429 + self.rate_5xx + self.malformed_rate:
+            outcome = 'malformed'
+        else:
+            outcome = 'ok'
+        return outcome, delay, positive, confidence
+
+    def completion(self, request: Dict[str, Any], positive: bool, confidence: float, malformed: bool):
+        """Chat completion body and its usage"""
+        messages = request.get('messages', [])
+        prompt_chars = sum(len(str(m.get('content', ''))) for m in messages)
+        value = '1' if positive else '0'
+        reasoning = ('Die Beschreibung erfüllt das Kriterium.' if positive
+                     else 'Die Beschreibung enthält keine Hinweise auf das Kriterium.')
+        logprobs = None
+        if len(messages) > 2 and messages[-2].get('role') == 'assistant':
+            answer = reasoning  # Follow-up question about an earlier answer
+        elif request.get('logprobs'):
+            answer = value
+            other = '0' if positive else '1'
+            logprobs = {'content': [{
+                'token': value, 'logprob': math.log(confidence), 'bytes': list(value.encode()),
+                'top_logprobs': [
+                    {'token': value, 'logprob': math.log(confidence), 'bytes': list(value.encode())},
+                    {'token': other, 'logprob': math.log(1 - confidence), 'bytes': list(other.encode())},
+                ][:request.get('top_logprobs') or 0]
+            }]}
+        else:
+            answer = json.dumps({'value': value, 'confidence': confidence, 'reasoning': reasoning},
+                                ensure_ascii=False)
+        if malformed:
+            answer = answer[:len(answer) // 2]
+        finish_reason = 'stop'
+        max_chars = (request.get('max_tokens') or 0) * CHARS_PER_TOKEN
+        if max_chars and len(answer) > max_chars:
+            answer, finish_reason = answer[:max_chars], 'length'
+        usage = {
+            'prompt_tokens': max(prompt_chars // CHARS_PER_TOKEN, 1),
+            'completion_tokens': max(len(answer) // CHARS_PER_TOKEN, 1),
+        }
+        usage['total_tokens'] = usage['prompt_tokens'] + usage['completion_tokens']
+        body = {
+            'id': f"chatcmpl-mock-{uuid.uuid4().hex[:24]}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'mock'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': answer},
+                'logprobs': logprobs,
+                'finish_reason': finish_reason
+            }],
+            'usage': usage,
+            'system_fingerprint': 'mock'
+        }
+        return body, usage
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True  # Headers and body are separate writes
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+            def _send(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+                payload = json.dumps(body, ensure_ascii=False).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _error(self, status: int, message: str, error_type: str, headers=None):
+                self._send(status, {'error': {'message': message, 'type': error_type, 'param': None, 'code': None}},
+                           headers)
+
+            def do_GET(self):
+                if self.path.rstrip('/') == '/stats':
+                    self._send(200, server.stats())
+                else:
+                    self._error(404, f"Unknown path {self.path}", 'invalid_request_error')
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                raw = self.rfile.read(length) if length else b''
+                if self.path.rstrip('/') == '/stats/reset':
+                    server.reset_stats()
+                    self._send(200, {'reset': True})
+                    return
+                if self.path.rstrip('/') != '/v1/chat/completions':
+                    self._error(404, f"Unknown path {self.path}", 'invalid_request_error')
+                    return
+                try:
+                    request = json.loads(raw or b'{}')
+                except json.JSONDecodeError:
+                    self._error(400, 'Request body is not valid JSON', 'invalid_request_error')
+                    return
+
+                outcome, delay, positive, confidence = server._draw()
+                body, usage = server.completion(request, positive, confidence, outcome == 'malformed')
+                headers, over_limit = server._rate_limit_state(usage['total_tokens'])
+                server._count(requests=1)
+
+                if over_limit or outcome == 'rate_limited':
+                    server._count(rate_limited=1)
+                    headers['retry-after'] = '1'
+                    self._error(429, 'Rate limit reached (mock)', 'requests', headers)
+                    return
+                delay += usage['completion_tokens'] * server.ms_per_output_token / 1000.0
+                time.sleep(delay)
+                server._count(delay_seconds=delay)
+                if outcome == 'server_error':
+                    server._count(server_errors=1)
+                    self._error(server.rng.choice([500, 502, 503]), 'Server error (mock)', 'server_error', headers)
+                    return
+                server._count(ok=1, malformed=int(outcome == 'malformed'),
+                              prompt_tokens=usage['prompt_tokens'], completion_tokens=usage['completion_tokens'])
+                self._send(200, body, headers)
+
+        return Handler
+
+    def start(self) -> 'MockOpenAIServer':
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='mock-openai', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', default='lognormal:300:0.4',
+                        help="Latency distribution: fixed:MS, uniform:MIN:MAX, lognormal:MEDIAN:SIGMA or exponential:MEAN")
+    parser.add_argument('--rate-429', type=float, default=0.0, help='Fraction of requests answered with 429')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='Fraction of requests answered with 5xx')
+    parser.add_argument('--malformed-rate', type=float, default=0.0, help='Fraction of completions with malformed JSON')
+    parser.add_argument('--rpm-limit', type=int, default=10000, help='Requests per minute reported in headers')
+    parser.add_argument('--tpm-limit', type=int, default=2000000, help='Tokens per minute reported in headers')
+    parser.add_argument('--enforce-limits', action='store_true', help='Answer requests over the limits with 429')
+    parser.add_argument('--ms-per-output-token', type=float, default=0.0,
+                        help='Delay added per completion token (answers with reasoning take longer)')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(
+        host=args.host, port=args.port, latency=args.latency,
+        rate_429=args.rate_429, rate_5xx=args.rate_5xx, malformed_rate=args.malformed_rate,
+        rpm_limit=args.rpm_limit, tpm_limit=args.tpm_limit, enforce_limits=args.enforce_limits,
+        ms_per_output_token=args.ms_per_output_token, seed=args.seed
+    )
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+        print(json.dumps(server.stats(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
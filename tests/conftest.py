@@ -0,0 +1,9 @@
+"""Shared setup for the unit tests (run from the project root: python -m pytest tests)"""
+
+import os
+import sys
+
+# Project modules are imported as in the scripts: from utils.x import ...
+root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root_dir not in sys.path:
+    sys.path.insert(0, root_dir)
@@ -0,0 +1,148 @@
+"""Grant order of the weighted fair-share scheduler, on a simulated clock"""
+
+import asyncio
+import sqlite3
+import threading
+
+import pytest
+
+from utils import fair_share
+from utils.fair_share import FairShareScheduler, estimate_tokens, resolve_priority
+
+
+class Clock:
+    """Stands in for the time module in utils.fair_share"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(fair_share, 'time', clock)
+    return clock
+
+
+def grants(scheduler, clock, jobs, seconds, tokens=100):
+    """
+    Let every job ask for grants once per simulated second; a job that is
+    granted asks again at once, like a job with more requests queued.
+    Returns the order in which jobs were granted.
+    """
+    order = []
+    for _ in range(seconds):
+        for job in jobs:
+            while scheduler.try_acquire(job, tokens)[0] is not None:
+                order.append(job)
+        clock.now += 1.0
+    return order
+
+
+def test_resolve_priority():
+    assert resolve_priority('auto', 50) == 'interactive'
+    assert resolve_priority(None, 51) == 'batch'
+    assert resolve_priority('normal', 1000) == 'normal'
+    with pytest.raises(ValueError):
+        resolve_priority('urgent', 10)
+
+
+def test_estimate_tokens():
+    assert estimate_tokens('x' * 400, 50) == 150
+
+
+def test_needs_a_budget(tmp_path):
+    with pytest.raises(ValueError):
+        FairShareScheduler(str(tmp_path / 'share.db'))
+
+
+def test_unknown_job_is_refused(tmp_path, clock):
+    scheduler = FairShareScheduler(str(tmp_path / 'share.db'), rpm=60)
+    with pytest.raises(ValueError):
+        scheduler.try_acquire('never joined', 10)
+
+
+def test_grants_are_paced_to_the_budget(tmp_path, clock):
+    scheduler = FairShareScheduler(str(tmp_path / 'share.db'), rpm=60)
+    scheduler.join('job', 'batch')
+    order = grants(scheduler, clock, ['job'], 30)
+    # One request per second, plus the burst allowance at the start
+    assert 30 <= len(order) <= 30 + fair_share.BURST_SECONDS + 1
+    assert scheduler.try_acquire('job', 100)[0] is not None
+    grant_id, wait = scheduler.try_acquire('job', 100)
+    assert grant_id is None and 0 < wait <= fair_share.MAX_WAIT_SECONDS
+
+
+def test_waiting_jobs_share_by_weight(tmp_path, clock):
+    scheduler = FairShareScheduler(str(tmp_path / 'share.db'), rpm=60)
+    scheduler.join('batch', 'batch')
+    scheduler.join('interactive', 'interactive')
+    order = grants(scheduler, clock, ['batch', 'interactive'], 60)
+    # Once both are waiting, interactive (weight 4) gets four grants for each batch (weight 1) grant
+    steady = order[-50:]
+    assert steady.count('interactive') == 40
+    assert steady.count('batch') == 10
+
+
+def test_a_job_alone_gets_the_whole_budget(tmp_path, clock):
+    scheduler = FairShareScheduler(str(tmp_path / 'share.db'), rpm=60)
+    scheduler.join('batch', 'batch')
+    scheduler.join('interactive', 'interactive')
+    # The interactive job never asks, so no share is held back for it
+    assert len(grants(scheduler, clock, ['batch'], 30)) >= 30
+
+
+def test_a_new_job_is_served_right_away(tmp_path, clock):
+    scheduler = FairShareScheduler(str(tmp_path / 'share.db'), rpm=60)
+    scheduler.join('big', 'batch')
+    grants(scheduler, clock, ['big'], 30)
+    # The new job joins at the virtual time of the waiting big job: it does not
+    # have to wait for the big job's earlier grants, and gets no credit for them either
+    scheduler.join('small', 'interactive')
+    order = grants(scheduler, clock, ['big', 'small'], 10)
+    assert 'small' in order[:2]
+    assert order.count('small') == 8
+
+
+def test_settle_corrects_the_token_estimate(tmp_path, clock):
+    scheduler = FairShareScheduler(str(tmp_path / 'share.db'), tpm=6000)
+    scheduler.join('job', 'normal')
+    grant_id, _ = scheduler.try_acquire('job', 1000)
+    scheduler.settle(grant_id, 200)
+    status = scheduler.status()
+    assert status['tokens_last_minute'] == 200
+    assert status['jobs'][0]['tokens'] == 200
+
+
+def test_waiting_for_the_database_lock_does_not_block_the_event_loop(tmp_path):
+    path = str(tmp_path / 'share.db')
+    scheduler = FairShareScheduler(path, rpm=60)
+    share = scheduler.join('job', 'normal')
+
+    # Another job process holds the write lock for a moment
+    other = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    other.execute('BEGIN IMMEDIATE')
+    threading.Timer(0.3, other.execute, ('COMMIT',)).start()
+
+    async def main():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        grant_id = await share.acquire(100)
+        await share.settle(grant_id, 50)
+        ticker.cancel()
+        return grant_id, ticks
+
+    grant_id, ticks = asyncio.run(main())
+    assert grant_id is not None
+    # The loop kept running while acquire() waited for the lock
+    assert ticks >= 10
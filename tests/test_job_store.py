@@ -0,0 +1,56 @@
+"""Metrics snapshots of finished jobs are folded into running totals"""
+
+from utils.metrics import merge_snapshots
+from web_interface.job_store import JobStore
+
+
+def tasks(value):
+    return {'pipeline_tasks_total': {'type': 'counter', 'help': 'Tasks',
+                                     'samples': [{'labels': {'outcome': 'ok'}, 'value': value}]}}
+
+
+def total(snapshots):
+    return merge_snapshots(snapshots)['pipeline_tasks_total']['samples'][0]['value']
+
+
+def running_store(path, *job_ids):
+    store = JobStore(path)
+    for job_id in job_ids:
+        store.create(job_id, {})
+        store.claim_next(max_running=len(job_ids))
+    return store
+
+
+def test_finished_jobs_are_folded_into_one_snapshot(tmp_path):
+    store = running_store(str(tmp_path / 'jobs.db'), 'a', 'b', 'c')
+    for job_id, value in (('a', 2), ('b', 3), ('c', 4)):
+        store.set_metrics(job_id, tasks(value))
+    store.finish('a', 'done')
+    store.finish('b', 'failed', error='boom')
+    snapshots = store.all_metrics()
+    assert len(snapshots) == 2  # Job c and the totals of a and b
+    assert total(snapshots) == 9
+
+    store.finish('c', 'cancelled')
+    assert len(store.all_metrics()) == 1
+    assert total(store.all_metrics()) == 9
+
+
+def test_late_snapshots_of_finished_jobs_are_ignored(tmp_path):
+    store = running_store(str(tmp_path / 'jobs.db'), 'a')
+    store.set_metrics('a', tasks(2))
+    store.finish('a', 'done')
+    store.set_metrics('a', tasks(5))
+    assert total(store.all_metrics()) == 2
+
+
+def test_snapshots_left_by_finished_jobs_are_folded_on_open(tmp_path):
+    path = str(tmp_path / 'jobs.db')
+    store = running_store(path, 'a', 'b')
+    store.set_metrics('a', tasks(2))
+    store.set_metrics('b', tasks(3))
+    # As stored before finish() folded snapshots
+    store._connection().execute("UPDATE jobs SET state = 'done' WHERE job_id = 'a'")
+    snapshots = JobStore(path).all_metrics()
+    assert len(snapshots) == 2
+    assert total(snapshots) == 5
@@ -0,0 +1,90 @@
+"""Columnar result storage and the wide results layout built from it"""
+
+import pandas as pd
+
+from utils.result_store import ResultStore, StoredResult
+
+
+def filled_store():
+    store = ResultStore()
+    store.add('Kurs B', 'Zweite\n  Beschreibung', 'Kursname', '1', 0.9, 'passt')
+    store.add('Kurs A', 'Erste', 'Anbieter', '0', 0.75, '')
+    store.add('Kurs B', 'ignored', 'Anbieter', '1', 0.5, None)
+    return store
+
+
+def test_results_read_back_in_order():
+    store = filled_store()
+    assert len(store) == 3
+    assert list(store) == [
+        StoredResult('Kurs B', 'Zweite\n  Beschreibung', 'Kursname', '1', 0.9, 'passt'),
+        StoredResult('Kurs A', 'Erste', 'Anbieter', '0', 0.75, ''),
+        # The first description stored for a title is kept
+        StoredResult('Kurs B', 'Zweite\n  Beschreibung', 'Anbieter', '1', 0.5, ''),
+    ]
+
+
+def test_strings_are_stored_once():
+    store = filled_store()
+    assert store.titles == ['Kurs B', 'Kurs A']
+    assert store.categories == ['Kursname', 'Anbieter']
+    assert store.values == ['1', '0']
+
+
+def test_frame_layout():
+    frame = filled_store().to_frame()
+    assert list(frame.columns) == ['title', 'description', 'ai_Anbieter', 'ai_Kursname',
+                                   'confidence_Anbieter', 'confidence_Kursname',
+                                   'reasoning_Anbieter', 'reasoning_Kursname']
+    # Entries in order of their first result, descriptions on one line
+    assert frame['title'].tolist() == ['Kurs B', 'Kurs A']
+    assert frame['description'].tolist() == ['Zweite Beschreibung', 'Erste']
+    assert frame['ai_Anbieter'].tolist() == ['1', '0']
+    assert frame['confidence_Anbieter'].tolist() == ['0.50', '0.75']
+    assert frame.loc[0, 'reasoning_Kursname'] == 'passt'
+
+
+def test_tasks_without_a_result_are_empty():
+    frame = filled_store().to_frame()
+    assert pd.isna(frame.loc[1, 'ai_Kursname'])
+    assert pd.isna(frame.loc[1, 'confidence_Kursname'])
+    assert pd.isna(frame.loc[1, 'reasoning_Kursname'])
+
+
+def test_last_result_of_a_task_wins():
+    store = filled_store()
+    store.add('Kurs A', 'Erste', 'Anbieter', '1', 0.6, 'neu')
+    frame = store.to_frame()
+    assert frame.loc[1, 'ai_Anbieter'] == '1'
+    assert frame.loc[1, 'confidence_Anbieter'] == '0.60'
+    assert frame.loc[1, 'reasoning_Anbieter'] == 'neu'
+    # A later result of the same task with an earlier-seen value still wins
+    store.add('Kurs A', 'Erste', 'Anbieter', '0', 0.7, 'wieder alt')
+    assert store.to_frame().loc[1, 'ai_Anbieter'] == '0'
+    assert len(store.to_frame()) == 2
+
+
+def test_values_are_transformed_once_each():
+    calls = []
+
+    def transform(value):
+        calls.append(value)
+        return {'1': 'Ja', '0': 'Nein'}[value]
+
+    frame = filled_store().to_frame(transform)
+    assert frame['ai_Anbieter'].tolist() == ['Ja', 'Nein']
+    assert sorted(calls) == ['0', '1']
+
+
+def test_from_results_accepts_result_objects_and_stores():
+    store = filled_store()
+    assert ResultStore.from_results(store) is store
+    copy = ResultStore.from_results(list(store))
+    assert list(copy) == list(store)
+    assert copy.to_frame().equals(store.to_frame())
+
+
+def test_empty_store():
+    frame = ResultStore().to_frame()
+    assert list(frame.columns) == ['title', 'description']
+    assert len(frame) == 0
@@ -0,0 +1,91 @@
+"""Shard assignment and the completeness checks of a shard merge"""
+
+import pandas as pd
+import pytest
+
+from utils.sharding import check_shards, parse_shard, select_shard, shard_of
+
+CATEGORIES = ['Anbieter', 'Kursname']
+
+
+def manifest(shard, titles, shards=2, dataset='abc', categories=CATEGORIES):
+    return {'shard': shard, 'shards': shards, 'dataset_sha256': dataset, 'categories': list(categories),
+            'titles': list(titles)}
+
+
+def frame(titles, categories=CATEGORIES, missing=()):
+    """Results of the given titles; (title, category) pairs in `missing` have no value"""
+    rows = []
+    for title in titles:
+        row = {'title': title, 'description': ''}
+        for category in categories:
+            row[f'ai_{category}'] = None if (title, category) in missing else '1'
+        rows.append(row)
+    return pd.DataFrame(rows, columns=['title', 'description'] + [f'ai_{category}' for category in categories])
+
+
+def test_parse_shard():
+    assert parse_shard(' 2 / 4 ') == (2, 4)
+    for value in ('0/4', '5/4', '2', ''):
+        with pytest.raises(ValueError):
+            parse_shard(value)
+
+
+def test_shards_partition_the_titles():
+    dataset = pd.DataFrame({'title': [f'Kurs {n}' for n in range(200)] + ['Kurs 7'], 'description': ''})
+    shards = [select_shard(dataset, index, 3) for index in (1, 2, 3)]
+    assert sum(len(shard) for shard in shards) == len(dataset)
+    # Both rows titled 'Kurs 7' land in the same shard
+    assert [len(shard[shard['title'] == 'Kurs 7']) for shard in shards].count(2) == 1
+    assert all(shard_of(title, 3) == index for index, shard in enumerate(shards, 1) for title in shard['title'])
+
+
+def test_complete_shards_have_no_problems():
+    report = check_shards([manifest(1, ['A', 'B']), manifest(2, ['C'])], [frame(['A', 'B']), frame(['C'])])
+    assert report['problems'] == []
+    assert report['tasks_expected'] == report['tasks_present'] == 6
+    assert report['shards_present'] == [1, 2]
+
+
+def test_missing_tasks_are_reported():
+    report = check_shards(
+        [manifest(1, ['A', 'B']), manifest(2, ['C'])],
+        # B has no Kursname value, and C's results lack the title altogether
+        [frame(['A', 'B'], missing={('B', 'Kursname')}), frame([])]
+    )
+    assert report['missing_tasks'] == 3
+    assert report['tasks_present'] == 3
+    assert {(task['title'], task['category']) for task in report['missing_task_examples']} == {
+        ('B', 'Kursname'), ('C', 'Anbieter'), ('C', 'Kursname')}
+    assert "3 of 6 tasks have no result" in report['problems']
+
+
+def test_missing_category_column_is_reported():
+    report = check_shards([manifest(1, ['A'], shards=1)], [frame(['A'], categories=['Anbieter'])])
+    assert report['missing_tasks'] == 1
+    assert report['missing_task_examples'] == [{'title': 'A', 'category': 'Kursname'}]
+
+
+def test_titles_in_several_shards_are_reported():
+    report = check_shards([manifest(1, ['A', 'B']), manifest(2, ['B', 'C'])],
+                          [frame(['A', 'B']), frame(['B', 'C'])])
+    assert report['duplicated_titles'] == 1
+    assert report['duplicated_title_examples'] == ['B']
+    assert "1 titles have results in more than one shard" in report['problems']
+
+
+def test_missing_and_repeated_shards_are_reported():
+    report = check_shards([manifest(1, ['A'], shards=3), manifest(1, ['A'], shards=3)],
+                          [frame(['A']), frame(['A'])])
+    assert report['missing_shards'] == [2, 3]
+    assert "Shards given more than once: [1]" in report['problems']
+    assert "Missing shards: [2, 3]" in report['problems']
+
+
+def test_inconsistent_runs_are_reported():
+    report = check_shards([manifest(1, ['A']), manifest(2, ['B'], shards=3, dataset='def',
+                                                        categories=['Anbieter'])],
+                          [frame(['A']), frame(['B'], categories=['Anbieter'])])
+    assert "Shards were run with different shard counts: [2, 3]" in report['problems']
+    assert "Shards were run on different datasets" in report['problems']
+    assert "Shards were run with different categories" in report['problems']
@@ -0,0 +1,93 @@
+"""Value and confidence from token logprobs, and when a value-only result is explained"""
+
+import math
+
+import pytest
+
+from utils.value_only import (DEFAULT_SETTINGS, needs_explanation, validate_settings, value_codes,
+                              value_from_logprobs)
+
+CODES = ['0', '1']
+
+
+def token(text, probability, alternatives=()):
+    """A token logprob as the API returns it (as dicts)"""
+    return {'token': text, 'logprob': math.log(probability),
+            'top_logprobs': [{'token': alt, 'logprob': math.log(p)} for alt, p in alternatives]}
+
+
+def test_value_codes():
+    assert value_codes('Ja (1), Nein (0), unklar (1)') == ['1', '0']
+    assert value_codes('Ja (1)') is None
+    assert value_codes('Freitext') is None
+    assert value_codes(None) is None
+
+
+def test_value_is_the_most_likely_code():
+    value, confidence = value_from_logprobs([token('1', 0.7, [('1', 0.7), ('0', 0.2), ('x', 0.1)])], CODES)
+    assert value == '1'
+    # Normalised over the allowed codes only
+    assert confidence == pytest.approx(0.7 / 0.9)
+
+
+def test_leading_space_and_quote_tokens_are_skipped():
+    tokens = [token(' ', 0.99), token('"', 0.99), token('0', 0.6, [('0', 0.6), ('1', 0.4)])]
+    assert value_from_logprobs(tokens, CODES) == ('0', pytest.approx(0.6))
+
+
+def test_tokens_that_spell_the_same_code_are_added_up():
+    value, confidence = value_from_logprobs(
+        [token(' 1', 0.5, [(' 1', 0.5), ('1', 0.2), ('"0', 0.3)])], CODES
+    )
+    assert value == '1'
+    assert confidence == pytest.approx(0.7)
+
+
+def test_chosen_token_missing_from_its_alternatives_counts():
+    assert value_from_logprobs([token('1', 0.8, [('0', 0.1)])], CODES) == ('1', pytest.approx(0.8 / 0.9))
+
+
+def test_answer_objects_are_read_like_dicts():
+    class Logprob:
+        def __init__(self, token, logprob, top_logprobs=None):
+            self.token, self.logprob, self.top_logprobs = token, logprob, top_logprobs
+
+    answer = Logprob('0', math.log(0.9), [Logprob('0', math.log(0.9)), Logprob('1', math.log(0.1))])
+    assert value_from_logprobs([answer], CODES) == ('0', pytest.approx(0.9))
+
+
+def test_answer_without_a_code_is_invalid():
+    with pytest.raises(ValueError):
+        value_from_logprobs([token('Ja', 0.9, [('Ja', 0.9), ('Nein', 0.1)])], CODES)
+    with pytest.raises(ValueError):
+        value_from_logprobs([token(' ', 1.0)], CODES)
+    with pytest.raises(ValueError):
+        value_from_logprobs([], CODES)
+
+
+@pytest.mark.parametrize('policy, value, confidence, expected', [
+    ('all', '0', 0.99, True),
+    ('none', '1', 0.5, False),
+    ('positive', '1', 0.99, True),
+    ('positive', '0', 0.5, False),
+    ('uncertain', '0', 0.5, True),
+    ('uncertain', '1', 0.95, False),
+    ('positive_or_uncertain', '1', 0.99, True),
+    ('positive_or_uncertain', '0', 0.5, True),
+    ('positive_or_uncertain', '0', 0.95, False),
+])
+def test_needs_explanation(policy, value, confidence, expected):
+    assert needs_explanation(value, confidence, CODES, {**DEFAULT_SETTINGS, 'explain': policy}) is expected
+
+
+def test_no_positives_without_a_zero_code():
+    settings = {**DEFAULT_SETTINGS, 'explain': 'positive'}
+    assert not needs_explanation('2', 0.99, ['1', '2', '3'], settings)
+
+
+def test_validate_settings():
+    assert validate_settings(None) == DEFAULT_SETTINGS
+    assert validate_settings({'explain': 'none'})['explain'] == 'none'
+    for invalid in ({'explain': 'postive'}, {'uncertain_below': 1.5}, {'uncertain_below': '0.9'}):
+        with pytest.raises(ValueError):
+            validate_settings(invalid)
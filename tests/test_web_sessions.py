@@ -0,0 +1,52 @@
+"""Job ownership across web workers: a session cookie from one app instance is honoured by another"""
+
+import importlib.util
+import os
+import uuid
+
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'web_interface', 'app.py')
+
+
+def load_app(name):
+    """A separate instance of the web app module, as each Gunicorn worker imports its own"""
+    spec = importlib.util.spec_from_file_location(name, APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def workers(tmp_path, monkeypatch):
+    monkeypatch.setenv('FLASK_SECRET_KEY', 'shared test key')
+    monkeypatch.setenv('PIPELINE_JOB_DB', str(tmp_path / 'jobs.db'))
+    return load_app('web_worker_a'), load_app('web_worker_b')
+
+
+def session_client(worker, session_id):
+    client = worker.app.test_client()
+    with client.session_transaction() as session:
+        session['session_id'] = session_id
+    return client
+
+
+def test_job_owner_is_recognised_by_every_worker(workers):
+    worker_a, worker_b = workers
+    job_id = uuid.uuid4().hex
+    worker_a.job_store.create(job_id, {}, owner='owner-session')
+
+    # The cookie is signed by worker A; the next request is served by worker B
+    owner = session_client(worker_a, 'owner-session')
+    cookie = owner.get_cookie('session')
+    on_b = worker_b.app.test_client()
+    on_b.set_cookie(cookie.key, cookie.value)
+    assert on_b.get(f'/pipeline_status/{job_id}').status_code == 200
+    assert on_b.get(f'/pipeline_status/{job_id}').get_json()['job_id'] == job_id
+    assert owner.get(f'/pipeline_status/{job_id}').status_code == 200
+
+    # Another session sees neither the job nor its results, on any worker
+    stranger = session_client(worker_b, 'other-session')
+    assert stranger.get(f'/pipeline_status/{job_id}').status_code == 404
+    assert stranger.get(f'/job_results/{job_id}').status_code == 404
+    assert stranger.post(f'/cancel_pipeline/{job_id}').status_code == 404
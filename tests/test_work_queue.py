@@ -0,0 +1,101 @@
+"""Leases, attempts and idempotent completion of the SQLite work queue"""
+
+import pytest
+
+from utils.work_queue import SQLiteWorkQueue, WorkQueue, open_work_queue
+
+ENTRIES = [('Kurs A', 'Beschreibung A'), ('Kurs B', 'Beschreibung B')]
+CATEGORIES = ['Anbieter', 'Kursname']
+
+
+@pytest.fixture
+def queue(tmp_path):
+    queue = SQLiteWorkQueue(str(tmp_path / 'queue.db'), max_attempts=2)
+    assert queue.populate(ENTRIES, CATEGORIES, 'fp')
+    return queue
+
+
+def test_work_queue_is_abstract():
+    with pytest.raises(TypeError):
+        WorkQueue()
+
+
+def test_populate_once_per_fingerprint(queue):
+    assert not queue.populate(ENTRIES, CATEGORIES, 'fp')
+    with pytest.raises(ValueError):
+        queue.populate(ENTRIES, CATEGORIES, 'other data')
+    assert queue.counts() == {'pending': 4, 'leased': 0, 'done': 0, 'failed': 0}
+
+
+def test_claim_leases_each_task_once(queue):
+    first = queue.claim('w1', 3)
+    second = queue.claim('w2', 3)
+    assert [task['task_id'] for task in first] == [1, 2, 3]
+    assert [task['task_id'] for task in second] == [4]
+    assert first[0]['title'] == 'Kurs A' and first[0]['category'] == 'Anbieter'
+    assert all(task['attempts'] == 1 for task in first + second)
+    assert queue.claim('w3', 3) == []
+    assert queue.counts()['leased'] == 4
+
+
+def test_expired_lease_is_claimed_again(queue):
+    # A negative lease has run out as soon as it is granted, like that of a dead worker
+    stale = queue.claim('dead', 4, lease_seconds=-1)
+    assert queue.counts()['pending'] == 4
+    reclaimed = queue.claim('w2', 4)
+    assert [task['task_id'] for task in reclaimed] == [task['task_id'] for task in stale]
+    assert all(task['attempts'] == 2 for task in reclaimed)
+    # The dead worker's leases are gone, so it cannot renew them
+    assert queue.renew('dead', [1, 2]) == []
+    assert queue.renew('w2', [1, 2]) == [1, 2]
+
+
+def test_task_fails_once_its_leases_use_up_the_attempts(queue):
+    queue.claim('w1', 4, lease_seconds=-1)
+    queue.claim('w2', 4, lease_seconds=-1)
+    # Both attempts are used up: the next claim gives the tasks up instead of leasing them
+    assert queue.counts()['failed'] == 4
+    assert queue.claim('w3', 4) == []
+    assert queue.failures()[0] == {'title': 'Kurs A', 'category': 'Anbieter', 'attempts': 2,
+                                   'error': 'Lease expired after the last attempt'}
+    assert not queue.has_open_tasks()
+
+
+def test_fail_returns_the_task_until_its_attempts_are_used_up(queue):
+    task_id = queue.claim('w1', 1)[0]['task_id']
+    queue.fail('w1', task_id, 'timeout')
+    assert queue.claim('w1', 1)[0]['task_id'] == task_id
+    queue.fail('w1', task_id, 'timeout again')
+    assert queue.counts()['failed'] == 1
+    assert queue.failures()[0]['error'] == 'timeout again'
+
+
+def test_complete_is_idempotent_and_the_first_result_wins(queue):
+    queue.claim('w1', 4, lease_seconds=-1)
+    assert [task['task_id'] for task in queue.claim('w2', 1)] == [1]
+    assert queue.complete('w2', 1, {'ai_code': '1'})
+    # The worker whose lease ran out finishes late; its result is dropped
+    assert not queue.complete('w1', 1, {'ai_code': '0'})
+    assert not queue.complete('w2', 1, {'ai_code': '1'})
+    assert queue.results() == [{'ai_code': '1'}]
+    assert queue.counts()['done'] == 1
+
+
+def test_release_gives_back_the_attempt(queue):
+    claimed = queue.claim('w1', 2)
+    assert queue.release('w1') == 2
+    assert queue.counts()['pending'] == 4
+    assert [task['attempts'] for task in queue.claim('w2', 2)] == [1, 1]
+    assert [task['task_id'] for task in claimed] == [1, 2]
+
+
+def test_has_open_tasks(queue):
+    for task in queue.claim('w1', 4):
+        queue.complete('w1', task['task_id'], {})
+    assert not queue.has_open_tasks()
+
+
+def test_open_work_queue(tmp_path):
+    assert isinstance(open_work_queue(f'sqlite:///{tmp_path / "queue.db"}'), SQLiteWorkQueue)
+    with pytest.raises(ValueError):
+        open_work_queue('redis://localhost/0')
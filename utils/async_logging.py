@@ -0,0 +1,207 @@
+"""
+Low-overhead logging for the classification hot path
+
+Log records are put on a queue by the caller and written to disk by a
+background thread (QueueHandler/QueueListener), so the event loop never
+blocks on file I/O.
+
+Prompt/response payloads are large and mostly uninteresting. They are
+logged through a PayloadLogger which decides per call whether to write
+them:
+- 'all':     every payload is written
+- 'sampled': a random fraction of calls is written; failed calls always are
+- 'errors':  payloads are buffered and only written when the call fails
+- 'off':     payloads are never written
+
+When a trace file is configured, payload records go to a separate
+gzip-compressed JSON-lines file instead of the main log.
+"""
+
+import atexit
+import gzip
+import json
+import logging
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, List, Optional, Tuple
+
+# Attributes set on log records that carry a prompt/response payload: its label and the payload itself
+PAYLOAD_ATTR = 'payload'
+PAYLOAD_VALUE_ATTR = 'payload_value'
+
+PAYLOAD_MODES = ('all', 'sampled', 'errors', 'off')
+
+DEFAULT_PAYLOAD_CONFIG = {
+    'mode': 'sampled',
+    'sample_rate': 0.01,
+    'trace_file': True
+}
+
+
+class PayloadFilter(logging.Filter):
+    """Pass either only payload records or only regular records"""
+
+    def __init__(self, payloads: bool):
+        super().__init__()
+        self.payloads = payloads
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return hasattr(record, PAYLOAD_ATTR) == self.payloads
+
+
+class GzipTraceHandler(logging.Handler):
+    """Write payload records as JSON lines to a gzip-compressed trace file"""
+
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.stream = gzip.open(path, 'at', encoding='utf-8')
+
+    def emit(self, record: logging.LogRecord):
+        try:
+            # QueueHandler.prepare() merges the args into the message, so the raw payload travels as an extra
+            payload = getattr(record, PAYLOAD_VALUE_ATTR, None)
+            if payload is None:
+                payload = record.getMessage()
+            line = json.dumps({
+                'timestamp': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'label': getattr(record, PAYLOAD_ATTR),
+                'payload': payload
+            }, ensure_ascii=False, default=str)
+            self.stream.write(line + '\n')
+        except Exception:
+            self.handleError(record)
+
+    def close(self):
+        self.acquire()
+        try:
+            if self.stream:
+                self.stream.close()
+                self.stream = None
+        finally:
+            self.release()
+            super().close()
+
+
+def setup_async_logging(log_file: str,
+                        formatter: logging.Formatter,
+                        level: int = logging.INFO,
+                        max_bytes: int = 10 * 1024 * 1024,
+                        backup_count: int = 5,
+                        trace_file: Optional[str] = None,
+                        console: bool = True) -> QueueListener:
+    """
+    Route all root logger output through a queue drained by a background thread
+
+    Args:
+        log_file: Main (rotating) log file
+        formatter: Formatter for the file and console handlers
+        level: Root logger level
+        max_bytes / backup_count: Rotation settings for the main log
+        trace_file: Optional gzip JSON-lines file that receives payload records
+        console: Also write regular records to stdout
+
+    Returns:
+        The started QueueListener (stopped automatically at exit)
+    """
+    file_handler = RotatingFileHandler(
+        log_file,
+        maxBytes=max_bytes,
+        backupCount=backup_count,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+    handlers: List[logging.Handler] = [file_handler]
+
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+
+    if trace_file:
+        # Payloads only go to the compressed trace file
+        for handler in handlers:
+            handler.addFilter(PayloadFilter(payloads=False))
+        trace_handler = GzipTraceHandler(trace_file)
+        trace_handler.addFilter(PayloadFilter(payloads=True))
+        handlers.append(trace_handler)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+
+    # Setup root logger
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+
+    # Remove any existing handlers
+    for handler in root_logger.handlers[:]:
+        root_logger.removeHandler(handler)
+    root_logger.addHandler(QueueHandler(log_queue))
+
+    listener.start()
+    atexit.register(stop_async_logging, listener)
+    return listener
+
+
+def stop_async_logging(listener: QueueListener):
+    """Flush pending records and close the handlers of a listener"""
+    if listener._thread is None:
+        return
+    listener.stop()
+    for handler in listener.handlers:
+        handler.close()
+
+
+class PayloadBuffer:
+    """Payloads of a single GPT call, written or held back per the payload mode"""
+
+    def __init__(self, logger: logging.Logger, write: bool, keep: bool):
+        self.logger = logger
+        self.write = write
+        self.keep = keep
+        self.pending: List[Tuple[str, str]] = []
+
+    def add(self, label: str, payload) -> None:
+        """Record a payload (prompt, raw response, parsed JSON, ...)"""
+        if self.write:
+            self.logger.info("%s:\n%s", label, payload, extra={PAYLOAD_ATTR: label, PAYLOAD_VALUE_ATTR: payload})
+        elif self.keep:
+            self.pending.append((label, payload))
+
+    def flush_error(self) -> None:
+        """Write the held-back payloads of a failed call at ERROR level"""
+        for label, payload in self.pending:
+            self.logger.error("%s:\n%s", label, payload, extra={PAYLOAD_ATTR: label, PAYLOAD_VALUE_ATTR: payload})
+        self.pending = []
+
+
+class PayloadLogger:
+    """Decides per call whether its prompt/response payloads are logged"""
+
+    def __init__(self, logger: logging.Logger, mode: str = 'all', sample_rate: float = 1.0):
+        if mode not in PAYLOAD_MODES:
+            raise ValueError(f"Invalid payload logging mode: {mode}. Expected one of {PAYLOAD_MODES}")
+        self.logger = logger
+        self.mode = mode
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def from_config(cls, logger: logging.Logger, config: Dict) -> 'PayloadLogger':
+        """Create from the 'payloads' section of CONFIG['logging']"""
+        payload_config = {**DEFAULT_PAYLOAD_CONFIG, **config.get('logging', {}).get('payloads', {})}
+        return cls(logger, payload_config['mode'], payload_config['sample_rate'])
+
+    def start(self) -> PayloadBuffer:
+        """Start a new call and decide whether its payloads are written"""
+        if self.mode == 'all':
+            return PayloadBuffer(self.logger, write=True, keep=False)
+        if self.mode == 'sampled':
+            sampled = random.random() < self.sample_rate
+            return PayloadBuffer(self.logger, write=sampled, keep=not sampled)
+        if self.mode == 'errors':
+            return PayloadBuffer(self.logger, write=False, keep=True)
+        return PayloadBuffer(self.logger, write=False, keep=False)
@@ -0,0 +1,247 @@
+"""
+Description cleaning: the same information in fewer prompt tokens
+
+Every prompt repeats the entry's description, once per selected category,
+so whatever a description carries besides the course itself is paid for
+many times over. Course catalogues exported from provider portals carry
+HTML markup and entities, stray whitespace and boilerplate sentences that
+a provider appends to all of its courses (registration notes, certificate
+hints, contact lines). Before the prompts are built, each description is:
+
+1. normalised (normalise_text): HTML entities decoded, tags removed (line
+   and paragraph breaks kept as newlines), non-breaking and zero-width
+   spaces replaced, runs of spaces and blank lines collapsed
+2. stripped of boilerplate (optional): BoilerplateModel.fit() learns, per
+   provider, the sentences found in at least `boilerplate_min_share` of
+   the provider's distinct descriptions and in at least
+   `boilerplate_min_count` of them, and removes those sentences. Without
+   a provider column the whole dataset is one group. The model is fitted
+   on the whole dataset, so every shard or queue worker removes the same
+   sentences.
+3. capped (optional): descriptions longer than `max_description_chars`
+   are cut at the last sentence end before the limit
+
+Only the prompt uses the cleaned text; results keep the original
+description. A description that would be cleaned away completely keeps
+its normalised text. Cleaned descriptions are cached by a hash of the
+provider and the text, so duplicates are cleaned once. The cleaner counts
+the characters each step removed; the estimated prompt tokens saved
+(CHARS_PER_TOKEN characters per token, for every prompt built) are
+reported in the run's metrics summary together with the learned
+boilerplate sentences, so they can be reviewed. Boilerplate stripping is
+off by default: a sentence all courses of a provider share can still
+matter to a category (e.g. that its courses are held online).
+"""
+
+import hashlib
+import html
+import re
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.metrics import count_cache
+
+DEFAULT_SETTINGS = {
+    'normalise': True,                # HTML, entities and whitespace
+    'strip_boilerplate': False,       # Remove sentences most descriptions of a provider share
+    'boilerplate_min_share': 0.3,     # ... found in at least this share of the provider's descriptions
+    'boilerplate_min_count': 5,       # ... and in at least this many of them
+    'boilerplate_min_chars': 20,      # Shorter sentences (e.g. 'Inhalte:') are never boilerplate
+    'max_description_chars': None,    # Cut longer descriptions at a sentence end
+    'provider_column': 'provider',    # Group boilerplate by this column, if the data has it
+}
+
+CHARS_PER_TOKEN = 4     # Rough size of a token in German and English text (no tokenizer needed)
+CAP_MIN_FRACTION = 0.5  # Cut at a word instead if the last sentence end comes before this share of the limit
+ELLIPSIS = ' …'
+REPORTED_SENTENCES = 20  # Learned boilerplate sentences listed per provider in the run summary
+
+BREAK_TAG = re.compile(r'<\s*(?:br|/?p|/?div|/?li|/?ul|/?ol|/?h[1-6]|/?tr)\b[^>]*>', re.IGNORECASE)
+TAG = re.compile(r'<[^>]+>')
+INVISIBLE = re.compile('[\u200b\u200c\u200d\u2060\ufeff\u00ad]')  # Zero-width spaces and joiners, soft hyphens
+HORIZONTAL_SPACE = re.compile(r'[^\S\n]+')
+BLANK_LINES = re.compile(r'\n\s*\n+')
+SENTENCE_END = re.compile(r'(?<=[.!?…])\s+')
+
+
+def normalise_text(text: str) -> str:
+    """Decode HTML, drop tags and invisible characters, collapse whitespace (keeping paragraph breaks)"""
+    if '<' in text:
+        text = BREAK_TAG.sub('\n', text)
+        text = TAG.sub(' ', text)
+    text = html.unescape(text)
+    text = INVISIBLE.sub('', text.replace('\r\n', '\n').replace('\r', '\n'))
+    text = HORIZONTAL_SPACE.sub(' ', text)  # Includes non-breaking spaces
+    text = BLANK_LINES.sub('\n\n', text)
+    return '\n'.join(line.strip() for line in text.split('\n')).strip()
+
+
+def split_sentences(line: str) -> List[str]:
+    """Sentences of one line of normalised text"""
+    return [sentence for sentence in SENTENCE_END.split(line) if sentence]
+
+
+def sentence_key(sentence: str) -> str:
+    """Comparison key of a sentence: case and spacing do not matter"""
+    return ' '.join(sentence.split()).casefold()
+
+
+def cap_length(text: str, max_chars: int) -> str:
+    """Cut text longer than max_chars at the last sentence end (or word) before the limit"""
+    if len(text) <= max_chars:
+        return text
+    head = text[:max_chars]
+    cut = max((match.start() for match in SENTENCE_END.finditer(head)), default=-1)
+    if cut < max_chars * CAP_MIN_FRACTION:
+        cut = head.rfind(' ')
+        if cut < max_chars * CAP_MIN_FRACTION:
+            cut = max_chars
+        return head[:cut].rstrip() + ELLIPSIS
+    return head[:cut].rstrip()
+
+
+def _provider_key(provider: Any) -> str:
+    return provider.strip() if isinstance(provider, str) else ''
+
+
+class BoilerplateModel:
+    """Sentences shared by most descriptions of a provider, learned from a dataset"""
+
+    def __init__(self, sentences: Dict[str, Set[str]], counts: Optional[Dict[str, Dict[str, int]]] = None):
+        self.sentences = sentences      # provider -> sentence keys
+        self.counts = counts or {}      # provider -> {sentence: descriptions containing it}, for the report
+
+    @classmethod
+    def fit(cls, descriptions: Iterable[str], providers: Optional[Iterable[Any]] = None,
+            min_share: float = DEFAULT_SETTINGS['boilerplate_min_share'],
+            min_count: int = DEFAULT_SETTINGS['boilerplate_min_count'],
+            min_chars: int = DEFAULT_SETTINGS['boilerplate_min_chars']) -> 'BoilerplateModel':
+        """Learn the boilerplate sentences of each provider from its distinct descriptions"""
+        descriptions = list(descriptions)
+        providers = list(providers) if providers is not None else [None] * len(descriptions)
+        distinct: Dict[str, Set[str]] = {}
+        for description, provider in zip(descriptions, providers):
+            if isinstance(description, str):
+                # Exact duplicates count once, so a duplicated course does not make its own sentences boilerplate
+                distinct.setdefault(_provider_key(provider), set()).add(normalise_text(description))
+        sentences: Dict[str, Set[str]] = {}
+        counts: Dict[str, Dict[str, int]] = {}
+        for provider, texts in distinct.items():
+            seen: Counter = Counter()
+            for text in texts:
+                seen.update({sentence_key(sentence) for line in text.split('\n')
+                             for sentence in split_sentences(line)})
+            threshold = max(min_count, min_share * len(texts))
+            shared = {key: count for key, count in seen.items() if count >= threshold and len(key) >= min_chars}
+            if shared:
+                sentences[provider] = set(shared)
+                counts[provider] = dict(sorted(shared.items(), key=lambda item: -item[1]))
+        return cls(sentences, counts)
+
+    def strip(self, text: str, provider: Any = None) -> str:
+        """Normalised text without the provider's boilerplate sentences"""
+        boilerplate = self.sentences.get(_provider_key(provider))
+        if not boilerplate:
+            return text
+        lines = []
+        for line in text.split('\n'):
+            kept = [sentence for sentence in split_sentences(line) if sentence_key(sentence) not in boilerplate]
+            if kept or not line:
+                lines.append(' '.join(kept))
+        return BLANK_LINES.sub('\n\n', '\n'.join(lines)).strip()
+
+    def report(self) -> Dict[str, Dict[str, int]]:
+        """Most frequent learned sentences per provider ('' without a provider column)"""
+        return {provider: dict(list(counts.items())[:REPORTED_SENTENCES])
+                for provider, counts in self.counts.items()}
+
+
+class DescriptionCleaner:
+    """Cleans descriptions for the prompt and keeps count of what it removed"""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, model: Optional[BoilerplateModel] = None):
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.model = model
+        self._cache: Dict[bytes, Tuple[str, Dict[str, int]]] = {}
+        self.chars_removed = {'normalise': 0, 'boilerplate': 0, 'cap': 0}  # Over distinct descriptions
+        self.chars_before = 0
+        self.descriptions = 0
+
+    @classmethod
+    def from_config(cls, settings: Optional[Dict[str, Any]], dataset: Optional[Any] = None
+                    ) -> Optional['DescriptionCleaner']:
+        """Cleaner for the 'preprocessing' settings, or None if they change nothing
+
+        With boilerplate stripping on, the model is fitted on `dataset` (a
+        DataFrame with a 'description' and optionally a provider column).
+        """
+        settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        strip = settings['strip_boilerplate'] and dataset is not None
+        if not (settings['normalise'] or strip or settings['max_description_chars']):
+            return None
+        model = None
+        if strip:
+            column = settings['provider_column']
+            model = BoilerplateModel.fit(
+                dataset['description'],
+                dataset[column] if column and column in dataset.columns else None,
+                min_share=settings['boilerplate_min_share'],
+                min_count=settings['boilerplate_min_count'],
+                min_chars=settings['boilerplate_min_chars'],
+            )
+        return cls(settings, model)
+
+    def clean(self, description: str, provider: Any = None) -> Optional[str]:
+        """Description as the prompt should show it (None for a missing description)"""
+        if not isinstance(description, str):
+            return None
+        provider = _provider_key(provider)
+        key = hashlib.blake2b(f'{provider}\0{description}'.encode('utf-8'), digest_size=16).digest()
+        cached = self._cache.get(key)
+        count_cache('description_cleaning', hit=cached is not None)
+        if cached is not None:
+            return cached[0]
+
+        removed = {}
+        text = description
+        if self.settings['normalise']:
+            text = normalise_text(description)
+            removed['normalise'] = len(description) - len(text)
+        if self.model is not None:
+            normalised = text if self.settings['normalise'] else normalise_text(text)
+            stripped = self.model.strip(normalised, provider)
+            if stripped:
+                removed['boilerplate'] = len(text) - len(stripped)
+                text = stripped
+        if self.settings['max_description_chars']:
+            capped = cap_length(text, int(self.settings['max_description_chars']))
+            removed['cap'] = len(text) - len(capped)
+            text = capped
+
+        self._cache[key] = (text, removed)
+        self.descriptions += 1
+        self.chars_before += len(description)
+        for step, chars in removed.items():
+            self.chars_removed[step] += chars
+        return text
+
+    @staticmethod
+    def tokens_saved(description: str, cleaned: Optional[str]) -> int:
+        """Estimated prompt tokens one prompt saves by showing the cleaned description"""
+        if cleaned is None:
+            return 0
+        return max(len(description) - len(cleaned), 0) // CHARS_PER_TOKEN
+
+    def summary(self) -> Dict[str, Any]:
+        """What the cleaner did, for the run's metrics summary"""
+        removed = sum(self.chars_removed.values())
+        summary = {
+            'descriptions': self.descriptions,
+            'chars_before': self.chars_before,
+            'chars_removed': {**self.chars_removed, 'total': removed},
+            'share_removed': round(removed / self.chars_before, 4) if self.chars_before else 0.0,
+            'settings': self.settings,
+        }
+        if self.model is not None:
+            summary['boilerplate_sentences'] = self.model.report()
+        return summary
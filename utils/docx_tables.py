@@ -0,0 +1,121 @@
+"""
+Streaming reader for tables in DOCX files
+
+Reads the table XML straight from word/document.xml with iterparse instead
+of building a python-docx object tree. Rows are yielded as soon as they
+have been parsed and discarded afterwards, and parsing stops at the end of
+the requested table.
+
+Cell text and merged cells follow python-docx (Table.rows[i].cells[j].text):
+- paragraphs of a cell are joined with "\\n"
+- w:tab/w:ptab become "\\t", text-wrapping w:br and w:cr become "\\n",
+  w:noBreakHyphen becomes "-"
+- horizontally merged cells (gridSpan) are repeated for each grid column
+- vertically merged continuation cells repeat the cell above
+"""
+
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import Iterator, List
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+BODY, TBL, TR, TC, TBL_GRID = W + 'body', W + 'tbl', W + 'tr', W + 'tc', W + 'tblGrid'
+
+# Text equivalents of run content other than w:t (python-docx semantics)
+RUN_TEXT = {W + 'tab': '\t', W + 'ptab': '\t', W + 'cr': '\n', W + 'noBreakHyphen': '-'}
+
+
+def _run_text(run: ET.Element) -> str:
+    parts = []
+    for child in run:
+        if child.tag == W + 't':
+            parts.append(child.text or '')
+        elif child.tag == W + 'br':
+            if child.get(W + 'type', 'textWrapping') == 'textWrapping':
+                parts.append('\n')
+        elif child.tag in RUN_TEXT:
+            parts.append(RUN_TEXT[child.tag])
+    return ''.join(parts)
+
+
+def _paragraph_text(paragraph: ET.Element) -> str:
+    parts = []
+    for child in paragraph:
+        if child.tag == W + 'r':
+            parts.append(_run_text(child))
+        elif child.tag == W + 'hyperlink':
+            parts.extend(_run_text(run) for run in child.findall(W + 'r'))
+    return ''.join(parts)
+
+
+def _cell_text(cell: ET.Element) -> str:
+    return '\n'.join(_paragraph_text(p) for p in cell.findall(W + 'p'))
+
+
+def _cell_merge(cell: ET.Element):
+    """(grid_span, continues_vertical_merge) of a cell"""
+    properties = cell.find(W + 'tcPr')
+    if properties is None:
+        return 1, False
+    span = properties.find(W + 'gridSpan')
+    merge = properties.find(W + 'vMerge')
+    grid_span = int(span.get(W + 'val', '1')) if span is not None else 1
+    continues = merge is not None and merge.get(W + 'val', 'continue') == 'continue'
+    return grid_span, continues
+
+
+def iter_table_rows(docx_path: str, table_index: int = 0) -> Iterator[List[str]]:
+    """
+    Yield the cell texts of each row of a top-level table in a DOCX file
+
+    Args:
+        docx_path: Path to the .docx file
+        table_index: Index of the table among the document body's tables
+    """
+    with zipfile.ZipFile(docx_path) as archive, archive.open('word/document.xml') as document:
+        stack: List[str] = []
+        tables_seen = -1
+        in_table = False
+        column_count = 0
+        cells: List[str] = []  # Cell texts of the layout grid from the previous row on
+        emitted = 0  # Complete rows at the start of cells that were already yielded
+
+        for event, element in ET.iterparse(document, events=('start', 'end')):
+            if event == 'start':
+                stack.append(element.tag)
+                if element.tag == TBL and len(stack) >= 2 and stack[-2] == BODY:
+                    tables_seen += 1
+                    in_table = tables_seen == table_index
+                continue
+
+            stack.pop()
+            if not in_table:
+                continue
+
+            # Direct children of the table (stack: document, body, tbl)
+            if len(stack) == 3 and element.tag == TBL_GRID:
+                column_count = len(element.findall(W + 'gridCol'))
+            elif len(stack) == 3 and element.tag == TR:
+                for cell in element.findall(TC):
+                    grid_span, continues = _cell_merge(cell)
+                    for span_index in range(grid_span):
+                        if continues:
+                            cells.append(cells[-column_count])
+                        elif span_index > 0:
+                            cells.append(cells[-1])
+                        else:
+                            cells.append(_cell_text(cell))
+                element.clear()
+                while column_count and len(cells) >= (emitted + 1) * column_count:
+                    yield cells[emitted * column_count:(emitted + 1) * column_count]
+                    emitted += 1
+                    if emitted > 1:
+                        # Only the previous row is needed for vertical merges
+                        del cells[:column_count]
+                        emitted -= 1
+            elif element.tag == TBL and len(stack) == 2:
+                # End of the table: a trailing incomplete row is returned as is
+                if len(cells) > emitted * column_count:
+                    yield cells[emitted * column_count:]
+                return
@@ -0,0 +1,307 @@
+"""
+Pool of OpenAI-compatible API endpoints for the classification agent
+
+A single API key caps a run at one account's rate limit. The pool spreads
+the requests of a run over several endpoints: more keys for the OpenAI API,
+or OpenAI-compatible servers (vLLM, Ollama, LiteLLM, Azure, ...). Endpoints
+are configured in CONFIG['gpt']['endpoints'] (or a JSON file, see
+load_endpoints) as a list of:
+
+    {'name': 'eu-key', 'base_url': 'https://host/v1', 'api_key_env': 'OPENAI_KEY_EU',
+     'model': 'gpt-4o', 'weight': 2, 'concurrency': 4}
+
+- name:         label in logs, metrics and call records (default: host)
+- base_url:     None for the OpenAI API (or OPENAI_BASE_URL)
+- api_key:      the key, or api_key_env: variable holding it (default OPENAI_API_KEY)
+- model:        model name sent to this endpoint instead of CONFIG['gpt']['model'],
+                e.g. the name a self-hosted server serves its model under
+- weight:       relative share of the traffic if endpoints are otherwise equal
+- concurrency:  requests sent to the endpoint at the same time (default 1)
+- max_retries:  retries inside the OpenAI client (client default: 2)
+
+Each endpoint keeps its own state:
+- rate limits: headroom from the x-ratelimit-* response headers; after a
+  429, or with no requests or tokens left, it is skipped until the limit resets
+- latency: moving average over its recent successful requests
+- health: after EJECT_AFTER_FAILURES consecutive server or connection errors
+  it is ejected for EJECT_SECONDS, doubling up to MAX_EJECT_SECONDS while it
+  keeps failing. Once that time is up a single probe request is let through,
+  and a success puts it back in rotation. Rejected keys (401/403, exhausted
+  quota) are ejected for MAX_EJECT_SECONDS right away.
+
+A request goes to the available endpoint with the highest
+weight * headroom / (latency * (1 + requests in flight)): the fastest
+endpoint with room left gets most of the traffic, a rate-limited or ejected
+one none. The pipeline runs as many requests at a time as the pool's
+capacity (the sum of the endpoints' concurrency), so throughput grows with
+every endpoint added.
+
+Without configured endpoints the pool holds one endpoint built from
+OPENAI_API_KEY / OPENAI_BASE_URL with concurrency 1, i.e. the single client
+used before. Ejection needs another endpoint to fall back on and is off
+for a single endpoint.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Any, Dict, List, Mapping, Optional
+from urllib.parse import urlparse
+
+from utils.metrics import ENDPOINT_EJECTIONS, ENDPOINT_REQUESTS, time_stage
+from utils.tracing import TRACER
+
+ENDPOINT_KEYS = {'name', 'base_url', 'api_key', 'api_key_env', 'model', 'weight', 'concurrency', 'max_retries'}
+
+EJECT_AFTER_FAILURES = 3
+EJECT_SECONDS = 10.0
+MAX_EJECT_SECONDS = 300.0
+
+LATENCY_SMOOTHING = 0.2     # Weight of the newest request in the latency average
+MIN_HEADROOM = 0.01         # Endpoints at their limit still rank by weight and latency
+DEFAULT_RETRY_AFTER = 1.0   # Seconds to skip an endpoint after a 429 without reset headers
+WAIT_STEP = 0.05            # Re-check interval while no endpoint is available
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {'ms': 0.001, 's': 1.0, 'm': 60.0, 'h': 3600.0}
+
+logger = logging.getLogger('endpoint_pool')
+
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds of a rate-limit reset header such as '20ms', '1.5s' or '6m0s' (plain numbers are seconds)"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts) if parts else None
+
+
+def _int_header(headers: Mapping[str, str], name: str) -> Optional[int]:
+    try:
+        return int(float(headers[name])) if headers.get(name) is not None else None
+    except ValueError:
+        return None
+
+
+def retry_after(headers: Optional[Mapping[str, str]]) -> float:
+    """Seconds until a rate-limited endpoint takes requests again, from the headers of its 429 response"""
+    if headers:
+        if headers.get('retry-after-ms'):
+            seconds = parse_duration(headers['retry-after-ms'])
+            if seconds is not None:
+                return seconds / 1000
+        seconds = parse_duration(headers.get('retry-after'))
+        if seconds is not None:
+            return seconds
+        resets = [parse_duration(headers.get(f'x-ratelimit-reset-{kind}')) for kind in ('requests', 'tokens')
+                  if _int_header(headers, f'x-ratelimit-remaining-{kind}') == 0]
+        resets = [seconds for seconds in resets if seconds is not None]
+        if resets:
+            return max(resets)
+    return DEFAULT_RETRY_AFTER
+
+
+class Endpoint:
+    """One API endpoint: its client and the state used for routing"""
+
+    def __init__(self, name: str, client: Any, model: Optional[str] = None,
+                 weight: float = 1.0, concurrency: int = 1):
+        if weight <= 0 or concurrency < 1:
+            raise ValueError(f"Endpoint {name}: weight must be positive and concurrency at least 1")
+        self.name = name
+        self.client = client
+        self.model = model
+        self.weight = weight
+        self.concurrency = concurrency
+        self.in_flight = 0
+        self.latency: Optional[float] = None  # Moving average of successful requests, seconds
+        self.limits: Dict[str, Optional[int]] = {'requests': None, 'tokens': None}
+        self.remaining: Dict[str, Optional[int]] = {'requests': None, 'tokens': None}
+        self.blocked_until = 0.0   # Rate limited until (monotonic time)
+        self.ejected_until = 0.0   # Ejected until; stays set while the endpoint is on probation
+        self.eject_seconds = EJECT_SECONDS
+        self.failures = 0          # Consecutive failed requests
+
+    def headroom(self) -> float:
+        """Smallest fraction of the request and token limits left (1.0 while unknown)"""
+        fractions = [self.remaining[kind] / self.limits[kind] for kind in ('requests', 'tokens')
+                     if self.remaining[kind] is not None and self.limits[kind]]
+        return max(min(fractions), 0.0) if fractions else 1.0
+
+    def available(self, now: float) -> bool:
+        if now < self.blocked_until or now < self.ejected_until:
+            return False
+        if self.ejected_until:
+            return self.in_flight == 0  # One probe request after an ejection
+        return self.in_flight < self.concurrency
+
+    def update_limits(self, headers: Mapping[str, str], now: float) -> None:
+        """Take over the rate-limit state reported in response headers"""
+        for kind in ('requests', 'tokens'):
+            remaining = _int_header(headers, f'x-ratelimit-remaining-{kind}')
+            if remaining is None:
+                continue
+            self.remaining[kind] = remaining
+            self.limits[kind] = _int_header(headers, f'x-ratelimit-limit-{kind}') or self.limits[kind]
+            if remaining <= 0:
+                reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                self.blocked_until = max(self.blocked_until, now + (DEFAULT_RETRY_AFTER if reset is None else reset))
+
+    def record_latency(self, seconds: float) -> None:
+        if self.latency is None:
+            self.latency = seconds
+        else:
+            self.latency += LATENCY_SMOOTHING * (seconds - self.latency)
+
+    def status(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.monotonic() if now is None else now
+        return {
+            'name': self.name,
+            'model': self.model,
+            'weight': self.weight,
+            'concurrency': self.concurrency,
+            'in_flight': self.in_flight,
+            'latency_ms': round(self.latency * 1000, 1) if self.latency is not None else None,
+            'headroom': round(self.headroom(), 3),
+            'rate_limited_seconds': round(max(self.blocked_until - now, 0.0), 3),
+            'ejected_seconds': round(max(self.ejected_until - now, 0.0), 3),
+            'failures': self.failures,
+        }
+
+
+class EndpointPool:
+    """Routes requests over endpoints by headroom and latency, and ejects failing ones"""
+
+    def __init__(self, endpoints: List[Endpoint]):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        names = [endpoint.name for endpoint in endpoints]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Endpoint names must be unique, got {names}")
+        self.endpoints = endpoints
+
+    @classmethod
+    def from_config(cls, entries: Optional[List[Dict[str, Any]]] = None, timeout: float = 120.0) -> 'EndpointPool':
+        """Build the pool from endpoint entries (see the module docstring); none means the default OpenAI client"""
+        from openai import AsyncOpenAI
+
+        endpoints = []
+        for index, entry in enumerate(entries or [{}], 1):
+            unknown = set(entry) - ENDPOINT_KEYS
+            if unknown:
+                raise ValueError(f"Unknown endpoint settings: {sorted(unknown)}")
+            base_url = entry.get('base_url')
+            options = {
+                'api_key': entry.get('api_key') or os.getenv(entry.get('api_key_env') or 'OPENAI_API_KEY'),
+                'base_url': base_url,
+                'timeout': timeout,
+            }
+            if entry.get('max_retries') is not None:
+                options['max_retries'] = int(entry['max_retries'])
+            name = entry.get('name') or (urlparse(base_url).netloc if base_url else 'openai')
+            if any(endpoint.name == name for endpoint in endpoints):
+                name = f'{name}-{index}'
+            endpoints.append(Endpoint(name, AsyncOpenAI(**options), model=entry.get('model'),
+                                      weight=float(entry.get('weight', 1.0)),
+                                      concurrency=int(entry.get('concurrency', 1))))
+        return cls(endpoints)
+
+    @property
+    def capacity(self) -> int:
+        """Requests the pool's endpoints take at the same time"""
+        return sum(endpoint.concurrency for endpoint in self.endpoints)
+
+    def select(self, now: float) -> Optional[Endpoint]:
+        """The available endpoint with the best weight * headroom / latency, or None"""
+        candidates = [endpoint for endpoint in self.endpoints if endpoint.available(now)]
+        if not candidates:
+            return None
+        # Endpoints without requests yet count as fast as the fastest, so they get tried
+        known = [endpoint.latency for endpoint in self.endpoints if endpoint.latency is not None]
+        default_latency = min(known) if known else 1.0
+
+        def score(endpoint: Endpoint) -> float:
+            latency = endpoint.latency if endpoint.latency is not None else default_latency
+            return endpoint.weight * max(endpoint.headroom(), MIN_HEADROOM) / (max(latency, 1e-3) * (1 + endpoint.in_flight))
+
+        return max(candidates, key=score)
+
+    async def acquire(self) -> Endpoint:
+        """Reserve an endpoint for one request, waiting while all are rate limited, ejected or busy"""
+        endpoint = self.select(time.monotonic())
+        if endpoint is None:
+            with time_stage('rate_limit_wait'), TRACER.span('rate_limit_wait', reason='no_endpoint_available'):
+                while endpoint is None:
+                    await asyncio.sleep(WAIT_STEP)
+                    endpoint = self.select(time.monotonic())
+        endpoint.in_flight += 1
+        return endpoint
+
+    def release(self, endpoint: Endpoint, latency: Optional[float] = None,
+                headers: Optional[Mapping[str, str]] = None, error: Optional[BaseException] = None) -> None:
+        """Return an endpoint after a request, with the latency and headers of its response or its error"""
+        endpoint.in_flight -= 1
+        now = time.monotonic()
+        if isinstance(error, asyncio.CancelledError):
+            return  # The run was cancelled; says nothing about the endpoint
+        if error is None:
+            ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, outcome='ok')
+            if headers is not None:
+                endpoint.update_limits(headers, now)
+            if latency is not None:
+                endpoint.record_latency(latency)
+            if endpoint.ejected_until:
+                logger.info(f"Endpoint {endpoint.name} is back in rotation")
+            endpoint.failures = 0
+            endpoint.ejected_until = 0.0
+            endpoint.eject_seconds = EJECT_SECONDS
+            return
+
+        status = getattr(error, 'status_code', None)
+        response = getattr(error, 'response', None)
+        response_headers = getattr(response, 'headers', None)
+        rejected_key = status in (401, 403) or getattr(error, 'code', None) == 'insufficient_quota'
+        if status == 429 and not rejected_key:
+            ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, outcome='rate_limited')
+            if response_headers is not None:
+                endpoint.update_limits(response_headers, now)
+            endpoint.blocked_until = max(endpoint.blocked_until, now + retry_after(response_headers))
+            return
+        if status is not None and status < 500 and not rejected_key:
+            # The request itself was refused (e.g. 400); nothing wrong with the endpoint
+            ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, outcome='rejected')
+            return
+
+        ENDPOINT_REQUESTS.inc(endpoint=endpoint.name, outcome='error')
+        endpoint.failures += 1
+        if len(self.endpoints) > 1 and (rejected_key or endpoint.ejected_until
+                                        or endpoint.failures >= EJECT_AFTER_FAILURES):
+            self._eject(endpoint, now, MAX_EJECT_SECONDS if rejected_key else endpoint.eject_seconds, error)
+
+    def _eject(self, endpoint: Endpoint, now: float, seconds: float, error: BaseException) -> None:
+        endpoint.ejected_until = now + seconds
+        endpoint.eject_seconds = min(endpoint.eject_seconds * 2, MAX_EJECT_SECONDS)
+        ENDPOINT_EJECTIONS.inc(endpoint=endpoint.name)
+        logger.warning(f"Endpoint {endpoint.name} ejected for {seconds:.0f}s after {endpoint.failures} "
+                       f"failed requests: {type(error).__name__}: {error}")
+
+    def status(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        return [endpoint.status(now) for endpoint in self.endpoints]
+
+
+def load_endpoints(path: str) -> List[Dict[str, Any]]:
+    """Endpoint entries from a JSON file holding a list of them, or an object with an 'endpoints' list"""
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    endpoints = data.get('endpoints') if isinstance(data, dict) else data
+    if not isinstance(endpoints, list) or not all(isinstance(entry, dict) for entry in endpoints):
+        raise ValueError(f"{path} does not hold a list of endpoint settings")
+    return endpoints
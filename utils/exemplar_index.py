@@ -0,0 +1,227 @@
+"""
+Few-shot examples chosen per entry by similarity
+
+construct_prompt lists a category's anchor examples in every prompt. Human
+coded entries (the human codes file) make good further examples, but
+listing all of them in every prompt makes each prompt grow with the pool.
+With CONFIG['examples']['enabled'], each prompt instead gets the `top_k`
+exemplars of its category that are most similar to the entry:
+
+1. ExemplarIndex.build() collects the exemplars once per run: the scheme's
+   anchor examples and, per category, every entry of the human codes file
+   with a code for it, shown as 'title: description → code' (description
+   shortened to `exemplar_chars`, from the file or else from the dataset)
+2. each distinct exemplar text is vectorised once: word uni- and bigrams
+   hashed into `n_features` columns (no vocabulary to fit or store),
+   weighted by TF-IDF over the exemplar pool and L2-normalised, so a dot
+   product is the cosine similarity. Everything runs locally.
+3. select() takes entries in batches of `batch_size`: one sparse product
+   gives the similarity of every entry in the batch to every exemplar,
+   and each category keeps its `top_k` most similar ones (most similar
+   first). An entry's own human code is never one of its exemplars.
+
+With `keep_anchors` (default) the anchor examples stay in every prompt,
+since they belong to the scheme's definition of a category and are often
+rules rather than course descriptions; only the coded entries compete for
+the `top_k` places. Without it, anchors are ranked along with them.
+Categories without exemplars keep their (empty) anchor list.
+"""
+
+import math
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from utils.description_cleaning import cap_length, normalise_text
+
+DEFAULT_SETTINGS = {
+    'enabled': False,         # Choose the examples per entry instead of listing all of them
+    'top_k': 3,               # Exemplars per category and prompt
+    'keep_anchors': True,     # Always list the scheme's anchor examples; only coded entries are ranked
+    'human_codes': True,      # Use the entries of the human codes file as exemplars
+    'exemplar_chars': 300,    # Description length shown per coded exemplar
+    'min_similarity': 0.0,    # Leave out exemplars that are less similar than this
+    'n_features': 2 ** 18,    # Hashed feature columns
+    'batch_size': 256,        # Entries per similarity query
+}
+
+CODE_PREFIX = 'human_code_'  # Column prefix of the human codes file
+
+
+class Exemplar(NamedTuple):
+    """One example line for a category's prompts"""
+    category: str
+    text: str               # As listed in the prompt
+    document: str           # What its similarity is computed on (the text without the code)
+    title: Optional[str]    # Coded entry it comes from (None for anchor examples)
+
+
+def _code_text(code: Any) -> Optional[str]:
+    """A human code as written in the prompt (1.0 read from Excel -> '1'), None if missing"""
+    if code is None or (isinstance(code, float) and math.isnan(code)):
+        return None
+    if isinstance(code, float) and code.is_integer():
+        code = int(code)
+    text = str(code).strip()
+    return text or None
+
+
+def coded_exemplars(codes: Any, descriptions: Dict[str, str], categories: Iterable[str],
+                    max_chars: int = DEFAULT_SETTINGS['exemplar_chars']) -> List[Exemplar]:
+    """
+    Exemplars from a human codes frame (title and human_code_<category> columns)
+
+    Descriptions come from the frame's own 'description' column if it has
+    one, else from `descriptions` (title -> description of the dataset).
+    """
+    own = dict(zip(codes['title'], codes['description'])) if 'description' in codes.columns else {}
+    documents: Dict[str, str] = {}  # title -> 'title: description', shared by its categories
+    exemplars = []
+    for category in categories:
+        column = f'{CODE_PREFIX}{category}'
+        if column not in codes.columns:
+            continue
+        for title, code in zip(codes['title'], codes[column]):
+            code = _code_text(code)
+            if code is None or not isinstance(title, str):
+                continue
+            document = documents.get(title)
+            if document is None:
+                description = own.get(title)
+                if not isinstance(description, str):
+                    description = descriptions.get(title)
+                document = title
+                if isinstance(description, str) and description.strip():
+                    snippet = cap_length(' '.join(normalise_text(description).split()), max_chars)
+                    document = f'{title}: {snippet}'
+                documents[title] = document
+            exemplars.append(Exemplar(category, f'{document} → {code}', document, title))
+    return exemplars
+
+
+class ExemplarIndex:
+    """Hashed TF-IDF vectors of all exemplars, queried for the most similar ones per category"""
+
+    def __init__(self, exemplars: Sequence[Exemplar], anchors: Optional[Dict[str, List[str]]] = None,
+                 settings: Optional[Dict[str, Any]] = None):
+        from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+        import numpy as np
+
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.anchors = anchors or {}  # Listed before the selected exemplars (keep_anchors)
+        self.exemplars = list(exemplars)
+        self._vectorizer = HashingVectorizer(n_features=self.settings['n_features'], ngram_range=(1, 2),
+                                             alternate_sign=False, norm=None)
+
+        # Exemplars that repeat a text (e.g. one coded entry in several categories) share its vector
+        documents: Dict[str, int] = {}
+        rows = [documents.setdefault(exemplar.document, len(documents)) for exemplar in self.exemplars]
+        self._tfidf = TfidfTransformer(sublinear_tf=True)
+        self._vectors = (self._tfidf.fit_transform(self._vectorizer.transform(list(documents)))
+                         if documents else None)
+
+        self._members: Dict[str, List[int]] = {}  # category -> positions in self.exemplars
+        for position, exemplar in enumerate(self.exemplars):
+            self._members.setdefault(exemplar.category, []).append(position)
+        self._rows: Dict[str, Any] = {}  # category -> vector row of each of its exemplars
+        self._own: Dict[str, Dict[str, List[int]]] = {}  # category -> title -> its exemplars' places in the category
+        # Categories coded for the same entries rank the same rows, so select() ranks them once
+        self._groups: Dict[str, int] = {}
+        groups: Dict[bytes, int] = {}
+        for category, members in self._members.items():
+            self._rows[category] = np.array([rows[position] for position in members], dtype=np.int64)
+            self._groups[category] = groups.setdefault(self._rows[category].tobytes(), len(groups))
+            for index, position in enumerate(members):
+                title = self.exemplars[position].title
+                if title is not None:
+                    self._own.setdefault(category, {}).setdefault(title, []).append(index)
+
+    @classmethod
+    def build(cls, scheme: Any, categories: Iterable[str], settings: Optional[Dict[str, Any]] = None,
+              codes: Any = None, dataset: Any = None) -> Optional['ExemplarIndex']:
+        """
+        Index of the anchor examples and coded entries of `categories`, or None if selection is off
+
+        `scheme` is the run's CodingScheme, `codes` the human codes frame
+        (if any) and `dataset` the full dataset, for descriptions the codes
+        frame lacks.
+        """
+        settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        if not settings['enabled']:
+            return None
+        categories = [key for key in dict.fromkeys(categories) if key in scheme.categories]
+        anchors = {key: [example for example in scheme.categories[key].examples if example and example.strip()]
+                   for key in categories}
+        exemplars: List[Exemplar] = []
+        if not settings['keep_anchors']:
+            exemplars += [Exemplar(key, example, example, None) for key in categories for example in anchors[key]]
+            anchors = {}
+        if settings['human_codes'] and codes is not None:
+            descriptions = dict(zip(dataset['title'], dataset['description'])) if dataset is not None else {}
+            exemplars += coded_exemplars(codes, descriptions, categories, settings['exemplar_chars'])
+        return cls(exemplars, anchors, settings)
+
+    def select(self, titles: Sequence[str], texts: Sequence[str],
+               categories: Iterable[str]) -> List[Dict[str, List[str]]]:
+        """
+        Example lines for each entry (title and query text) and category
+
+        Returns one dict per entry, category -> anchors and the top_k most
+        similar exemplars of that category (most similar first). Texts are
+        normalised like descriptions, so raw descriptions can be passed.
+        """
+        categories = list(dict.fromkeys(categories))
+        top_k = self.settings['top_k']
+        batch_size = max(int(self.settings['batch_size']), 1)
+        selected: List[Dict[str, List[str]]] = []
+        for start in range(0, len(titles), batch_size):
+            batch_titles = list(titles[start:start + batch_size])
+            batch = [{key: list(self.anchors.get(key, [])) for key in categories} for _ in batch_titles]
+            if self._vectors is not None:
+                query = self._tfidf.transform(self._vectorizer.transform(
+                    [f'{title}: {normalise_text(text) if isinstance(text, str) else ""}'
+                     for title, text in zip(batch_titles, texts[start:start + batch_size])]
+                ))
+                similarity = (query @ self._vectors.T).toarray()
+                ranked: Dict[int, Any] = {}  # group -> best places per entry and which of them to keep
+                for key in categories:
+                    members = self._members.get(key)
+                    if not members or top_k <= 0:
+                        continue
+                    group = self._groups[key]
+                    if group not in ranked:
+                        ranked[group] = self._rank(similarity, key, batch_titles)
+                    best, keep = ranked[group]
+                    for number in range(len(batch_titles)):
+                        batch[number][key] += [self.exemplars[members[index]].text
+                                               for index in best[number][keep[number]]]
+            selected += batch
+        return selected
+
+    def _rank(self, similarity: Any, category: str, titles: List[str]) -> Tuple[Any, Any]:
+        """Places of the top_k exemplars of a category per entry (most similar first), and which to keep"""
+        import numpy as np
+
+        scores = similarity[:, self._rows[category]]
+        # An entry's own code would give its answer away
+        own = self._own.get(category, {})
+        for number, title in enumerate(titles):
+            if title in own:
+                scores[number, own[title]] = -np.inf
+        count = min(self.settings['top_k'], scores.shape[1])
+        if count < scores.shape[1]:
+            best = np.argpartition(-scores, count - 1, axis=1)[:, :count]
+        else:
+            best = np.broadcast_to(np.arange(count), (len(titles), count))
+        best_scores = np.take_along_axis(scores, best, axis=1)
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best = np.take_along_axis(best, order, axis=1)
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        return best, (best_scores > -np.inf) & (best_scores >= self.settings['min_similarity'])
+
+    def summary(self) -> Dict[str, Any]:
+        """Size of the exemplar pool, for the run's metrics summary"""
+        return {
+            'exemplars': len(self.exemplars),
+            'distinct_texts': 0 if self._vectors is None else self._vectors.shape[0],
+            'per_category': {key: len(members) for key, members in self._members.items()},
+            'settings': self.settings,
+        }
@@ -0,0 +1,269 @@
+"""
+Weighted fair sharing of an API budget between concurrent pipeline jobs
+
+Web jobs run in separate worker processes but use the same API accounts.
+Without coordination, a job with thousands of tasks keeps the rate limit
+busy and a small run submitted after it waits minutes for its first result.
+The FairShareScheduler sits between the jobs and their API clients: before
+each request, a job asks it for a grant.
+
+- Budget: grants are paced to the configured RPM and TPM, with bursts of
+  at most BURST_SECONDS worth of budget, so a big job cannot use up a whole
+  minute's budget in a few seconds and lock out jobs that start after it.
+  Tokens are estimated before the call and corrected with the usage the
+  API reports.
+- Weighted fair queueing: each job has a virtual time that a grant advances
+  by the share of the per-minute budget it uses, divided by the job's
+  weight. The next grant goes to the waiting job with the lowest virtual
+  time, so jobs that keep asking get RPM and TPM in proportion to their
+  weights. A job that starts, or asks again after a pause of more than
+  STALE_SECONDS, joins at the virtual time of the jobs already waiting: idle
+  time earns no credit, and a new job is served right away.
+- Work conserving: a job on its own gets the whole budget, and capacity one
+  job leaves unused goes to the others.
+
+Priorities map to weights (PRIORITY_WEIGHTS). With 'auto', runs of up to
+`interactive_max_tasks` tasks are 'interactive' and larger ones 'batch', so
+small runs get their first results quickly while big ones keep the leftover
+capacity.
+
+The state lives in a SQLite file (WAL) shared by the job processes of one
+machine. A job that stops polling for STALE_SECONDS (e.g. its process died)
+no longer counts as waiting.
+"""
+
+import asyncio
+import sqlite3
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metrics import time_stage
+from utils.sqlite_store import SQLiteStore
+from utils.tracing import TRACER
+
+PRIORITY_WEIGHTS = {'interactive': 4.0, 'normal': 2.0, 'batch': 1.0}
+DEFAULT_INTERACTIVE_MAX_TASKS = 50
+
+BURST_SECONDS = 2.0     # Budget that may be granted at once after a quiet period
+WINDOW_SECONDS = 60.0   # Grants are kept this long (status, token corrections)
+STALE_SECONDS = 3.0     # Waiting jobs poll more often than this
+POLL_SECONDS = 0.05     # Wait before asking again while another job is next
+MAX_WAIT_SECONDS = 1.0  # Longest wait between polls while the budget is used up
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS budget (
+    id         INTEGER PRIMARY KEY CHECK (id = 1),
+    request_at REAL NOT NULL,  -- When the budget has room for the next request / token (paced)
+    token_at   REAL NOT NULL
+);
+INSERT OR IGNORE INTO budget (id, request_at, token_at) VALUES (1, 0, 0);
+CREATE TABLE IF NOT EXISTS shares (
+    job_id        TEXT PRIMARY KEY,
+    priority      TEXT NOT NULL,
+    weight        REAL NOT NULL,
+    virtual_time  REAL NOT NULL DEFAULT 0,
+    waiting_since REAL,
+    seen_at       REAL NOT NULL,
+    requests      INTEGER NOT NULL DEFAULT 0,
+    tokens        INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS grants (
+    grant_id   INTEGER PRIMARY KEY,
+    job_id     TEXT NOT NULL,
+    granted_at REAL NOT NULL,
+    tokens     INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS grants_time ON grants (granted_at);
+"""
+
+
+def resolve_priority(priority: Optional[str], total_tasks: int,
+                     interactive_max_tasks: int = DEFAULT_INTERACTIVE_MAX_TASKS) -> str:
+    """Priority of a run; 'auto' (or none) picks 'interactive' for small runs and 'batch' otherwise"""
+    if priority in (None, '', 'auto'):
+        return 'interactive' if total_tasks <= interactive_max_tasks else 'batch'
+    if priority not in PRIORITY_WEIGHTS:
+        raise ValueError(f"Unknown priority {priority!r}, expected auto or one of {sorted(PRIORITY_WEIGHTS)}")
+    return priority
+
+
+def estimate_tokens(prompt: str, max_completion_tokens: int) -> int:
+    """Tokens a request may use, before it is sent: about 4 characters per prompt token plus the completion limit"""
+    return len(prompt) // 4 + max_completion_tokens
+
+
+class FairShareScheduler(SQLiteStore):
+    """Grants API requests to jobs within an RPM/TPM budget, by weighted fair queueing"""
+
+    def __init__(self, path: str, rpm: int = 0, tpm: int = 0):
+        """rpm, tpm: requests and tokens per minute shared by all jobs; 0 leaves that dimension unlimited"""
+        if rpm <= 0 and tpm <= 0:
+            raise ValueError("Fair sharing needs an RPM or TPM budget")
+        self.rpm = rpm
+        self.tpm = tpm
+        super().__init__(path, SCHEMA)
+
+    def _pace(self, tokens: int) -> Tuple[float, float]:
+        """Seconds of request and token budget one request uses"""
+        return (60.0 / self.rpm if self.rpm > 0 else 0.0,
+                60.0 * tokens / self.tpm if self.tpm > 0 else 0.0)
+
+    def cost(self, tokens: int) -> float:
+        """Share of the per-minute budget a request uses: its larger share of RPM or TPM"""
+        return max(1.0 / self.rpm if self.rpm > 0 else 0.0, tokens / self.tpm if self.tpm > 0 else 0.0)
+
+    @staticmethod
+    def _system_virtual_time(conn: sqlite3.Connection, now: float) -> float:
+        """Virtual time a job joins at: the lowest among waiting jobs, else the highest among active ones"""
+        row = conn.execute(
+            "SELECT MIN(virtual_time) AS waiting, "
+            "(SELECT MAX(virtual_time) FROM shares WHERE seen_at >= ?) AS active "
+            "FROM shares WHERE waiting_since IS NOT NULL AND seen_at >= ?",
+            (now - STALE_SECONDS, now - STALE_SECONDS)
+        ).fetchone()
+        if row['waiting'] is not None:
+            return row['waiting']
+        return row['active'] or 0.0
+
+    def join(self, job_id: str, priority: str) -> 'JobShare':
+        """Register a job with a priority (see PRIORITY_WEIGHTS) and return its handle"""
+        weight = PRIORITY_WEIGHTS[priority]
+
+        def statements(conn):
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO shares (job_id, priority, weight, virtual_time, seen_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (job_id, priority, weight, self._system_virtual_time(conn, now), now)
+            )
+
+        self._transaction(statements)
+        return JobShare(self, job_id, priority)
+
+    def leave(self, job_id: str) -> None:
+        """Remove a finished job; the budget its requests used stays used"""
+        self._connection().execute("DELETE FROM shares WHERE job_id = ?", (job_id,))
+
+    def try_acquire(self, job_id: str, tokens: int) -> Tuple[Optional[int], float]:
+        """
+        Grant one request of up to `tokens` tokens to the job if the budget
+        allows and the job is next in line. Returns (grant_id, 0) or (None,
+        seconds to wait before asking again).
+        """
+
+        def statements(conn):
+            now = time.time()
+            share = conn.execute("SELECT * FROM shares WHERE job_id = ?", (job_id,)).fetchone()
+            if share is None:
+                raise ValueError(f"Job {job_id} has not joined the fair-share scheduler")
+            if share['seen_at'] < now - STALE_SECONDS:
+                # Asks again after a pause: no credit for the time it did not ask
+                conn.execute(
+                    "UPDATE shares SET virtual_time = MAX(virtual_time, ?), waiting_since = ?, seen_at = ? "
+                    "WHERE job_id = ?",
+                    (self._system_virtual_time(conn, now), now, now, job_id)
+                )
+            else:
+                conn.execute("UPDATE shares SET waiting_since = COALESCE(waiting_since, ?), seen_at = ? "
+                             "WHERE job_id = ?", (now, now, job_id))
+
+            budget = conn.execute("SELECT request_at, token_at FROM budget").fetchone()
+            ready_at = max(budget['request_at'], budget['token_at']) - BURST_SECONDS
+            if now < ready_at:
+                return None, min(max(ready_at - now, POLL_SECONDS), MAX_WAIT_SECONDS)
+
+            head = conn.execute(
+                "SELECT job_id FROM shares WHERE waiting_since IS NOT NULL AND seen_at >= ? "
+                "ORDER BY virtual_time, waiting_since LIMIT 1",
+                (now - STALE_SECONDS,)
+            ).fetchone()
+            if head['job_id'] != job_id:
+                return None, POLL_SECONDS
+
+            request_seconds, token_seconds = self._pace(tokens)
+            conn.execute(
+                "UPDATE budget SET request_at = MAX(request_at, ?) + ?, token_at = MAX(token_at, ?) + ?",
+                (now, request_seconds, now, token_seconds)
+            )
+            conn.execute("DELETE FROM grants WHERE granted_at < ?", (now - WINDOW_SECONDS,))
+            grant_id = conn.execute(
+                "INSERT INTO grants (job_id, granted_at, tokens) VALUES (?, ?, ?)", (job_id, now, tokens)
+            ).lastrowid
+            conn.execute(
+                "UPDATE shares SET virtual_time = virtual_time + ?, waiting_since = NULL, "
+                "requests = requests + 1, tokens = tokens + ? WHERE job_id = ?",
+                (self.cost(tokens) / share['weight'], tokens, job_id)
+            )
+            return grant_id, 0.0
+
+        return self._transaction(statements)
+
+    def settle(self, grant_id: int, tokens: int) -> None:
+        """Replace a grant's estimated tokens with the tokens the request actually used"""
+
+        def statements(conn):
+            grant = conn.execute("SELECT job_id, tokens FROM grants WHERE grant_id = ?", (grant_id,)).fetchone()
+            if grant is None:
+                return  # Already out of the window
+            conn.execute("UPDATE grants SET tokens = ? WHERE grant_id = ?", (tokens, grant_id))
+            conn.execute("UPDATE budget SET token_at = token_at + ?",
+                         (self._pace(tokens)[1] - self._pace(grant['tokens'])[1],))
+            conn.execute(
+                "UPDATE shares SET virtual_time = virtual_time + ? / weight, tokens = tokens + ? WHERE job_id = ?",
+                (self.cost(tokens) - self.cost(grant['tokens']), tokens - grant['tokens'], grant['job_id'])
+            )
+
+        self._transaction(statements)
+
+    def status(self) -> Dict[str, Any]:
+        """Budget used in the current window and the registered jobs"""
+        conn = self._connection()
+        now = time.time()
+        used = conn.execute(
+            "SELECT COUNT(*) AS requests, COALESCE(SUM(tokens), 0) AS tokens FROM grants WHERE granted_at >= ?",
+            (now - WINDOW_SECONDS,)
+        ).fetchone()
+        jobs: List[Dict[str, Any]] = [
+            {**dict(row), 'waiting': row['waiting_since'] is not None and row['seen_at'] >= now - STALE_SECONDS}
+            for row in conn.execute("SELECT * FROM shares ORDER BY virtual_time")
+        ]
+        return {'rpm': self.rpm, 'tpm': self.tpm, 'requests_last_minute': used['requests'],
+                'tokens_last_minute': used['tokens'], 'jobs': jobs}
+
+
+class JobShare:
+    """
+    A job's handle on the scheduler; the job's requests wait for their grants one at a time
+
+    The scheduler's transactions wait up to 30 seconds for a lock held by
+    other job processes, so they run in a worker thread instead of
+    blocking the job's event loop (its in-flight requests, progress
+    updates and cancellation).
+    """
+
+    def __init__(self, scheduler: FairShareScheduler, job_id: str, priority: str):
+        self.scheduler = scheduler
+        self.job_id = job_id
+        self.priority = priority
+        self._lock: Optional[asyncio.Lock] = None  # Created in the running event loop
+
+    async def acquire(self, tokens: int) -> int:
+        """Wait for a grant for one request of up to `tokens` tokens and return its id"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            grant_id, wait = await asyncio.to_thread(self.scheduler.try_acquire, self.job_id, tokens)
+            if grant_id is not None:
+                return grant_id
+            with time_stage('fair_share_wait'), TRACER.span('fair_share_wait', priority=self.priority):
+                while grant_id is None:
+                    await asyncio.sleep(wait)
+                    grant_id, wait = await asyncio.to_thread(self.scheduler.try_acquire, self.job_id, tokens)
+            return grant_id
+
+    async def settle(self, grant_id: int, tokens: int) -> None:
+        """Correct a grant's token estimate with the tokens its request used"""
+        await asyncio.to_thread(self.scheduler.settle, grant_id, tokens)
+
+    def close(self) -> None:
+        self.scheduler.leave(self.job_id)
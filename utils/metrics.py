@@ -0,0 +1,328 @@
+"""
+Run metrics for the classification pipeline
+
+Counters and histograms in the style of the Prometheus client library,
+without the dependency. The pipeline records into the process-wide METRICS
+registry:
+- pipeline_stage_seconds:         time per stage (see STAGES)
+- pipeline_api_requests_total:    chat completion requests by outcome
+- pipeline_api_retries_total:     retried API calls by error class
+- pipeline_tokens_total:          prompt/completion/cached tokens
+- pipeline_cache_lookups_total:   cache hits and misses by cache
+- pipeline_tasks_total:           finished (entry, category) tasks by outcome
+- pipeline_endpoint_requests_total:   HTTP attempts per API endpoint by outcome
+- pipeline_endpoint_ejections_total:  endpoints taken out of rotation after failures
+- pipeline_prompt_tokens_saved_total: estimated prompt tokens saved by description cleaning
+
+A registry is exported as a JSON-serialisable snapshot. Snapshots of
+several processes (e.g. web job workers) are merged by adding them up and
+rendered in the Prometheus text format for the /metrics endpoint; after a
+run, a summary with per-stage totals and percentiles is written next to
+the results file.
+"""
+
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Histogram buckets in seconds, from in-process stages to slow API calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Pipeline stages timed in pipeline_stage_seconds
+STAGES = ('data_load', 'preprocess', 'scheme_load', 'example_index', 'example_select', 'prompt_build',
+          'fair_share_wait', 'rate_limit_wait', 'retry_backoff', 'api_call', 'validate', 'result_write')
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labelnames: Sequence[str], labels: Dict[str, Any]) -> LabelKey:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {list(labelnames)}, got {sorted(labels)}")
+    return tuple((name, str(labels[name])) for name in labelnames)
+
+
+class Counter:
+    """Monotonic counter with labels"""
+    type = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{'labels': dict(key), 'value': value} for key, value in self._values.items()]
+
+
+class Histogram:
+    """Histogram with fixed buckets and labels"""
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values: Dict[LabelKey, List[float]] = {}  # per-bucket counts (+Inf last), sum
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                index = i
+                break
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            counts[index] += 1
+            counts[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the with-block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def samples(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{'labels': dict(key), 'counts': counts[:-1], 'sum': counts[-1]}
+                    for key, counts in self._values.items()]
+
+
+class MetricsRegistry:
+    """Named collection of counters and histograms"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def reset(self):
+        """Clear all values (metrics stay registered)"""
+        for metric in list(self._metrics.values()):
+            metric.reset()
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-serialisable copy of all metrics"""
+        snapshot = {}
+        for name, metric in list(self._metrics.items()):
+            entry = {'type': metric.type, 'help': metric.documentation, 'samples': metric.samples()}
+            if metric.type == 'histogram':
+                entry['buckets'] = list(metric.buckets)
+            snapshot[name] = entry
+        return snapshot
+
+
+def with_labels(snapshot: Dict[str, Any], **labels) -> Dict[str, Any]:
+    """Copy of a snapshot with extra labels on every sample"""
+    return {
+        name: {**entry, 'samples': [{**sample, 'labels': {**sample['labels'], **labels}}
+                                    for sample in entry['samples']]}
+        for name, entry in snapshot.items()
+    }
+
+
+def merge_snapshots(snapshots: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Add up snapshots, e.g. of all job worker processes"""
+    merged: Dict[str, Any] = {}
+    for snapshot in snapshots:
+        for name, entry in snapshot.items():
+            target = merged.setdefault(name, {**entry, 'samples': []})
+            if target['type'] != entry['type'] or target.get('buckets') != entry.get('buckets'):
+                continue  # Incompatible definition (e.g. from an older version)
+            index = {tuple(sorted(s['labels'].items())): s for s in target['samples']}
+            for sample in entry['samples']:
+                key = tuple(sorted(sample['labels'].items()))
+                existing = index.get(key)
+                if existing is None:
+                    copy = {**sample, 'counts': list(sample['counts'])} if 'counts' in sample else dict(sample)
+                    target['samples'].append(copy)
+                    index[key] = copy
+                elif 'counts' in sample:
+                    existing['counts'] = [a + b for a, b in zip(existing['counts'], sample['counts'])]
+                    existing['sum'] += sample['sum']
+                else:
+                    existing['value'] += sample['value']
+    return merged
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render_prometheus(snapshot: Dict[str, Any]) -> str:
+    """Prometheus text exposition format (version 0.0.4)"""
+    lines = []
+    for name, entry in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {entry['help']}")
+        lines.append(f"# TYPE {name} {entry['type']}")
+        for sample in entry['samples']:
+            labels = sample['labels']
+            if entry['type'] == 'counter':
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(sample['value'])}")
+                continue
+            cumulative = 0.0
+            bounds = [str(b) for b in entry['buckets']] + ['+Inf']
+            for bound, count in zip(bounds, sample['counts']):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels({**labels, 'le': bound})} {_format_value(cumulative)}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(sample['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {_format_value(cumulative)}")
+    return '\n'.join(lines) + '\n'
+
+
+def histogram_quantile(q: float, buckets: Sequence[float], counts: Sequence[float]) -> Optional[float]:
+    """Estimate a quantile from bucket counts by linear interpolation (like PromQL)"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0.0
+    lower = 0.0
+    for i, count in enumerate(counts):
+        upper = buckets[i] if i < len(buckets) else buckets[-1]
+        if cumulative + count >= rank and count:
+            if i >= len(buckets):
+                return buckets[-1]  # In the +Inf bucket: the best known bound
+            return lower + (upper - lower) * (rank - cumulative) / count
+        cumulative += count
+        lower = upper
+    return buckets[-1]
+
+
+def stage_summary(snapshot: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Per-stage count, total and mean time, estimated p50/p95 and share of the timed total"""
+    entry = snapshot.get('pipeline_stage_seconds')
+    if not entry:
+        return {}
+    stages = {}
+    for sample in entry['samples']:
+        count = sum(sample['counts'])
+        stages[sample['labels']['stage']] = {
+            'count': int(count),
+            'total_seconds': round(sample['sum'], 4),
+            'mean_ms': round(sample['sum'] / count * 1000, 2) if count else None,
+            'p50_ms': _ms(histogram_quantile(0.5, entry['buckets'], sample['counts'])),
+            'p95_ms': _ms(histogram_quantile(0.95, entry['buckets'], sample['counts'])),
+        }
+    timed = sum(stage['total_seconds'] for stage in stages.values())
+    for stage in stages.values():
+        stage['share'] = round(stage['total_seconds'] / timed, 3) if timed else None
+    return dict(sorted(stages.items(), key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES)))
+
+
+def _ms(seconds: Optional[float]) -> Optional[float]:
+    return round(seconds * 1000, 2) if seconds is not None else None
+
+
+def counter_totals(snapshot: Dict[str, Any], name: str, label: str) -> Dict[str, float]:
+    """Values of a counter summed per value of one label"""
+    totals: Dict[str, float] = {}
+    for sample in snapshot.get(name, {}).get('samples', []):
+        key = sample['labels'].get(label, '')
+        totals[key] = totals.get(key, 0.0) + sample['value']
+    return totals
+
+
+def write_run_summary(path: str, snapshot: Dict[str, Any], wall_seconds: float, **details) -> str:
+    """Write the per-run metrics summary (JSON) and return its path"""
+    summary = {
+        **details,
+        'wall_seconds': round(wall_seconds, 3),
+        'stages': stage_summary(snapshot),
+        'requests': counter_totals(snapshot, 'pipeline_api_requests_total', 'outcome'),
+        'retries': counter_totals(snapshot, 'pipeline_api_retries_total', 'error_class'),
+        'tokens': counter_totals(snapshot, 'pipeline_tokens_total', 'kind'),
+        'tasks': counter_totals(snapshot, 'pipeline_tasks_total', 'outcome'),
+        'prompt_tokens_saved': sum(s['value'] for s in
+                                   snapshot.get('pipeline_prompt_tokens_saved_total', {}).get('samples', [])),
+        'endpoints': {
+            f"{s['labels']['endpoint']}.{s['labels']['outcome']}": s['value']
+            for s in snapshot.get('pipeline_endpoint_requests_total', {}).get('samples', [])
+        },
+        'cache': {
+            f"{s['labels']['cache']}.{s['labels']['result']}": s['value']
+            for s in snapshot.get('pipeline_cache_lookups_total', {}).get('samples', [])
+        },
+        'metrics': snapshot,
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=2)
+    return path
+
+
+# Process-wide registry used by the pipeline
+METRICS = MetricsRegistry()
+
+STAGE_SECONDS = METRICS.histogram('pipeline_stage_seconds', 'Time spent per pipeline stage', ['stage'])
+API_REQUESTS = METRICS.counter('pipeline_api_requests_total', 'Chat completion requests by outcome', ['outcome'])
+API_RETRIES = METRICS.counter('pipeline_api_retries_total', 'Retried API calls by error class', ['error_class'])
+TOKENS = METRICS.counter('pipeline_tokens_total', 'Tokens reported by the API', ['kind'])
+CACHE_LOOKUPS = METRICS.counter('pipeline_cache_lookups_total', 'Cache lookups by cache and result',
+                                ['cache', 'result'])
+TASKS = METRICS.counter('pipeline_tasks_total', 'Finished classification tasks by outcome', ['outcome'])
+ENDPOINT_REQUESTS = METRICS.counter('pipeline_endpoint_requests_total', 'HTTP attempts per API endpoint by outcome',
+                                    ['endpoint', 'outcome'])
+ENDPOINT_EJECTIONS = METRICS.counter('pipeline_endpoint_ejections_total',
+                                     'API endpoints taken out of rotation after failures', ['endpoint'])
+PROMPT_TOKENS_SAVED = METRICS.counter('pipeline_prompt_tokens_saved_total',
+                                      'Estimated prompt tokens saved by description cleaning')
+
+
+def time_stage(stage: str):
+    """Context manager timing one pipeline stage"""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def count_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.inc(cache=cache, result='hit' if hit else 'miss')
@@ -0,0 +1,150 @@
+"""
+Compact in-memory store of a run's classification results
+
+A run used to keep one ProcessingResult per (entry, category) task until
+the results file was written: a pydantic object with its own title,
+description, category and value fields, about 1 KB per result before the
+reasoning. With 66 categories per entry, that overhead dominates the
+memory of a large run. ResultStore keeps the same results in columns
+instead:
+- entries (title, description) are stored once, in order of their first
+  result, and referenced by an integer id; like the results file, one
+  title is one entry
+- categories and values are dictionary-encoded: each distinct string is
+  stored once and results hold its integer code
+- entry ids, category codes and value codes live in `array` columns,
+  confidences in a float array; reasoning texts in a list (they are
+  mostly unique, and empty reasonings share one string)
+
+That is about 30 bytes per result plus its reasoning text. to_frame()
+builds the wide results layout (one row per entry, ai_/confidence_/
+reasoning_ columns per category) with numpy fancy indexing instead of
+grouping result objects by title. Iterating a store yields
+ProcessingResult-like records for code that works on single results.
+"""
+
+from array import array
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class StoredResult(NamedTuple):
+    """One result read back from a store (same fields as ProcessingResult)"""
+    title: str
+    description: str
+    category: str
+    ai_code: str
+    confidence: float
+    reasoning: str
+
+
+class ResultStore:
+    """Append-only, column-oriented classification results"""
+
+    def __init__(self):
+        self.titles: List[str] = []
+        self.descriptions: List[str] = []
+        self.categories: List[str] = []
+        self.values: List[str] = []
+        self._entry_ids: Dict[str, int] = {}
+        self._category_codes: Dict[str, int] = {}
+        self._value_codes: Dict[str, int] = {}
+        self._entries = array('i')
+        self._category_column = array('i')
+        self._value_column = array('i')
+        self._confidences = array('d')
+        self._reasonings: List[str] = []
+
+    @classmethod
+    def from_results(cls, results: Iterable[Any]) -> 'ResultStore':
+        """Store holding the given results (ProcessingResult objects or a store)"""
+        if isinstance(results, cls):
+            return results
+        store = cls()
+        for result in results:
+            store.append(result)
+        return store
+
+    @staticmethod
+    def _code(value: str, codes: Dict[str, int], values: List[str]) -> int:
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    def add(self, title: str, description: str, category: str, ai_code: str, confidence: float,
+            reasoning: str) -> None:
+        """Store one result; the first description stored for a title is kept"""
+        entry = self._entry_ids.get(title)
+        if entry is None:
+            entry = self._entry_ids[title] = len(self.titles)
+            self.titles.append(title)
+            self.descriptions.append(description)
+        self._entries.append(entry)
+        self._category_column.append(self._code(category, self._category_codes, self.categories))
+        self._value_column.append(self._code(str(ai_code), self._value_codes, self.values))
+        self._confidences.append(float(confidence))
+        self._reasonings.append(reasoning or '')
+
+    def append(self, result: Any) -> None:
+        """Store a ProcessingResult (or any object with its fields)"""
+        self.add(result.title, result.description, result.category, result.ai_code, result.confidence,
+                 result.reasoning)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[StoredResult]:
+        for index in range(len(self._entries)):
+            entry = self._entries[index]
+            yield StoredResult(self.titles[entry], self.descriptions[entry],
+                               self.categories[self._category_column[index]],
+                               self.values[self._value_column[index]],
+                               self._confidences[index], self._reasonings[index])
+
+    def to_frame(self, transform_value: Optional[Callable[[str], str]] = None) -> 'pd.DataFrame':
+        """
+        One row per entry with ai_/confidence_/reasoning_ columns per category
+
+        Categories are sorted by name. Values go through `transform_value`
+        once per distinct value; confidences are formatted with two
+        decimals. A task without a result leaves its cells empty (NaN), and
+        if a task has several results the last one counts.
+        """
+        import numpy as np
+        import pandas as pd
+
+        rows, columns = len(self.titles), len(self.categories)
+        entries = np.frombuffer(self._entries, dtype=np.int32) if len(self) else np.zeros(0, dtype=np.int32)
+        categories = (np.frombuffer(self._category_column, dtype=np.int32) if len(self)
+                      else np.zeros(0, dtype=np.int32))
+
+        # Code grids; -1 picks the NaN appended to each lookup table
+        value_grid = np.full((rows, columns), -1, dtype=np.int32)
+        value_grid[entries, categories] = np.frombuffer(self._value_column, dtype=np.int32)
+        transform = transform_value or str
+        value_lookup = np.array([transform(value) for value in self.values] + [np.nan], dtype=object)
+
+        result_grid = np.full((rows, columns), -1, dtype=np.int64)
+        result_grid[entries, categories] = np.arange(len(self), dtype=np.int64)
+        confidence_lookup = np.array([f"{confidence:.2f}" for confidence in self._confidences] + [np.nan],
+                                     dtype=object)
+        reasoning_lookup = np.array(self._reasonings + [np.nan], dtype=object)
+
+        order = sorted(range(columns), key=self.categories.__getitem__)
+        names = [self.categories[code] for code in order]
+        values = value_lookup[value_grid[:, order]]
+        confidences = confidence_lookup[result_grid[:, order]]
+        reasonings = reasoning_lookup[result_grid[:, order]]
+
+        frame: Dict[str, Any] = {
+            'title': self.titles,
+            'description': [' '.join(description.replace('\n', ' ').split()) for description in self.descriptions],
+        }
+        for prefix, grid in (('ai_', values), ('confidence_', confidences), ('reasoning_', reasonings)):
+            for position, name in enumerate(names):
+                frame[f'{prefix}{name}'] = grid[:, position]
+        return pd.DataFrame(frame, columns=list(frame))
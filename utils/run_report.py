@@ -0,0 +1,148 @@
+"""
+Per-run usage report for the classification pipeline
+
+The classifier keeps one call record per (entry, category) task: model,
+prompt/completion/cached tokens summed over all attempts, the number of
+attempts and the latency of the call including retries and, in value-only
+mode, the follow-up call for the reasoning. After a run the records are
+written next to the results file:
+- <results>_calls.csv:   one row per call
+- <results>_report.json: totals, per-category and per-endpoint breakdown,
+                         cost and p50/p95/p99 latency
+
+Prices are USD per million tokens and come from CONFIG['gpt']['prices']
+(DEFAULT_PRICES unless configured otherwise). A model is priced by the
+longest configured name it starts with, so dated snapshots such as
+'gpt-4o-2024-08-06' use the 'gpt-4o' price.
+"""
+
+import csv
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+# Columns of the per-call CSV, in order
+CALL_FIELDS = ('title', 'category', 'model', 'success', 'attempts', 'latency_seconds',
+               'prompt_tokens', 'completion_tokens', 'cached_tokens', 'endpoint', 'followup_calls')
+
+LATENCY_PERCENTILES = (50, 95, 99)
+
+# USD per million tokens; 'cached_input' defaults to the 'input' price
+DEFAULT_PRICES = {
+    'gpt-4': {'input': 30.00, 'output': 60.00},
+    'gpt-4-turbo': {'input': 10.00, 'output': 30.00},
+    'gpt-4o': {'input': 2.50, 'cached_input': 1.25, 'output': 10.00},
+    'gpt-4o-mini': {'input': 0.15, 'cached_input': 0.075, 'output': 0.60},
+    'gpt-3.5-turbo': {'input': 0.50, 'output': 1.50},
+}
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Nearest-rank percentile of an ascending list of numbers"""
+    if not values:
+        return 0.0
+    rank = max(int(round(p / 100.0 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def price_for(model: str, prices: Dict[str, Dict[str, float]]) -> Optional[Dict[str, float]]:
+    """Price entry of the longest configured model name that `model` starts with"""
+    matches = [name for name in prices if model == name or model.startswith(name + '-')]
+    return prices[max(matches, key=len)] if matches else None
+
+
+def call_cost(record: Dict[str, Any], prices: Dict[str, Dict[str, float]]) -> Optional[float]:
+    """Cost of one call in USD, or None if its model has no configured price"""
+    price = price_for(record['model'], prices)
+    if price is None:
+        return None
+    cached = min(record['cached_tokens'], record['prompt_tokens'])
+    uncached = record['prompt_tokens'] - cached
+    return (uncached * price['input']
+            + cached * price.get('cached_input', price['input'])
+            + record['completion_tokens'] * price['output']) / 1_000_000
+
+
+def _summarise(records: List[Dict[str, Any]], costs: List[Optional[float]]) -> Dict[str, Any]:
+    latencies = sorted(record['latency_seconds'] for record in records)
+    calls = len(records)
+    attempts = sum(record['attempts'] for record in records)
+    followups = sum(record.get('followup_calls', 0) for record in records)
+    priced = [cost for cost in costs if cost is not None]
+    summary = {
+        'calls': calls,
+        'failed': sum(1 for record in records if not record['success']),
+        'attempts': attempts,
+        'retries': attempts - followups - sum(1 for record in records if record['attempts']),
+        'followup_calls': followups,
+        'prompt_tokens': sum(record['prompt_tokens'] for record in records),
+        'completion_tokens': sum(record['completion_tokens'] for record in records),
+        'cached_tokens': sum(record['cached_tokens'] for record in records),
+        'cost_usd': round(sum(priced), 6),
+        'unpriced_calls': len(costs) - len(priced),
+        'latency_ms': {
+            **{f'p{p}': round(percentile(latencies, p) * 1000, 1) for p in LATENCY_PERCENTILES},
+            'mean': round(sum(latencies) / calls * 1000, 1) if calls else 0.0,
+            'max': round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+    }
+    summary['cost_per_call_usd'] = round(summary['cost_usd'] / calls, 8) if calls else 0.0
+    return summary
+
+
+def build_run_report(records: Iterable[Dict[str, Any]], prices: Dict[str, Dict[str, float]],
+                     **details) -> Dict[str, Any]:
+    """Totals, per-category (most expensive first) and per-endpoint breakdown of a run's call records"""
+    records = list(records)
+    costs = [call_cost(record, prices) for record in records]
+
+    def breakdown(key: str) -> Dict[str, Dict[str, Any]]:
+        groups: Dict[str, List[int]] = {}
+        for index, record in enumerate(records):
+            groups.setdefault(record.get(key) or '', []).append(index)
+        return {name: _summarise([records[i] for i in indices], [costs[i] for i in indices])
+                for name, indices in groups.items()}
+
+    categories = breakdown('category')
+    models = sorted({record['model'] for record in records})
+    return {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        **details,
+        'models': models,
+        'unpriced_models': [model for model in models if price_for(model, prices) is None],
+        'totals': _summarise(records, costs),
+        'categories': dict(sorted(categories.items(), key=lambda item: -item[1]['cost_usd'])),
+        'endpoints': breakdown('endpoint'),
+        'prices_per_million_tokens': {model: price_for(model, prices) for model in models},
+    }
+
+
+def write_calls_csv(path: str, records: Iterable[Dict[str, Any]]) -> str:
+    """Write the per-call records as CSV and return its path"""
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CALL_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(records)
+    return path
+
+
+def read_calls_csv(path: str) -> List[Dict[str, Any]]:
+    """Read per-call records written by write_calls_csv"""
+    with open(path, 'r', encoding='utf-8', newline='') as f:
+        return [{
+            **row,
+            'success': row['success'] == 'True',
+            'attempts': int(row['attempts']),
+            'latency_seconds': float(row['latency_seconds']),
+            'prompt_tokens': int(row['prompt_tokens']),
+            'completion_tokens': int(row['completion_tokens']),
+            'cached_tokens': int(row['cached_tokens']),
+            'followup_calls': int(row.get('followup_calls') or 0),  # Missing in reports of older runs
+        } for row in csv.DictReader(f)]
+
+
+def write_run_report(path: str, report: Dict[str, Any]) -> str:
+    """Write a run report built by build_run_report (JSON) and return its path"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    return path
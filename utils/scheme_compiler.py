@@ -0,0 +1,408 @@
+"""
+Compiler for coding schemes
+
+Parsing the coding scheme YAML, validating every category and working out
+category order, value enumerations and conditions used to happen on every
+pipeline start and page load. compile_scheme() does this work once and
+writes a versioned binary artifact next to the YAML file;
+load_compiled_scheme() returns it with a single unpickling and recompiles
+automatically when the YAML file changes.
+
+Artifact contents:
+- format_version: ARTIFACT_FORMAT_VERSION
+- source:         fingerprint (path, mtime, size, sha256) of the YAML file
+- version:        scheme version
+- order:          category keys sorted by their numeric display prefix
+- categories:     per key display_name, simplified_name, criteria, examples,
+                  values, value_type, value_options, max_tokens,
+                  reasoning_sentences, condition (with the category keys it
+                  refers to), sort_key, listed, selectable and derived
+- aliases:        explicit simplified_name -> category key
+
+max_tokens and reasoning_sentences are the completion budget of a
+classification call and the length of the reasoning it asks for. They
+follow from the value type (OUTPUT_BUDGETS): a binary answer needs far
+fewer tokens than a list of universities. A category in the YAML can set
+either one itself.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from utils.metrics import count_cache
+
+# Bump when the artifact layout changes; older artifacts are recompiled
+ARTIFACT_FORMAT_VERSION = 2
+
+ARTIFACT_SUFFIX = '.compiled'
+
+# libyaml-backed loader when available (several times faster than pure Python)
+YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+# Option codes such as (1), (-99), (L), (HAW); other parentheses are part of the label
+OPTION_CODE = re.compile(r'^(.*?)\s*\((-?\d+|[A-Z]{1,4})\)\s*$')
+
+# Completion budget and reasoning length per value type, unless a category sets its own
+OUTPUT_BUDGETS = {
+    'binary': {'max_tokens': 150, 'reasoning_sentences': 1},      # 0/1 and a short reason
+    'enumerated': {'max_tokens': 250, 'reasoning_sentences': 2},  # One or more options of a list
+    'open': {'max_tokens': 800, 'reasoning_sentences': 2},        # Free text, e.g. names or lists of universities
+}
+BUDGET_OVERRIDES = ('max_tokens', 'reasoning_sentences')
+
+logger = logging.getLogger('scheme_compiler')
+
+
+def get_category_sort_key(display_name):
+    """
+    Convert category name like '3.5' or '3.1.2' or '2.0b' or '2.0.1' into a tuple of numbers for proper sorting
+    Example: '3.5' -> (3, 5, 0)
+            '3.1.2' -> (3, 1, 2)
+            '3.1' -> (3, 1, 0)
+            '2.0b' -> (2, 0, 0, 'b')  # Letter suffix preserved for sorting
+            '2.0.1' -> (2, 0, 1)  # Handle subcategories
+    """
+    # Extract the numeric part at the start of the display name
+    parts = display_name.split()
+    if not parts:
+        return (999, 999, 999, '')  # Handle empty strings
+
+    # Get the first part which should be the number (e.g., "2.6.5" or "3.5" or "2.0b" or "2.0.1")
+    number_part = parts[0]
+
+    # Split by dots
+    number_sections = number_part.split('.')
+
+    # Initialize numbers list and letter suffix
+    numbers = []
+    letter_suffix = ''
+
+    try:
+        # Process each section
+        for section in number_sections:
+            # Check if section contains letters
+            numeric_part = ''.join(c for c in section if c.isdigit())
+            letter_part = ''.join(c for c in section if c.isalpha())
+
+            if numeric_part:
+                numbers.append(int(numeric_part))
+            if letter_part:
+                letter_suffix = letter_part
+
+        # Pad with zeros if needed
+        while len(numbers) < 3:
+            numbers.append(0)
+
+        # Return tuple with numbers and letter suffix
+        return tuple(numbers[:3]) + (letter_suffix,)
+    except Exception:
+        return (999, 999, 999, '')
+
+
+def is_parent_category_2x(category_key, details):
+    """True if this is a 2.x section header (2.1-2.6) - not selectable. 2.0a and 2.0b are selectable."""
+    # Method 1: Check condition.range_start - section headers have range_start "2.1.1", "2.2.1", etc.
+    # (coding_scheme.yml from fix_yaml_format strips display_name, so we need this)
+    cond = details.get('condition') or {}
+    range_start = cond.get('range_start', '')
+    rs = str(range_start)
+    # Handle both "2.1.1" (string) and 2.11 (float if YAML parses 2.1.1 oddly)
+    if rs in ('2.1.1', '2.2.1', '2.3.1', '2.4.1', '2.5.1', '2.6.1'):
+        return True
+    if isinstance(range_start, (int, float)) and range_start in (2.11, 2.21, 2.31, 2.41, 2.51, 2.61):
+        return True
+    # Method 2: Check display_name prefix (coding_scheme_imported.yml keeps "2.1 Berufliches...")
+    display_name = details.get('display_name', '') or category_key
+    if not display_name:
+        return False
+    parts = str(display_name).split()
+    if not parts:
+        return False
+    numeric_prefix = parts[0]
+    if not numeric_prefix.startswith('2.'):
+        return False
+    if numeric_prefix.count('.') >= 2:
+        return False  # 2.0.1 etc. are selectable
+    if any(c.isalpha() for c in numeric_prefix[2:]):
+        return False  # 2.0a, 2.0b are selectable
+    return len(numeric_prefix) >= 3 and numeric_prefix[2:].isdigit()
+
+
+def filter_categories(scheme):
+    """Filter categories based on specific criteria"""
+    filtered_scheme = {}
+    categories_with_sort_keys = []
+
+    # Get categories from the new nested structure
+    categories = scheme.get('coding_scheme', {}).get('categories', {})
+
+    logger.info("Starting category filtering", extra={
+        'total_categories': len(categories),
+        'scheme_version': scheme.get('coding_scheme', {}).get('version', 'unknown')
+    })
+
+    for category, details in categories.items():
+        # Get the display name (or use the category key if display_name is not present)
+        display_name = details.get('display_name', category)
+
+        # Extract the numeric prefix from display_name
+        # Example: "1.0.1 Kursname" -> "1.0.1"
+        numeric_prefix = display_name.split()[0] if display_name else ""
+
+        # Include all categories, including derived ones
+        if numeric_prefix and any(c.isdigit() for c in numeric_prefix):
+            # Store category with its sort key
+            sort_key = get_category_sort_key(numeric_prefix)
+            categories_with_sort_keys.append((sort_key, category, details))
+            logger.debug("Category included", extra={
+                'category': category,
+                'display_name': display_name,
+                'numeric_prefix': numeric_prefix,
+                'sort_key': sort_key
+            })
+        else:
+            logger.debug("Category filtered out", extra={
+                'category': category,
+                'display_name': display_name,
+                'numeric_prefix': numeric_prefix,
+                'is_derived': category.startswith('_DERIVED_'),
+                'has_numeric': any(c.isdigit() for c in numeric_prefix) if numeric_prefix else False
+            })
+
+    # Sort categories based on their numeric parts and letter suffixes
+    categories_with_sort_keys.sort(key=lambda x: x[0])
+
+    # Create ordered dictionary
+    for _, category, details in categories_with_sort_keys:
+        filtered_scheme[category] = details
+
+    logger.info("Category filtering completed", extra={
+        'filtered_categories': len(filtered_scheme),
+        'removed_categories': len(categories) - len(filtered_scheme)
+    })
+
+    return filtered_scheme
+
+
+def simplify_category_name(name: str) -> str:
+    """Remove numbering pattern from category names (matches fix_yaml_format logic)."""
+    patterns = [
+        r'^\d+\.\d+\.?\d*\s*[a-z]?\s*',
+        r'^\.\d+\s*',
+        r'^\d+\s+'
+    ]
+    result = name
+    for pattern in patterns:
+        result = re.sub(pattern, '', result)
+    return result.strip() or name
+
+
+def parse_value_options(values: str) -> Tuple[str, List[Dict[str, Optional[str]]]]:
+    """
+    Parse a values field into its value type and options
+
+    Returns (value_type, options) where value_type is 'binary' (codes 0/1,
+    optionally -99), 'enumerated' or 'open', and options is a list of
+    {'label', 'code'} dicts (code is None for options without a code).
+    Condition text ("wenn ...", "sonst ...") is not part of the options.
+    """
+    options = []
+    for line in str(values).split('\n'):
+        # Drop condition text, e.g. "Ja (1) wenn min. eine der Kategorien ..."
+        line = re.split(r'\b(?:wenn|sonst)\b', line, maxsplit=1, flags=re.IGNORECASE)[0]
+        for part in re.split(r';|,|\s+oder\s+|^oder\s+', line):
+            part = part.strip().strip('"\'„“').strip()
+            if not part or part.lower() == 'oder':
+                continue
+            match = OPTION_CODE.match(part)
+            if match:
+                options.append({'label': match.group(1).strip(), 'code': match.group(2)})
+            elif part == '-99':
+                options.append({'label': part, 'code': part})
+            else:
+                options.append({'label': part, 'code': None})
+
+    codes = {option['code'] for option in options if option['code'] not in (None, '-99')}
+    coded = [option for option in options if option['code'] is not None]
+    if codes == {'0', '1'}:
+        return 'binary', options
+    if any(option['label'].lower().startswith('offen') for option in options) or not coded and len(options) <= 1:
+        return 'open', options
+    return 'enumerated', options
+
+
+def _numeric_prefix(display_name: str) -> str:
+    parts = str(display_name).split()
+    return parts[0] if parts and any(c.isdigit() for c in parts[0]) else ''
+
+
+def _resolve_condition(condition: Dict[str, Any], categories: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Copy of a condition with the category keys it refers to under 'resolved'"""
+    resolved = []
+    if condition.get('type') == 'any_in_range':
+        start, end = str(condition.get('range_start', '')), str(condition.get('range_end', ''))
+        depth = start.rstrip('.').count('.')
+        low, high = get_category_sort_key(start), get_category_sort_key(end)
+        for key, category in categories.items():
+            prefix = category['numeric_prefix'].rstrip('.')
+            if prefix and prefix.count('.') == depth and low <= category['sort_key'] <= high:
+                resolved.append(key)
+    elif condition.get('type') == 'equals':
+        # References look like "„1.2. anbieter“": match the name without numbering and quotes
+        reference = re.sub(r'[„“"]', '', str(condition.get('reference', '')))
+        reference = re.sub(r'^[\d.\s]+', '', reference).strip().lower()
+        resolved = [key for key, category in categories.items()
+                    if reference and category['simplified_name'].lower() == reference]
+    return {**condition, 'resolved': resolved}
+
+
+def _validate(data: Any) -> Dict[str, Any]:
+    """Check the scheme structure and return the coding_scheme section"""
+    if not isinstance(data, dict):
+        raise ValueError("YAML data must be a dictionary")
+    if 'coding_scheme' not in data:
+        raise ValueError("Missing 'coding_scheme' root object")
+    scheme_data = data['coding_scheme']
+    if not isinstance(scheme_data, dict):
+        raise ValueError("coding_scheme must be a dictionary")
+    if 'version' not in scheme_data:
+        raise ValueError("coding_scheme must have 'version' field")
+    if not isinstance(scheme_data.get('categories'), dict):
+        raise ValueError("coding_scheme must have a 'categories' dictionary")
+    for key, details in scheme_data['categories'].items():
+        if not isinstance(details, dict):
+            raise ValueError(f"Category {key} must be a dictionary")
+        for field, field_type in (('display_name', str), ('criteria', str), ('examples', list), ('values', str)):
+            if not isinstance(details.get(field), field_type):
+                raise ValueError(f"Category {key}: '{field}' must be a {field_type.__name__}")
+        if not all(isinstance(example, str) for example in details['examples']):
+            raise ValueError(f"Category {key}: examples must be strings")
+        for field in BUDGET_OVERRIDES:
+            value = details.get(field)
+            if value is not None and (not isinstance(value, int) or isinstance(value, bool) or value < 1):
+                raise ValueError(f"Category {key}: '{field}' must be a positive integer")
+    return scheme_data
+
+
+def fingerprint(path: str, content: Optional[bytes] = None) -> Dict[str, Any]:
+    """Identify a file version by path, mtime, size and content hash"""
+    stat = os.stat(path)
+    if content is None:
+        with open(path, 'rb') as file:
+            content = file.read()
+    return {
+        'path': os.path.abspath(path),
+        'mtime_ns': stat.st_mtime_ns,
+        'size': stat.st_size,
+        'sha256': hashlib.sha256(content).hexdigest()
+    }
+
+
+def compile_scheme(path: str) -> Dict[str, Any]:
+    """Parse and validate a coding scheme YAML file into the artifact structure"""
+    with open(path, 'rb') as file:
+        content = file.read()
+    data = yaml.load(content.decode('utf-8'), Loader=YAML_LOADER)
+    scheme_data = _validate(data)
+
+    categories = {}
+    aliases = {}
+    for key, details in scheme_data['categories'].items():
+        display_name = details['display_name']
+        value_type, value_options = parse_value_options(details['values'])
+        numeric_prefix = _numeric_prefix(display_name)
+        categories[key] = {
+            'display_name': display_name,
+            'simplified_name': details.get('simplified_name') or simplify_category_name(display_name),
+            'criteria': details['criteria'],
+            'examples': list(details['examples']),
+            'values': details['values'],
+            'value_type': value_type,
+            'value_options': value_options,
+            **{field: details.get(field) or OUTPUT_BUDGETS[value_type][field] for field in BUDGET_OVERRIDES},
+            'condition': details.get('condition'),
+            'numeric_prefix': numeric_prefix,
+            'sort_key': get_category_sort_key(numeric_prefix),
+            'listed': bool(numeric_prefix),
+            'selectable': not is_parent_category_2x(key, details),
+            'derived': key.startswith('_DERIVED_')
+        }
+        if 'simplified_name' in details:
+            aliases[details['simplified_name']] = key
+
+    for category in categories.values():
+        if isinstance(category['condition'], dict):
+            category['condition'] = _resolve_condition(category['condition'], categories)
+
+    return {
+        'format_version': ARTIFACT_FORMAT_VERSION,
+        'source': fingerprint(path, content),
+        'version': str(scheme_data['version']),
+        'order': list(filter_categories(data)),
+        'categories': categories,
+        'aliases': aliases
+    }
+
+
+def artifact_path(path: str) -> str:
+    return path + ARTIFACT_SUFFIX
+
+
+def _is_current(artifact: Any, path: str) -> bool:
+    if not isinstance(artifact, dict) or artifact.get('format_version') != ARTIFACT_FORMAT_VERSION:
+        return False
+    stat = os.stat(path)
+    source = artifact['source']
+    return (source['path'] == os.path.abspath(path)
+            and source['mtime_ns'] == stat.st_mtime_ns
+            and source['size'] == stat.st_size)
+
+
+def load_compiled_scheme(path: str, write: bool = True) -> Dict[str, Any]:
+    """
+    Return the compiled artifact of a coding scheme YAML file
+
+    The artifact next to the YAML file is used if it matches the file's
+    current mtime and size; otherwise the scheme is compiled again and
+    (if write is set and the directory is writable) the artifact replaced.
+    """
+    compiled_path = artifact_path(path)
+    try:
+        with open(compiled_path, 'rb') as file:
+            artifact = pickle.load(file)
+        if _is_current(artifact, path):
+            count_cache('scheme_artifact', hit=True)
+            return artifact
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"Ignoring unreadable scheme artifact {compiled_path}: {str(e)}")
+
+    count_cache('scheme_artifact', hit=False)
+    artifact = compile_scheme(path)
+    if write:
+        tmp_path = f"{compiled_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as file:
+                pickle.dump(artifact, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, compiled_path)
+            logger.info("Compiled coding scheme", extra={'path': path, 'artifact': compiled_path,
+                                                         'categories': len(artifact['categories'])})
+        except OSError as e:
+            logger.warning(f"Could not write scheme artifact {compiled_path}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return artifact
+
+
+def source_outdated(path: str, docx_path: Optional[str]) -> bool:
+    """True if the DOCX the YAML file is generated from has changed since (or the YAML is missing)"""
+    if not os.path.exists(path):
+        return True
+    return bool(docx_path) and os.path.exists(docx_path) and os.path.getmtime(docx_path) > os.path.getmtime(path)
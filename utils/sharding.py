@@ -0,0 +1,240 @@
+"""
+Deterministic sharding of pipeline runs, and merging of shard outputs
+
+`python run_pipeline.py --shard i/N` processes only the entries whose key
+hashes to shard i (1-based) of N. The key is the entry title: results are
+written one row per title, so entries with the same title always land in
+the same shard. The hash is SHA-1 based, so every machine computes the same
+partition without coordination.
+
+A sharded run writes its results file with a `_shard<i>of<N>` suffix and a
+manifest (`<results>_shard.json`) listing the shard, the dataset fingerprint,
+the categories and the titles assigned to it. `python run_pipeline.py merge`
+combines the results files of all shards into one results file and one run
+report, and checks that:
+- every shard 1..N is present exactly once, for the same dataset and categories
+- no title appears in more than one shard
+- every assigned (title, category) task has a result
+"""
+
+import hashlib
+import json
+import os
+import re
+from collections import Counter
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Sequence, Tuple
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+SHARD_PATTERN = re.compile(r'^\s*(\d+)\s*/\s*(\d+)\s*$')
+
+# Examples of missing or duplicated tasks listed in the merge report
+MAX_EXAMPLES = 20
+
+
+def parse_shard(value: str) -> Tuple[int, int]:
+    """Parse 'i/N' into (i, N) with 1 <= i <= N"""
+    match = SHARD_PATTERN.match(value or '')
+    if not match:
+        raise ValueError(f"Shard must look like i/N (e.g. 2/8), got {value!r}")
+    index, count = int(match.group(1)), int(match.group(2))
+    if not 1 <= index <= count:
+        raise ValueError(f"Shard index must be between 1 and {count}, got {index}")
+    return index, count
+
+
+def shard_of(key: str, count: int) -> int:
+    """Shard (1-based) of an entry key"""
+    digest = hashlib.sha1(key.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count + 1
+
+
+def select_shard(dataset: 'pd.DataFrame', index: int, count: int) -> 'pd.DataFrame':
+    """Rows of a dataset whose title hashes to the given shard"""
+    keys = dataset['title'].astype(str)
+    mask = keys.map(lambda key: shard_of(key, count) == index)
+    return dataset[mask.to_numpy(dtype=bool)]
+
+
+def shard_suffix(index: int, count: int) -> str:
+    return f'_shard{index}of{count}'
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run_file(results_path: str, kind: str) -> str:
+    """Path of a file written next to a results file, e.g. run_file(path, 'report') for <results>_report.json"""
+    base = os.path.splitext(results_path)[0]
+    return f'{base}_calls.csv' if kind == 'calls' else f'{base}_{kind}.json'
+
+
+def write_shard_manifest(results_path: str, index: int, count: int, dataset_path: str,
+                         categories: Sequence[str], titles: Iterable[str], **details) -> str:
+    """Write the manifest of a shard's run next to its results file and return its path"""
+    manifest = {
+        'shard': index,
+        'shards': count,
+        'results_file': os.path.basename(results_path),
+        'dataset': os.path.basename(dataset_path),
+        'dataset_sha256': file_sha256(dataset_path),
+        'categories': list(dict.fromkeys(categories)),
+        **details,
+        'titles': sorted(set(titles)),
+    }
+    path = run_file(results_path, 'shard')
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    return path
+
+
+def _results_path(path: str) -> str:
+    """Accept a shard's results file or any file written next to it"""
+    if path.endswith('.xlsx'):
+        return path
+    base = re.sub(r'_(shard|report|metrics)\.json$|_calls\.csv$', '', path)
+    return base + '.xlsx'
+
+
+def _column_order(columns: Iterable[str]) -> List[str]:
+    """title, description, then ai_/confidence_/reasoning_ columns sorted by category (as in save_results)"""
+    columns = list(columns)
+    ordered = ['title', 'description']
+    for prefix in ('ai_', 'confidence_', 'reasoning_'):
+        ordered += sorted(c for c in columns if c.startswith(prefix))
+    return ordered + [c for c in columns if c not in ordered]
+
+
+def check_shards(manifests: List[Dict[str, Any]], frames: List['pd.DataFrame']) -> Dict[str, Any]:
+    """Compare the shards' results with their manifests; problems are listed under 'problems'"""
+    problems = []
+    counts = sorted({m['shards'] for m in manifests})
+    if len(counts) > 1:
+        problems.append(f"Shards were run with different shard counts: {counts}")
+    present = Counter(m['shard'] for m in manifests)
+    repeated_shards = sorted(index for index, n in present.items() if n > 1)
+    missing_shards = sorted(set(range(1, max(counts) + 1)) - set(present)) if counts else []
+    if repeated_shards:
+        problems.append(f"Shards given more than once: {repeated_shards}")
+    if missing_shards:
+        problems.append(f"Missing shards: {missing_shards}")
+    if len({m['dataset_sha256'] for m in manifests}) > 1:
+        problems.append("Shards were run on different datasets")
+    if len({tuple(m['categories']) for m in manifests}) > 1:
+        problems.append("Shards were run with different categories")
+
+    # A title may only have results in one shard
+    owners: Dict[str, List[int]] = {}
+    for manifest, frame in zip(manifests, frames):
+        for title in frame['title'].astype(str):
+            owners.setdefault(title, []).append(manifest['shard'])
+    duplicated = sorted(title for title, shards in owners.items() if len(shards) > 1)
+    if duplicated:
+        problems.append(f"{len(duplicated)} titles have results in more than one shard")
+
+    # Every assigned (title, category) task needs a result
+    expected = present_tasks = 0
+    missing: List[Tuple[str, str]] = []
+    missing_count = 0
+    for manifest, frame in zip(manifests, frames):
+        titles = frame['title'].astype(str)
+        rows = frame.set_index(titles)
+        rows = rows[~rows.index.duplicated()]
+        assigned = manifest['titles']
+        expected += len(assigned) * len(manifest['categories'])
+        for category in manifest['categories']:
+            column = f'ai_{category}'
+            values = rows[column].reindex(assigned) if column in rows else None
+            if values is None:
+                lacking = list(assigned)
+            else:
+                lacking = [title for title, isna in zip(assigned, values.isna().to_numpy()) if isna]
+            present_tasks += len(assigned) - len(lacking)
+            missing_count += len(lacking)
+            missing += [(title, category) for title in lacking[:MAX_EXAMPLES - len(missing)]]
+    if missing_count:
+        problems.append(f"{missing_count} of {expected} tasks have no result")
+
+    return {
+        'shards': counts[-1] if counts else 0,
+        'shards_present': sorted(present),
+        'missing_shards': missing_shards,
+        'tasks_expected': expected,
+        'tasks_present': present_tasks,
+        'missing_tasks': missing_count,
+        'missing_task_examples': [{'title': t, 'category': c} for t, c in missing],
+        'duplicated_titles': len(duplicated),
+        'duplicated_title_examples': duplicated[:MAX_EXAMPLES],
+        'problems': problems,
+    }
+
+
+def merge_shards(paths: Sequence[str], output_path: str, prices: Dict[str, Dict[str, float]],
+                 allow_incomplete: bool = False) -> Dict[str, Any]:
+    """
+    Merge the results, call records and metrics of shard runs into one set of run files
+
+    Returns the merge check (see check_shards) with 'output' set to the
+    merged results file, or to None if problems were found and
+    allow_incomplete is not set.
+    """
+    import pandas as pd
+
+    from utils.metrics import merge_snapshots, write_run_summary
+    from utils.run_report import build_run_report, read_calls_csv, write_calls_csv, write_run_report
+
+    results_paths = list(dict.fromkeys(_results_path(p) for p in paths))
+    manifests = []
+    for path in results_paths:
+        manifest_path = run_file(path, 'shard')
+        if not os.path.exists(manifest_path):
+            raise FileNotFoundError(f"No shard manifest for {path} (expected {manifest_path})")
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifests.append(json.load(f))
+    frames = [pd.read_excel(path) for path in results_paths]
+
+    check = check_shards(manifests, frames)
+    check['inputs'] = [os.path.basename(path) for path in results_paths]
+    check['output'] = None
+    if check['problems'] and not allow_incomplete:
+        return check
+
+    # Results: one row per title, the first shard wins for duplicated titles
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.drop_duplicates(subset='title', keep='first')
+    merged = merged.reindex(columns=_column_order(merged.columns))
+    merged.to_excel(output_path, index=False)
+    check['output'] = output_path
+
+    # Run report from all call records, metrics summed over the shards
+    records = []
+    for path in results_paths:
+        if os.path.exists(run_file(path, 'calls')):
+            records += read_calls_csv(run_file(path, 'calls'))
+    snapshots, wall_seconds = [], 0.0
+    for path in results_paths:
+        if os.path.exists(run_file(path, 'metrics')):
+            with open(run_file(path, 'metrics'), 'r', encoding='utf-8') as f:
+                summary = json.load(f)
+            snapshots.append(summary['metrics'])
+            wall_seconds = max(wall_seconds, summary.get('wall_seconds', 0.0))
+    details = {
+        'results_file': os.path.basename(output_path),
+        'completed': not check['problems'],
+        'model': manifests[0].get('model') if manifests else None,
+        'entries': len(merged),
+        'tasks': check['tasks_present'],
+        'total_tasks': check['tasks_expected'],
+    }
+    write_calls_csv(run_file(output_path, 'calls'), records)
+    write_run_summary(run_file(output_path, 'metrics'), merge_snapshots(snapshots), wall_seconds, **details)
+    report = build_run_report(records, prices, wall_seconds=round(wall_seconds, 3), **details)
+    report['merge'] = {key: value for key, value in check.items() if key != 'output'}
+    write_run_report(run_file(output_path, 'report'), report)
+    return check
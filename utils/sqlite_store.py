@@ -0,0 +1,69 @@
+"""
+SQLite plumbing shared by the stores that several processes open at once
+
+The web job store (web_interface/job_store.py), the fair-share scheduler
+(utils/fair_share.py) and the work queue (utils/work_queue.py) keep their
+state in a SQLite file that gunicorn workers, job processes or pipeline
+workers on other machines use at the same time. SQLiteStore gives them:
+- one connection per thread and process, opened on first use: sqlite3
+  connections must not be shared between threads or carried across a fork
+- autocommit mode, so single statements commit on their own, and
+  _transaction() for the read-modify-write steps
+- the journal mode of the store: WAL where all users are on one machine
+  (readers do not wait for the writer), the rollback journal ('DELETE')
+  for files on network storage, where WAL's shared memory does not work
+
+Lock waits last up to BUSY_TIMEOUT seconds and block the calling thread;
+async callers run store methods in a worker thread (asyncio.to_thread).
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Callable, Optional, TypeVar
+
+T = TypeVar('T')
+
+
+class SQLiteStore:
+    """Base class of a store kept in one SQLite file shared between processes"""
+
+    JOURNAL_MODE = 'WAL'
+    BUSY_TIMEOUT = 30.0  # Seconds a statement waits for another process' lock
+
+    def __init__(self, path: str, schema: Optional[str] = None):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        if schema:
+            self._connection().executescript(schema)
+
+    def _connection(self) -> sqlite3.Connection:
+        """This thread's connection (a new one after a fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.BUSY_TIMEOUT, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute(f'PRAGMA journal_mode={self.JOURNAL_MODE}')
+            if self.JOURNAL_MODE == 'WAL':
+                conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _transaction(self, statements: Callable[[sqlite3.Connection], T], immediate: bool = True) -> T:
+        """
+        Run statements(conn) in one transaction and return its result
+
+        IMMEDIATE transactions take the write lock up front, so nothing read
+        inside them changes before their writes; plain ones only group writes.
+        """
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+        try:
+            result = statements(conn)
+            conn.execute('COMMIT')
+            return result
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
@@ -0,0 +1,217 @@
+"""
+Lightweight tracing for pipeline runs
+
+Spans form a tree per run: the run span, one span per entry, one per
+(entry, category) task and below it prompt build, rate-limit wait / retry
+backoff, every HTTP attempt and validation. The current span is tracked in
+a context variable, so nesting follows the asyncio task that opens spans.
+
+Finished spans are buffered and appended to a JSON-lines file in the
+OTLP/JSON encoding (one ExportTraceServiceRequest per line, as written by
+the OpenTelemetry collector's file exporter), which trace viewers such as
+Jaeger can import.
+
+Tracing is off unless a run starts the tracer with an exporter. While it is
+off, TRACER.span() returns a shared no-op span, so instrumented code pays
+for one attribute check per span and allocates nothing.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional
+
+# OTLP span kinds
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_CLIENT = 3
+
+# OTLP status code of failed spans (unset otherwise)
+STATUS_ERROR = 2
+
+SCOPE_NAME = 'ai-coding-pipeline'
+
+_current_span: ContextVar[Optional['Span']] = ContextVar('current_span', default=None)
+
+# Separate generator, so span ids don't consume seeded global random state
+_ids = random.Random(int.from_bytes(os.urandom(8), 'big'))
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    """OTLP AnyValue of a Python value"""
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{'key': key, 'value': _attribute_value(value)}
+            for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """A timed operation; use as a context manager, or call end() for spans without a block"""
+
+    __slots__ = ('tracer', 'name', 'kind', 'trace_id', 'span_id', 'parent_span_id', 'attributes',
+                 'start_ns', 'end_ns', 'error', '_token')
+
+    def __init__(self, tracer: 'Tracer', name: str, kind: int, attributes: Dict[str, Any]):
+        parent = _current_span.get()
+        self.tracer = tracer
+        self.name = name
+        self.kind = kind
+        self.trace_id = parent.trace_id if parent else f'{_ids.getrandbits(128):032x}'
+        self.span_id = f'{_ids.getrandbits(64):016x}'
+        self.parent_span_id = parent.span_id if parent else ''
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.error: Optional[str] = None
+        self._token = _current_span.set(self)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException) -> None:
+        """Mark the span as failed with the given exception"""
+        self.error = f'{type(error).__name__}: {error}'
+        self.attributes['error.type'] = type(error).__name__
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """Finish the span, make its parent current again and hand it to the exporter"""
+        if self.end_ns:
+            return
+        if error is not None:
+            self.record_error(error)
+        self.end_ns = time.time_ns()
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended in another context than it was started in; the parent stays current there
+            pass
+        self.tracer._export(self)
+
+    def __enter__(self) -> 'Span':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.end(exc)
+        return False
+
+    def to_otlp(self) -> Dict[str, Any]:
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_span_id,
+            'name': self.name,
+            'kind': self.kind,
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns),
+            'attributes': _attributes(self.attributes),
+            'status': {'code': STATUS_ERROR, 'message': self.error} if self.error else {},
+        }
+
+
+class _NoopSpan:
+    """Span handed out while tracing is off"""
+
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes) -> None:
+        pass
+
+    def record_error(self, error: BaseException) -> None:
+        pass
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        pass
+
+    def __enter__(self) -> '_NoopSpan':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class JsonLinesSpanExporter:
+    """Append finished spans to a file as OTLP/JSON lines, in batches"""
+
+    def __init__(self, path: str, resource: Optional[Dict[str, Any]] = None, batch_size: int = 512):
+        self.path = path
+        self.resource = {'service.name': SCOPE_NAME, 'process.pid': os.getpid(), **(resource or {})}
+        self.batch_size = batch_size
+        self._spans: List[Span] = []
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            self._spans.append(span)
+            if len(self._spans) < self.batch_size:
+                return
+            spans, self._spans = self._spans, []
+        self._write(spans)
+
+    def flush(self) -> None:
+        with self._lock:
+            spans, self._spans = self._spans, []
+        if spans:
+            self._write(spans)
+
+    def _write(self, spans: List[Span]) -> None:
+        request = {'resourceSpans': [{
+            'resource': {'attributes': _attributes(self.resource)},
+            'scopeSpans': [{'scope': {'name': SCOPE_NAME}, 'spans': [span.to_otlp() for span in spans]}],
+        }]}
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(request, ensure_ascii=False) + '\n')
+
+
+class Tracer:
+    """Creates spans while an exporter is set, no-op spans otherwise"""
+
+    def __init__(self):
+        self.exporter: Optional[JsonLinesSpanExporter] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start(self, exporter: JsonLinesSpanExporter) -> None:
+        self.exporter = exporter
+
+    def stop(self) -> None:
+        """Write out buffered spans and turn tracing off"""
+        exporter, self.exporter = self.exporter, None
+        if exporter is not None:
+            exporter.flush()
+
+    def span(self, name: str, kind: int = SPAN_KIND_INTERNAL, **attributes):
+        """Start a span as child of the current one; it ends with the `with` block or end()"""
+        if self.exporter is None:
+            return NOOP_SPAN
+        return Span(self, name, kind, attributes)
+
+    def _export(self, span: Span) -> None:
+        exporter = self.exporter
+        if exporter is not None:
+            exporter.export(span)
+
+
+# Process-wide tracer used by the pipeline
+TRACER = Tracer()
@@ -0,0 +1,147 @@
+"""
+Value-only classification: the value in one token, reasoning on demand
+
+A regular classification call asks for a JSON object with value,
+confidence and reasoning; most of its latency and output tokens go into
+the reasoning, and the confidence is a number the model writes down about
+itself. In value-only mode (CONFIG['gpt']['value_only']) a category whose
+values are numeric codes, e.g. 'Ja (1), Nein (0)', is classified by:
+
+1. one call that asks only for the code, with a few output tokens and
+   `logprobs` switched on. The value is the most likely allowed code at the
+   first answer token; its confidence is its probability divided by the
+   probability of all allowed codes there (value_from_logprobs)
+2. a follow-up call for the reasoning, only for the results that the
+   'explain' setting selects (needs_explanation): positives (any value but
+   0, in categories that have the code 0), uncertain results (confidence
+   below `uncertain_below`), both, all or none. The follow-up repeats the
+   first call's messages, so the prompt prefix can come from the API's
+   prompt cache.
+
+Categories without numeric codes (open text fields) keep the regular JSON
+call. So does every category if the API answers without logprobs.
+"""
+
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_SETTINGS = {
+    'enabled': False,                     # Ask only for the value; confidence from its logprobs
+    'explain': 'positive_or_uncertain',   # Follow-up reasoning for: all, positive, uncertain,
+                                          # positive_or_uncertain or none
+    'uncertain_below': 0.9,               # Confidence below which a result counts as uncertain
+}
+
+EXPLAIN_POLICIES = ('all', 'positive', 'uncertain', 'positive_or_uncertain', 'none')
+
+VALUE_MAX_TOKENS = 3       # The code, plus room for a leading space or quote
+TOP_LOGPROBS = 5           # Alternatives returned per token (the API allows up to 20)
+EXPLAIN_MAX_TOKENS = 200   # Length limit of a follow-up reasoning
+
+VALUE_CODE = re.compile(r'\((\d{1,3})\)')  # 'Ja (1), Nein (0)' -> 1, 0
+TOKEN_NOISE = ' \t\n"\'`.'  # Stripped from answer tokens before comparing them with the codes
+
+SYSTEM_MESSAGE = ("Du bist ein wissenschaftlicher Coder, spezialisiert auf strukturierte Daten. "
+                  "Bitte antworte nur mit dem Code des gewählten Werts.")
+VALUE_INSTRUCTION = ("\n\nAbweichend vom oben genannten Antwortformat: Antworte ausschließlich mit dem Code "
+                     "des gewählten Werts ({codes}), ohne JSON, Konfidenz oder Begründung.")
+EXPLAIN_INSTRUCTION = ("Begründe diese Wahl kurz in ein bis zwei Sätzen mit Bezug auf das Kriterium "
+                       "und die Ankerbeispiele.")
+
+
+class LogprobsUnavailable(Exception):
+    """The API answered without token logprobs, so value-only mode cannot rate the answer"""
+
+
+def value_codes(values: str) -> Optional[List[str]]:
+    """Allowed codes of a category's values, or None if it has fewer than two numeric codes"""
+    codes = list(dict.fromkeys(VALUE_CODE.findall(values or '')))
+    return codes if len(codes) >= 2 else None
+
+
+def value_messages(prompt: str, codes: List[str]) -> List[Dict[str, str]]:
+    """Messages of the value-only call"""
+    return [
+        {"role": "system", "content": SYSTEM_MESSAGE},
+        {"role": "user", "content": prompt + VALUE_INSTRUCTION.format(codes=', '.join(codes))},
+    ]
+
+
+def explain_messages(prompt: str, codes: List[str], value: str) -> List[Dict[str, str]]:
+    """Messages of the follow-up call asking why `value` was chosen"""
+    return value_messages(prompt, codes) + [
+        {"role": "assistant", "content": value},
+        {"role": "user", "content": EXPLAIN_INSTRUCTION},
+    ]
+
+
+def value_from_logprobs(tokens: List[Any], codes: List[str]) -> Tuple[str, float]:
+    """
+    Value and confidence from the logprobs of an answer
+
+    `tokens` are the answer's token logprobs (objects or dicts with token,
+    logprob and top_logprobs). The first token that is not just space or a
+    quote decides: among its alternatives, each allowed code gets the
+    probability of the tokens that spell it. Raises ValueError if no
+    allowed code is among them.
+    """
+    for token in tokens:
+        text = _field(token, 'token')
+        if not text.strip(TOKEN_NOISE):
+            continue
+        alternatives = list(_field(token, 'top_logprobs') or []) + [token]
+        probabilities: Dict[str, float] = {}
+        seen = set()
+        for alternative in alternatives:
+            alternative_text = _field(alternative, 'token')
+            if alternative_text in seen:
+                continue  # The chosen token is usually among its own top alternatives
+            seen.add(alternative_text)
+            code = alternative_text.strip(TOKEN_NOISE)
+            if code in codes:
+                probabilities[code] = probabilities.get(code, 0.0) + math.exp(_field(alternative, 'logprob'))
+        if not probabilities:
+            raise ValueError(f"Answer {text!r} is not one of the codes {', '.join(codes)}")
+        value = max(probabilities, key=probabilities.get)
+        return value, probabilities[value] / sum(probabilities.values())
+    raise ValueError("Answer holds no code")
+
+
+def validate_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Value-only settings merged over the defaults; raises ValueError if they are invalid
+
+    Called once when a classifier is created, so that e.g. a misspelt
+    'explain' policy stops the run before its first paid call.
+    """
+    settings = {**DEFAULT_SETTINGS, **(settings or {})}
+    if settings['explain'] not in EXPLAIN_POLICIES:
+        raise ValueError(f"Unknown 'explain' setting {settings['explain']!r}, "
+                         f"expected one of {', '.join(EXPLAIN_POLICIES)}")
+    uncertain_below = settings['uncertain_below']
+    if isinstance(uncertain_below, bool) or not isinstance(uncertain_below, (int, float)) \
+            or not 0 <= uncertain_below <= 1:
+        raise ValueError(f"'uncertain_below' must be a number between 0 and 1, got {uncertain_below!r}")
+    return settings
+
+
+def needs_explanation(value: str, confidence: float, codes: List[str], settings: Dict[str, Any]) -> bool:
+    """Whether a value-only result gets a follow-up call for its reasoning"""
+    policy = settings.get('explain', DEFAULT_SETTINGS['explain'])
+    positive = '0' in codes and value != '0'
+    uncertain = confidence < settings.get('uncertain_below', DEFAULT_SETTINGS['uncertain_below'])
+    choices = {
+        'all': True,
+        'positive': positive,
+        'uncertain': uncertain,
+        'positive_or_uncertain': positive or uncertain,
+        'none': False,
+    }
+    if policy not in choices:
+        raise ValueError(f"Unknown 'explain' setting {policy!r}, expected one of {', '.join(EXPLAIN_POLICIES)}")
+    return choices[policy]
+
+
+def _field(item: Any, name: str) -> Any:
+    return item.get(name) if isinstance(item, dict) else getattr(item, name)
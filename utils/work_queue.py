@@ -0,0 +1,283 @@
+"""
+Shared work queue of (entry, category) tasks for cooperative pipeline workers
+
+Static sharding (utils/sharding.py) fixes the split up front, so a slow or
+crashed node holds up its whole slice. With a work queue, any number of
+workers on one or many machines pull small batches of tasks instead:
+- claim():    take pending tasks, or tasks whose lease has expired, under a
+              time-limited lease
+- renew():    extend the leases of tasks still being worked on
+- complete(): store a task's result; idempotent, the first result wins
+- fail():     give a task back for another attempt, or mark it failed once
+              it has used up its attempts
+- release():  give back all tasks a worker still holds (clean shutdown)
+
+A worker that dies simply stops renewing; its tasks become claimable again
+when the lease runs out. Every claim counts as an attempt, so a task that
+keeps killing workers ends up 'failed' instead of circulating forever.
+
+WorkQueue defines the interface. SQLiteWorkQueue keeps the queue in one
+SQLite file, which may live on storage shared by several machines. It uses
+the rollback journal rather than WAL, because WAL needs shared memory and
+does not work on network file systems. Queue operations are short
+transactions on batches of tasks, so a single file serves many workers.
+"""
+
+import abc
+import json
+import os
+import socket
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from utils.sqlite_store import SQLiteStore
+
+TASK_STATES = ('pending', 'leased', 'done', 'failed')
+
+DEFAULT_LEASE_SECONDS = 300.0
+DEFAULT_MAX_ATTEMPTS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue_meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    entry_index INTEGER PRIMARY KEY,
+    title       TEXT NOT NULL,
+    description TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id       INTEGER PRIMARY KEY,
+    entry_index   INTEGER NOT NULL,
+    category      TEXT NOT NULL,
+    state         TEXT NOT NULL DEFAULT 'pending',
+    lease_owner   TEXT,
+    lease_expires REAL NOT NULL DEFAULT 0,
+    attempts      INTEGER NOT NULL DEFAULT 0,
+    result        TEXT,
+    error         TEXT,
+    completed_by  TEXT,
+    updated_at    REAL NOT NULL,
+    UNIQUE (entry_index, category)
+);
+CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires, task_id);
+CREATE INDEX IF NOT EXISTS tasks_owner ON tasks (lease_owner, state);
+"""
+
+
+def new_worker_id() -> str:
+    """Identifier of a worker process, unique across machines"""
+    return f'{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}'
+
+
+class WorkQueue(abc.ABC):
+    """Interface of a work-queue backend; tasks are dicts with task_id, title, description, category and attempts"""
+
+    @abc.abstractmethod
+    def populate(self, entries: Iterable[Tuple[str, str]], categories: Sequence[str],
+                 fingerprint: str) -> bool:
+        """
+        Add one task per (entry, category) unless the queue already holds
+        this work. Returns True if the tasks were added; raises ValueError if
+        the queue was filled from different data (another fingerprint).
+        """
+
+    @abc.abstractmethod
+    def fingerprint(self) -> Optional[str]:
+        """Fingerprint the queue was populated with, or None if it is empty"""
+
+    @abc.abstractmethod
+    def claim(self, worker_id: str, limit: int, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[Dict[str, Any]]:
+        """Lease up to `limit` pending (or expired) tasks to the worker, counting an attempt for each"""
+
+    @abc.abstractmethod
+    def renew(self, worker_id: str, task_ids: Sequence[int], lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[int]:
+        """Extend leases still held by the worker; returns the ids whose lease was renewed"""
+
+    @abc.abstractmethod
+    def complete(self, worker_id: str, task_id: int, result: Dict[str, Any]) -> bool:
+        """Store a task's result; returns False if the task was already completed"""
+
+    @abc.abstractmethod
+    def fail(self, worker_id: str, task_id: int, error: str) -> None:
+        """Give a leased task back for another attempt, or mark it failed once its attempts are used up"""
+
+    @abc.abstractmethod
+    def release(self, worker_id: str) -> int:
+        """Give back all tasks leased by the worker; returns how many"""
+
+    @abc.abstractmethod
+    def counts(self) -> Dict[str, int]:
+        """Number of tasks per state; expired leases count as pending"""
+
+    @abc.abstractmethod
+    def results(self) -> List[Dict[str, Any]]:
+        """Results of completed tasks, in task order"""
+
+    @abc.abstractmethod
+    def failures(self) -> List[Dict[str, Any]]:
+        """Tasks that used up their attempts, with the last error"""
+
+    def has_open_tasks(self) -> bool:
+        """Whether any task is pending or leased, i.e. could still be worked on"""
+        counts = self.counts()
+        return bool(counts['pending'] or counts['leased'])
+
+
+class SQLiteWorkQueue(WorkQueue, SQLiteStore):
+    """Work queue in a SQLite file, safe to share between processes and machines"""
+
+    JOURNAL_MODE = 'DELETE'
+    BUSY_TIMEOUT = 60.0
+
+    def __init__(self, path: str, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.max_attempts = max_attempts
+        super().__init__(path, SCHEMA)
+
+    def fingerprint(self) -> Optional[str]:
+        row = self._connection().execute("SELECT value FROM queue_meta WHERE key = 'fingerprint'").fetchone()
+        return row['value'] if row else None
+
+    def populate(self, entries: Iterable[Tuple[str, str]], categories: Sequence[str],
+                 fingerprint: str) -> bool:
+        categories = list(dict.fromkeys(categories))
+
+        def statements(conn):
+            row = conn.execute("SELECT value FROM queue_meta WHERE key = 'fingerprint'").fetchone()
+            if row is not None:
+                if row['value'] != fingerprint:
+                    raise ValueError(f"Work queue {self.path} holds tasks for other data or categories")
+                return False
+            now = time.time()
+            rows = [(index, str(title), str(description)) for index, (title, description) in enumerate(entries)]
+            conn.executemany("INSERT INTO entries (entry_index, title, description) VALUES (?, ?, ?)", rows)
+            conn.executemany(
+                "INSERT INTO tasks (entry_index, category, updated_at) VALUES (?, ?, ?)",
+                ((index, category, now) for index, _, _ in rows for category in categories)
+            )
+            conn.executemany("INSERT INTO queue_meta (key, value) VALUES (?, ?)", [
+                ('fingerprint', fingerprint),
+                ('categories', json.dumps(categories)),
+                ('created_at', str(now)),
+            ])
+            return True
+
+        return self._transaction(statements)
+
+    def claim(self, worker_id: str, limit: int, lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[Dict[str, Any]]:
+        """Lease up to `limit` pending or expired tasks, oldest first"""
+
+        def statements(conn):
+            now = time.time()
+            # Tasks whose last lease ran out after their final attempt are given up
+            conn.execute(
+                "UPDATE tasks SET state = 'failed', lease_owner = NULL, updated_at = ?, "
+                "error = COALESCE(error, 'Lease expired after the last attempt') "
+                "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?",
+                (now, now, self.max_attempts)
+            )
+            rows = conn.execute(
+                "SELECT task_id FROM tasks WHERE state = 'pending' ORDER BY task_id LIMIT ?", (limit,)
+            ).fetchall()
+            if len(rows) < limit:
+                rows += conn.execute(
+                    "SELECT task_id FROM tasks WHERE state = 'leased' AND lease_expires < ? ORDER BY task_id LIMIT ?",
+                    (now, limit - len(rows))
+                ).fetchall()
+            task_ids = [row['task_id'] for row in rows]
+            if not task_ids:
+                return []
+            placeholders = ', '.join('?' for _ in task_ids)
+            conn.execute(
+                f"UPDATE tasks SET state = 'leased', lease_owner = ?, lease_expires = ?, attempts = attempts + 1, "
+                f"updated_at = ? WHERE task_id IN ({placeholders})",
+                (worker_id, now + lease_seconds, now, *task_ids)
+            )
+            return [dict(row) for row in conn.execute(
+                "SELECT t.task_id, t.category, t.attempts, e.title, e.description FROM tasks t "
+                f"JOIN entries e ON e.entry_index = t.entry_index WHERE t.task_id IN ({placeholders}) "
+                "ORDER BY t.task_id", task_ids
+            )]
+
+        return self._transaction(statements)
+
+    def renew(self, worker_id: str, task_ids: Sequence[int], lease_seconds: float = DEFAULT_LEASE_SECONDS) -> List[int]:
+        task_ids = list(task_ids)
+        if not task_ids:
+            return []
+        placeholders = ', '.join('?' for _ in task_ids)
+
+        def statements(conn):
+            now = time.time()
+            conn.execute(
+                f"UPDATE tasks SET lease_expires = ?, updated_at = ? "
+                f"WHERE task_id IN ({placeholders}) AND state = 'leased' AND lease_owner = ?",
+                (now + lease_seconds, now, *task_ids, worker_id)
+            )
+            return [row['task_id'] for row in conn.execute(
+                f"SELECT task_id FROM tasks WHERE task_id IN ({placeholders}) AND state = 'leased' "
+                "AND lease_owner = ?", (*task_ids, worker_id)
+            )]
+
+        return self._transaction(statements)
+
+    def complete(self, worker_id: str, task_id: int, result: Dict[str, Any]) -> bool:
+        # A result is accepted even if the lease ran out meanwhile, as long as no
+        # other worker has completed the task yet
+        cursor = self._connection().execute(
+            "UPDATE tasks SET state = 'done', result = ?, completed_by = ?, lease_owner = NULL, error = NULL, "
+            "updated_at = ? WHERE task_id = ? AND state != 'done'",
+            (json.dumps(result, ensure_ascii=False), worker_id, time.time(), task_id)
+        )
+        return cursor.rowcount > 0
+
+    def fail(self, worker_id: str, task_id: int, error: str) -> None:
+        self._connection().execute(
+            "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "lease_owner = NULL, lease_expires = 0, error = ?, updated_at = ? "
+            "WHERE task_id = ? AND state = 'leased' AND lease_owner = ?",
+            (self.max_attempts, error, time.time(), task_id, worker_id)
+        )
+
+    def release(self, worker_id: str) -> int:
+        # A released task was not really attempted, so it gets its attempt back
+        cursor = self._connection().execute(
+            "UPDATE tasks SET state = 'pending', lease_owner = NULL, lease_expires = 0, "
+            "attempts = MAX(attempts - 1, 0), updated_at = ? WHERE state = 'leased' AND lease_owner = ?",
+            (time.time(), worker_id)
+        )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        counts = dict.fromkeys(TASK_STATES, 0)
+        now = time.time()
+        for row in self._connection().execute(
+            "SELECT CASE WHEN state = 'leased' AND lease_expires < ? AND attempts < ? THEN 'pending' "
+            "WHEN state = 'leased' AND lease_expires < ? THEN 'failed' ELSE state END AS state, "
+            "COUNT(*) AS n FROM tasks GROUP BY 1",
+            (now, self.max_attempts, now)
+        ):
+            counts[row['state']] = row['n']
+        return counts
+
+    def results(self) -> List[Dict[str, Any]]:
+        return [json.loads(row['result']) for row in self._connection().execute(
+            "SELECT result FROM tasks WHERE state = 'done' ORDER BY task_id"
+        )]
+
+    def failures(self) -> List[Dict[str, Any]]:
+        return [dict(row) for row in self._connection().execute(
+            "SELECT e.title, t.category, t.attempts, t.error FROM tasks t "
+            "JOIN entries e ON e.entry_index = t.entry_index WHERE t.state = 'failed' ORDER BY t.task_id"
+        )]
+
+
+def open_work_queue(location: str, **options) -> WorkQueue:
+    """Open a work queue: a file path or sqlite:///path selects the SQLite backend"""
+    if location.startswith('sqlite:///'):
+        location = location[len('sqlite:///'):]
+    elif '://' in location:
+        raise ValueError(f"Unsupported work queue backend: {location}")
+    return SQLiteWorkQueue(location, **options)
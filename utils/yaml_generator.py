@@ -1,5 +1,5 @@
 import os
-from docx import Document
+import sys
 import yaml
 import re
 
@@ -115,33 +115,39 @@ class YAMLGenerator:
         # Return cleaned value
         return values.strip()
 
-    def generate_yaml_from_docx(self, input_file: str, output_file: str) -> bool:
-        """Generate YAML from DOCX file"""
+    def generate_yaml_from_docx(self, input_file: str, output_file: str, verbose: bool = False) -> bool:
+        """
+        Generate YAML from DOCX file
+        
+        The scheme table is streamed from the document XML (see utils.docx_tables);
+        verbose prints the raw content of every row for debugging.
+        """
         try:
-            # Load DOCX
-            doc = Document(input_file)
-            table = doc.tables[0]
+            from utils.docx_tables import iter_table_rows
+            rows = iter_table_rows(input_file)
+            next(rows, None)  # Skip header row
             categories = {}
             
             # Process table
-            for row_idx, row in enumerate(table.rows[1:], start=2):  # Skip header row, keep track of row number
-                cells = row.cells
-                display_name = cells[0].text.strip()
-                values = cells[1].text.strip()
-                criteria = cells[2].text.strip()
-                examples = cells[3].text.strip()
+            for row_idx, cells in enumerate(rows, start=2):  # Keep track of row number
+                display_name = cells[0].strip()
+                values = cells[1].strip()
+                criteria = cells[2].strip()
+                examples = cells[3].strip()
 
                 # Skip empty rows
                 if not display_name and not values and not criteria and not examples:
-                    print(f"Skipping empty row {row_idx}")
+                    if verbose:
+                        print(f"Skipping empty row {row_idx}")
                     continue
 
                 # Print detailed debug info for each row
-                print(f"\nProcessing row {row_idx}:")
-                print(f"Raw display_name: '{display_name}'")
-                print(f"Raw values: '{values}'")
-                print(f"Raw criteria: '{criteria}'")
-                print(f"Raw examples: '{examples}'")
+                if verbose:
+                    print(f"\nProcessing row {row_idx}:")
+                    print(f"Raw display_name: '{display_name}'")
+                    print(f"Raw values: '{values}'")
+                    print(f"Raw criteria: '{criteria}'")
+                    print(f"Raw examples: '{examples}'")
 
                 # Generate the category key name
                 key_name = self.generate_key_name(display_name)
@@ -153,8 +159,9 @@ class YAMLGenerator:
                 condition = self.parse_condition(values)
                 if condition:
                     key_name = "_DERIVED_" + key_name
-                    print(f"Found derived category: {key_name}")
-                    print(f"With condition: {condition}")
+                    if verbose:
+                        print(f"Found derived category: {key_name}")
+                        print(f"With condition: {condition}")
 
                 # Process examples into a proper list
                 example_list = []
@@ -203,9 +210,10 @@ class YAMLGenerator:
             }
 
             # Print summary of all categories
-            print("\nAll categories found:")
-            for cat in sorted(categories.keys()):
-                print(f"- {cat}")
+            if verbose:
+                print("\nAll categories found:")
+                for cat in sorted(categories.keys()):
+                    print(f"- {cat}")
             print(f"\nTotal categories: {len(categories)}")
 
             # Save YAML with proper formatting
@@ -227,13 +235,16 @@ class YAMLGenerator:
 
 if __name__ == "__main__":
     generator = YAMLGenerator()
+    # Allow `python utils/yaml_generator.py` to import project modules
+    if generator.root_dir not in sys.path:
+        sys.path.insert(0, generator.root_dir)
     input_file = os.path.join(generator.root_dir, "data", "DOC_coding_scheme", "doc_cs.docx")
     output_file = os.path.join(generator.root_dir, "data", "DOC_coding_scheme", "coding_scheme_imported.yml")
     
     print(f"Processing DOCX file: {input_file}")
     print(f"Output will be saved to: {output_file}")
     
-    success = generator.generate_yaml_from_docx(input_file, output_file)
+    success = generator.generate_yaml_from_docx(input_file, output_file, verbose=True)
     if success:
         print("YAML generation completed successfully")
     else:
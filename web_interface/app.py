@@ -1,7 +1,7 @@
 from flask import Flask, render_template, request, jsonify, send_file, Response, session
 import os
+import copy
 import shutil
-import asyncio
 import sys
 import warnings
 
@@ -17,11 +17,11 @@ from werkzeug.utils import secure_filename
 import json
 import signal
 import logging
-from logging.handlers import RotatingFileHandler
 import traceback
 from typing import Dict, Any
 import subprocess
 import getpass
+import hashlib
 import threading
 
 # Add project root to path BEFORE importing project modules
@@ -36,7 +36,18 @@ load_dotenv(encoding='utf-8-sig')
 from utils.yaml_generator import YAMLGenerator
 from utils.fix_yaml_format import fix_yaml_format
 from utils.validate_yaml import validate_yaml
-from run_pipeline import TrainingDataClassifier, CONFIG
+from utils.scheme_compiler import load_compiled_scheme
+from utils.metrics import METRICS, count_cache, merge_snapshots, render_prometheus, with_labels
+from utils.endpoint_pool import load_endpoints
+from utils.fair_share import PRIORITY_WEIGHTS
+from utils.run_report import DEFAULT_PRICES
+from utils.value_only import validate_settings as validate_value_only
+from utils.async_logging import setup_async_logging
+from web_interface.job_store import JobStore
+from web_interface.jobs import JobRunner, FINISHED_STATES
+from web_interface.progress_events import ProgressBroadcaster, progress_rates
+from web_interface.result_export import (DEFAULT_PAGE_SIZE, EXPORT_FORMATS, MAX_PAGE_SIZE,
+                                         csv_text, ndjson_lines, xlsx_snapshot)
 
 # API key can be in .env or entered in web UI
 api_key = os.getenv("OPENAI_API_KEY")
@@ -66,30 +77,18 @@ def setup_logging():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     
-    # File handler with rotation
-    file_handler = RotatingFileHandler(
+    # Pipeline prompts/responses go to a separate compressed trace file
+    trace_file = os.path.join(log_dir, f'web_interface_trace_{timestamp}.jsonl.gz')
+    
+    # File and console output are written by a background thread
+    setup_async_logging(
         log_file,
-        maxBytes=10 * 1024 * 1024,  # 10MB
-        backupCount=5,
-        encoding='utf-8'
+        formatter,
+        level=logging.INFO,
+        max_bytes=10 * 1024 * 1024,  # 10MB
+        backup_count=5,
+        trace_file=trace_file
     )
-    file_handler.setFormatter(formatter)
-    
-    # Console handler
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    
-    # Setup root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    
-    # Remove any existing handlers
-    for handler in root_logger.handlers[:]:
-        root_logger.removeHandler(handler)
-    
-    # Add our handlers
-    root_logger.addHandler(file_handler)
-    root_logger.addHandler(console_handler)
     
     return logging.getLogger('web_interface')
 
@@ -108,6 +107,8 @@ logger.info("Flask Environment Variables", extra={
 # Configure upload folders
 DEFAULT_FOLDER = os.path.join(root_dir, 'data', 'DOC_coding_scheme')
 TEMP_FOLDER = os.path.join(root_dir, 'data', 'temp_uploads')
+# Converted coding schemes, keyed by the content hash of the uploaded DOCX
+SCHEME_CONVERSION_CACHE = os.path.join(root_dir, 'data', 'scheme_cache')
 ALLOWED_EXTENSIONS = {
     'coding_scheme': {'yml', 'yaml'},
     'prompt': {'txt'},
@@ -122,7 +123,9 @@ app = Flask(__name__)
 app.config['UPLOAD_FOLDER'] = DEFAULT_FOLDER
 app.config['TEMP_FOLDER'] = TEMP_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-app.config['SECRET_KEY'] = os.urandom(24)  # Required for session handling
+# Signs the session cookie, which ties jobs to their session: every Gunicorn worker must use the same key
+# (gunicorn_config.py insists on FLASK_SECRET_KEY); a random key only suits the single-process dev server
+app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY') or os.urandom(24)
 
 # Load configuration
 CONFIG = {
@@ -140,7 +143,46 @@ CONFIG = {
     },
     'gpt': {
         'model': 'gpt-4-turbo-preview',
-        'temperature': 0.0
+        'temperature': 0.0,
+        'prices': DEFAULT_PRICES,  # USD per million tokens, for the run report
+        # API endpoints/keys to spread requests over: JSON file as described in utils/endpoint_pool.py
+        'endpoints': load_endpoints(os.environ['PIPELINE_ENDPOINTS']) if os.getenv('PIPELINE_ENDPOINTS') else [],
+        # Ask for the value only (confidence from logprobs) and for reasoning only where needed, see utils/value_only.py
+        'value_only': {
+            'enabled': os.getenv('PIPELINE_VALUE_ONLY', '').lower() in ('1', 'true', 'yes'),
+            'explain': os.getenv('PIPELINE_VALUE_ONLY_EXPLAIN', 'positive_or_uncertain')
+        }
+    },
+    # List only the K human-coded examples most similar to each entry (0: off), see utils/exemplar_index.py
+    'examples': {
+        'enabled': int(os.getenv('PIPELINE_EXAMPLES_TOP_K', '0')) > 0,
+        'top_k': int(os.getenv('PIPELINE_EXAMPLES_TOP_K', '0'))
+    },
+    'logging': {
+        'payloads': {
+            'mode': 'sampled',      # all, sampled, errors or off
+            'sample_rate': 0.01
+        }
+    },
+    'tracing': {
+        # Write trace spans of every run to data/log/pipeline_spans_<timestamp>.jsonl
+        'enabled': os.getenv('PIPELINE_TRACING', '').lower() in ('1', 'true', 'yes'),
+        'file': None
+    },
+    'jobs': {
+        # Pipeline runs executing at the same time (each in its own worker process)
+        'max_concurrent_jobs': int(os.getenv('PIPELINE_MAX_CONCURRENT_JOBS', '2')),
+        # Job state shared by all web and job worker processes
+        'store_path': os.getenv('PIPELINE_JOB_DB', os.path.join(root_dir, 'data', 'jobs', 'jobs.db'))
+    },
+    'fair_share': {
+        # Requests/tokens per minute shared by all jobs, split by priority (utils/fair_share.py); off without a budget
+        'enabled': bool(int(os.getenv('PIPELINE_API_RPM', '0')) or int(os.getenv('PIPELINE_API_TPM', '0'))),
+        'rpm': int(os.getenv('PIPELINE_API_RPM', '0')),
+        'tpm': int(os.getenv('PIPELINE_API_TPM', '0')),
+        'path': os.getenv('PIPELINE_FAIR_SHARE_DB', os.path.join(root_dir, 'data', 'jobs', 'fair_share.db')),
+        'priority': 'auto',  # Runs with up to interactive_max_tasks tasks are 'interactive', larger ones 'batch'
+        'interactive_max_tasks': int(os.getenv('PIPELINE_INTERACTIVE_MAX_TASKS', '50'))
     },
     'selected_categories': [],
     'temp_files': {
@@ -150,8 +192,18 @@ CONFIG = {
     }
 }
 
-# Add status tracking
-pipeline_status = {
+# A misspelt PIPELINE_VALUE_ONLY_EXPLAIN stops the app here instead of failing every job
+validate_value_only(CONFIG['gpt']['value_only'])
+
+# Pipeline runs execute in background worker processes
+job_store = JobStore(CONFIG['jobs']['store_path'])
+job_runner = JobRunner(job_store,
+                       max_concurrent_jobs=CONFIG['jobs']['max_concurrent_jobs'],
+                       log_dir=CONFIG['paths']['log_dir'])
+
+IDLE_STATUS = {
+    'job_id': None,
+    'state': None,
     'is_running': False,
     'current_entry': 0,
     'total_entries': 0,
@@ -159,9 +211,60 @@ pipeline_status = {
     'progress': 0,
     'status_message': '',
     'error': None,
-    'is_cancelled': False  # Add cancellation flag
+    'is_cancelled': False,
+    'result_file': None,
+    'completed_tasks': 0,
+    'total_tasks': 0,
+    'category_counts': {},
+    'throughput': None,
+    'eta_seconds': None
 }
 
+# Answer for unknown jobs and jobs of other sessions alike
+NOT_FOUND = {'status': 'error', 'message': 'Unknown job'}
+
+def job_status(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a job record into the status format used by the web interface"""
+    state = job['state']
+    status_messages = {
+        'queued': 'Waiting for a free pipeline worker...',
+        'done': 'Pipeline completed successfully',
+        'failed': f"Error running pipeline: {job.get('error')}",
+        'cancelled': 'Pipeline cancelled by user' + (' (partial results saved)' if job.get('result_file') else '')
+    }
+    return {
+        **IDLE_STATUS,
+        'job_id': job['job_id'],
+        'state': state,
+        'is_running': state not in FINISHED_STATES,
+        'current_entry': job['current_entry'],
+        'total_entries': job['total_entries'],
+        'current_category': job['current_category'],
+        'progress': job['progress'],
+        'status_message': status_messages.get(state) or job['status_message'],
+        'error': job.get('error') if state in ('failed', 'cancelled') else None,
+        'is_cancelled': state == 'cancelled',
+        'result_file': job.get('result_file'),
+        'completed_tasks': job['completed_tasks'],
+        'total_tasks': job['total_tasks'],
+        'category_counts': job.get('category_counts', {}),
+        **progress_rates(job)
+    }
+
+# One store poller per process feeds all progress event streams
+progress_broadcaster = ProgressBroadcaster(job_store, job_status)
+
+def requested_job_id():
+    """Job id from the query string / form / JSON body, falling back to the session's last job"""
+    job_id = request.args.get('job_id') or request.form.get('job_id')
+    if not job_id and request.is_json:
+        job_id = (request.get_json(silent=True) or {}).get('job_id')
+    return job_id or session.get('job_id')
+
+def owns_job(job: Dict[str, Any]) -> bool:
+    """Whether a job was submitted from this session; other sessions' jobs are answered with 404"""
+    return bool(job.get('owner')) and job['owner'] == session.get('session_id')
+
 def get_session_folder():
     """Get or create a session-specific folder for uploads"""
     if 'session_id' not in session:
@@ -171,6 +274,42 @@ def get_session_folder():
     os.makedirs(session_folder, exist_ok=True)
     return session_folder
 
+def convert_docx_scheme(docx_path: str, yaml_path: str):
+    """
+    Convert an uploaded DOCX coding scheme into the validated YAML used by the pipeline
+
+    Conversions are cached by the DOCX's content hash, so uploading the same
+    scheme again only copies the cached YAML. Returns an error message, or
+    None on success.
+    """
+    with open(docx_path, 'rb') as file:
+        digest = hashlib.sha256(file.read()).hexdigest()
+    cached_path = os.path.join(SCHEME_CONVERSION_CACHE, f'{digest}.yml')
+    if os.path.exists(cached_path):
+        count_cache('docx_conversion', hit=True)
+        shutil.copyfile(cached_path, yaml_path)
+        logger.info("Using cached coding scheme conversion", extra={'sha256': digest})
+        return None
+    count_cache('docx_conversion', hit=False)
+    
+    # Generate YAML from DOCX
+    if not YAMLGenerator().generate_yaml_from_docx(docx_path, yaml_path):
+        return 'Failed to generate YAML from DOCX'
+    
+    # Fix YAML format
+    if not fix_yaml_format(yaml_path, yaml_path):
+        return 'Failed to fix YAML format'
+    
+    # Validate YAML
+    if not validate_yaml(yaml_path):
+        return 'Invalid YAML format'
+    
+    os.makedirs(SCHEME_CONVERSION_CACHE, exist_ok=True)
+    tmp_path = f'{cached_path}.{os.getpid()}.tmp'
+    shutil.copyfile(yaml_path, tmp_path)
+    os.replace(tmp_path, cached_path)
+    return None
+
 def cleanup_old_sessions():
     """Clean up sessions older than 24 hours"""
     now = time.time()
@@ -196,133 +335,49 @@ def get_latest_results_file():
         return None
     return max(files, key=os.path.getctime)
 
-def get_category_sort_key(display_name):
+# Parsed, filtered and sorted category views of coding schemes. Files are keyed
+# on (path, mtime, size); uploaded session schemes on their content hash, so
+# sessions uploading the same scheme share one entry.
+SCHEME_CACHE_SIZE = 32
+_scheme_cache: Dict[tuple, Dict[str, Any]] = {}
+_scheme_cache_lock = threading.Lock()
+
+def _build_category_view(artifact) -> Dict[str, Any]:
+    categories = artifact['categories']
+    return {
+        'total_categories': len(categories),
+        'categories': {key: categories[key] for key in artifact['order']},
+        'non_selectable': frozenset(key for key in artifact['order'] if not categories[key]['selectable'])
+    }
+
+def load_category_view(path: str) -> Dict[str, Any]:
     """
-    Convert category name like '3.5' or '3.1.2' or '2.0b' or '2.0.1' into a tuple of numbers for proper sorting
-    Example: '3.5' -> (3, 5, 0)
-            '3.1.2' -> (3, 1, 2)
-            '3.1' -> (3, 1, 0)
-            '2.0b' -> (2, 0, 0, 'b')  # Letter suffix preserved for sorting
-            '2.0.1' -> (2, 0, 1)  # Handle subcategories
+    Return the category view of a coding scheme file, building it only when the file changed
+
+    The view holds the number of categories in the scheme, the listed
+    categories in display order and the set of non-selectable (2.x header)
+    categories. It is built from the scheme's compiled artifact.
     """
-    # Extract the numeric part at the start of the display name
-    parts = display_name.split()
-    if not parts:
-        return (999, 999, 999, '')  # Handle empty strings
-    
-    # Get the first part which should be the number (e.g., "2.6.5" or "3.5" or "2.0b" or "2.0.1")
-    number_part = parts[0]
-    
-    # Split by dots
-    number_sections = number_part.split('.')
-    
-    # Initialize numbers list and letter suffix
-    numbers = []
-    letter_suffix = ''
-    
-    try:
-        # Process each section
-        for section in number_sections:
-            # Check if section contains letters
-            numeric_part = ''.join(c for c in section if c.isdigit())
-            letter_part = ''.join(c for c in section if c.isalpha())
-            
-            if numeric_part:
-                numbers.append(int(numeric_part))
-            if letter_part:
-                letter_suffix = letter_part
-                
-        # Pad with zeros if needed
-        while len(numbers) < 3:
-            numbers.append(0)
-            
-        # Return tuple with numbers and letter suffix
-        return tuple(numbers[:3]) + (letter_suffix,)
-    except Exception:
-        return (999, 999, 999, '')
-
-def is_parent_category_2x(category_key, details):
-    """True if this is a 2.x section header (2.1-2.6) - not selectable. 2.0a and 2.0b are selectable."""
-    # Method 1: Check condition.range_start - section headers have range_start "2.1.1", "2.2.1", etc.
-    # (coding_scheme.yml from fix_yaml_format strips display_name, so we need this)
-    cond = details.get('condition') or {}
-    range_start = cond.get('range_start', '')
-    rs = str(range_start)
-    # Handle both "2.1.1" (string) and 2.11 (float if YAML parses 2.1.1 oddly)
-    if rs in ('2.1.1', '2.2.1', '2.3.1', '2.4.1', '2.5.1', '2.6.1'):
-        return True
-    if isinstance(range_start, (int, float)) and range_start in (2.11, 2.21, 2.31, 2.41, 2.51, 2.61):
-        return True
-    # Method 2: Check display_name prefix (coding_scheme_imported.yml keeps "2.1 Berufliches...")
-    display_name = details.get('display_name', '') or category_key
-    if not display_name:
-        return False
-    parts = str(display_name).split()
-    if not parts:
-        return False
-    numeric_prefix = parts[0]
-    if not numeric_prefix.startswith('2.'):
-        return False
-    if numeric_prefix.count('.') >= 2:
-        return False  # 2.0.1 etc. are selectable
-    if any(c.isalpha() for c in numeric_prefix[2:]):
-        return False  # 2.0a, 2.0b are selectable
-    return len(numeric_prefix) >= 3 and numeric_prefix[2:].isdigit()
-
-def filter_categories(scheme):
-    """Filter categories based on specific criteria"""
-    filtered_scheme = {}
-    categories_with_sort_keys = []
-    
-    # Get categories from the new nested structure
-    categories = scheme.get('coding_scheme', {}).get('categories', {})
-    
-    logger.info("Starting category filtering", extra={
-        'total_categories': len(categories),
-        'scheme_version': scheme.get('coding_scheme', {}).get('version', 'unknown')
-    })
-    
-    for category, details in categories.items():
-        # Get the display name (or use the category key if display_name is not present)
-        display_name = details.get('display_name', category)
-        
-        # Extract the numeric prefix from display_name
-        # Example: "1.0.1 Kursname" -> "1.0.1"
-        numeric_prefix = display_name.split()[0] if display_name else ""
-        
-        # Include all categories, including derived ones
-        if numeric_prefix and any(c.isdigit() for c in numeric_prefix):
-            # Store category with its sort key
-            sort_key = get_category_sort_key(numeric_prefix)
-            categories_with_sort_keys.append((sort_key, category, details))
-            logger.debug("Category included", extra={
-                'category': category,
-                'display_name': display_name,
-                'numeric_prefix': numeric_prefix,
-                'sort_key': sort_key
-            })
-        else:
-            logger.debug("Category filtered out", extra={
-                'category': category,
-                'display_name': display_name,
-                'numeric_prefix': numeric_prefix,
-                'is_derived': category.startswith('_DERIVED_'),
-                'has_numeric': any(c.isdigit() for c in numeric_prefix) if numeric_prefix else False
-            })
-    
-    # Sort categories based on their numeric parts and letter suffixes
-    categories_with_sort_keys.sort(key=lambda x: x[0])
-    
-    # Create ordered dictionary
-    for _, category, details in categories_with_sort_keys:
-        filtered_scheme[category] = details
-    
-    logger.info("Category filtering completed", extra={
-        'filtered_categories': len(filtered_scheme),
-        'removed_categories': len(categories) - len(filtered_scheme)
-    })
-    
-    return filtered_scheme
+    if os.path.abspath(path).startswith(os.path.abspath(TEMP_FOLDER) + os.sep):
+        with open(path, 'rb') as file:
+            key = ('content', hashlib.sha256(file.read()).hexdigest())
+    else:
+        stat = os.stat(path)
+        key = ('file', os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    
+    with _scheme_cache_lock:
+        view = _scheme_cache.get(key)
+    count_cache('scheme_view', hit=view is not None)
+    if view is not None:
+        return view
+    
+    view = _build_category_view(load_compiled_scheme(path))
+    with _scheme_cache_lock:
+        _scheme_cache[key] = view
+        while len(_scheme_cache) > SCHEME_CACHE_SIZE:
+            _scheme_cache.pop(next(iter(_scheme_cache)))
+    logger.info("Coding scheme loaded", extra={'path': path, 'cache_entries': len(_scheme_cache)})
+    return view
 
 @app.route('/')
 def index():
@@ -353,23 +408,18 @@ def index():
     last_error = None
     for path in paths_to_try:
         try:
-            with open(path, 'r', encoding='utf-8') as file:
-                scheme = yaml.safe_load(file)
-            if not scheme:
+            view = load_category_view(path)
+            if not view['total_categories']:
                 continue
-            categories = scheme.get('coding_scheme', {}).get('categories', {})
-            if not categories:
-                continue
-            filtered_scheme = filter_categories(scheme)
+            filtered_scheme = view['categories']
             if filtered_scheme:
                 logger.info("Categories loaded successfully", extra={
                     'total_categories': len(filtered_scheme),
                     'path_used': path,
                     'session_id': session_id
                 })
-                non_selectable = {k for k, d in filtered_scheme.items() if is_parent_category_2x(k, d)}
                 return render_template('index.html', categories=filtered_scheme,
-                                       non_selectable_categories=non_selectable,
+                                       non_selectable_categories=view['non_selectable'],
                                        api_key_configured=bool(os.getenv("OPENAI_API_KEY")), categories_error=None)
         except Exception as e:
             last_error = e
@@ -395,11 +445,9 @@ def debug_categories():
     results = []
     for p in paths:
         try:
-            with open(p, 'r', encoding='utf-8') as f:
-                scheme = yaml.safe_load(f)
-            cats = scheme.get('coding_scheme', {}).get('categories', {}) if scheme else {}
-            filtered = filter_categories(scheme) if scheme else {}
-            results.append({'path': p, 'exists': True, 'categories': len(cats), 'filtered': len(filtered)})
+            view = load_category_view(p)
+            results.append({'path': p, 'exists': True, 'categories': view['total_categories'],
+                            'filtered': len(view['categories'])})
         except Exception as e:
             results.append({'path': p, 'exists': os.path.exists(p), 'error': str(e)})
     return jsonify({'root_dir': root_dir, 'paths': results})
@@ -478,42 +526,59 @@ def upload_file():
     return jsonify({'message': 'File uploaded successfully'})
 
 @app.route('/pipeline_status', methods=['GET'])
-def get_pipeline_status():
-    """Get current pipeline status"""
-    return jsonify(pipeline_status)
+@app.route('/pipeline_status/<job_id>', methods=['GET'])
+def get_pipeline_status(job_id=None):
+    """Get the status of a pipeline job (the session's latest job by default)"""
+    job_id = job_id or requested_job_id()
+    job = job_runner.get(job_id) if job_id else None
+    if job is None:
+        return jsonify(IDLE_STATUS)
+    if not owns_job(job):
+        return jsonify(NOT_FOUND), 404
+    return jsonify(job_status(job))
+
+@app.route('/pipeline_events/<job_id>', methods=['GET'])
+def pipeline_events(job_id):
+    """Stream progress of a pipeline job as server-sent events"""
+    job = job_runner.get(job_id)
+    if job is not None and not owns_job(job):
+        return jsonify(NOT_FOUND), 404
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_version = int(last_event_id) if last_event_id.isdigit() else -1
+    return Response(
+        progress_broadcaster.stream(job_id, last_version),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Pipeline metrics of all jobs plus this web process's caches, in Prometheus text format"""
+    snapshots = job_store.all_metrics()
+    snapshots.append(with_labels(METRICS.snapshot(), worker=str(os.getpid())))
+    return Response(render_prometheus(merge_snapshots(snapshots)), mimetype='text/plain; version=0.0.4')
 
 @app.route('/cancel_pipeline', methods=['POST'])
-def cancel_pipeline():
-    """Cancel the running pipeline"""
-    global pipeline_status
-    if pipeline_status['is_running']:
-        pipeline_status['is_cancelled'] = True
-        pipeline_status['status_message'] = 'Cancellation requested...'
-        return jsonify({'status': 'success', 'message': 'Pipeline cancellation requested'})
+@app.route('/cancel_pipeline/<job_id>', methods=['POST'])
+def cancel_pipeline(job_id=None):
+    """Cancel a queued or running pipeline job"""
+    job_id = job_id or requested_job_id()
+    job = job_runner.get(job_id) if job_id else None
+    if job is not None and not owns_job(job):
+        return jsonify(NOT_FOUND), 404
+    if job_id and job_runner.cancel(job_id):
+        logger.info("Pipeline cancellation requested", extra={'job_id': job_id})
+        return jsonify({'status': 'success', 'message': 'Pipeline cancellation requested', 'job_id': job_id})
     return jsonify({'status': 'error', 'message': 'No pipeline running'}), 400
 
 @app.route('/run_pipeline', methods=['POST'])
-async def run_pipeline():
-    global pipeline_status
+def run_pipeline():
+    """Prepare the run configuration and submit it as a background job"""
     try:
-        # Reset status
-        pipeline_status = {
-            'is_running': True,
-            'current_entry': 0,
-            'total_entries': 0,
-            'current_category': '',
-            'progress': 0,
-            'status_message': 'Initializing pipeline...',
-            'error': None,
-            'is_cancelled': False
-        }
-        
-        # Get API key from form or use env (allows running without .env)
-        api_key = request.form.get('api_key', '').strip()
-        if api_key:
-            os.environ['OPENAI_API_KEY'] = api_key
-        if not os.getenv("OPENAI_API_KEY"):
-            pipeline_status['is_running'] = False
+        # API key from the form, else from env (allows running without .env). The form's key is
+        # handed to this job only; it is not stored with the job or put into os.environ.
+        api_key = request.form.get('api_key', '').strip() or None
+        if not api_key and not os.getenv("OPENAI_API_KEY") and not CONFIG['gpt']['endpoints']:
             return jsonify({
                 'status': 'error',
                 'message': 'OpenAI API key required. Enter it in the field above or add OPENAI_API_KEY to your .env file.'
@@ -525,14 +590,13 @@ async def run_pipeline():
         prompt_file = request.files.get('prompt_file')
         
         # Get file paths from session, or use defaults
-        config = CONFIG.copy()  # Create a copy of the default config
+        config = copy.deepcopy(CONFIG)  # Jobs must not share the default config
         
         # Get session folder for temporary files
         session_folder = get_session_folder()
         
         # Save temporary files if provided
         if data_file:
-            pipeline_status['status_message'] = 'Saving data file...'
             data_path = os.path.join(session_folder, 'temp_data.xlsx')
             data_file.save(data_path)
             config['paths']['data_csv'] = data_path
@@ -549,7 +613,6 @@ async def run_pipeline():
             config['paths']['data_csv'] = data_path
             
         if coding_scheme_file:
-            pipeline_status['status_message'] = 'Processing coding scheme...'
             # Save DOCX file
             docx_path = os.path.join(session_folder, 'temp_coding_scheme.docx')
             coding_scheme_file.save(docx_path)
@@ -558,34 +621,14 @@ async def run_pipeline():
                 'session_id': session.get('session_id')
             })
             
-            # Generate YAML from DOCX
-            yaml_generator = YAMLGenerator()
+            # Generate, fix and validate YAML from DOCX (cached by content)
             yaml_path = os.path.join(session_folder, 'temp_coding_scheme.yml')
-            if not yaml_generator.generate_yaml_from_docx(docx_path, yaml_path):
-                pipeline_status['error'] = 'Failed to generate YAML from DOCX'
-                pipeline_status['is_running'] = False
-                logger.error("Failed to generate YAML from DOCX", extra={
-                    'session_id': session.get('session_id')
-                })
-                return jsonify({'status': 'error', 'message': 'Failed to generate YAML from DOCX'}), 500
-            
-            # Fix YAML format
-            if not fix_yaml_format(yaml_path, yaml_path):
-                pipeline_status['error'] = 'Failed to fix YAML format'
-                pipeline_status['is_running'] = False
-                logger.error("Failed to fix YAML format", extra={
-                    'session_id': session.get('session_id')
-                })
-                return jsonify({'status': 'error', 'message': 'Failed to fix YAML format'}), 500
-            
-            # Validate YAML
-            if not validate_yaml(yaml_path):
-                pipeline_status['error'] = 'Invalid YAML format'
-                pipeline_status['is_running'] = False
-                logger.error("Invalid YAML format", extra={
+            error_message = convert_docx_scheme(docx_path, yaml_path)
+            if error_message:
+                logger.error(error_message, extra={
                     'session_id': session.get('session_id')
                 })
-                return jsonify({'status': 'error', 'message': 'Invalid YAML format'}), 500
+                return jsonify({'status': 'error', 'message': error_message}), 500
             
             config['paths']['coding_scheme'] = yaml_path
             session['coding_scheme_path'] = yaml_path
@@ -597,7 +640,6 @@ async def run_pipeline():
             config['paths']['coding_scheme'] = session.get('coding_scheme_path', CONFIG['paths']['coding_scheme'])
             
         if prompt_file:
-            pipeline_status['status_message'] = 'Saving prompt file...'
             prompt_path = os.path.join(session_folder, 'temp_prompt.txt')
             prompt_file.save(prompt_path)
             config['paths']['prompt_template'] = prompt_path
@@ -636,77 +678,28 @@ async def run_pipeline():
             selected_categories = []
         
         config['selected_categories'] = selected_categories
+
+        # Share of the API budget when several jobs run at the same time
+        priority = request.form.get('priority', 'auto') or 'auto'
+        if priority != 'auto' and priority not in PRIORITY_WEIGHTS:
+            return jsonify({
+                'status': 'error',
+                'message': f'Unknown priority: {priority}'
+            }), 400
+        config['fair_share']['priority'] = priority
         
-        # Run the pipeline with the session-specific config
-        pipeline_status['status_message'] = 'Starting classification...'
-        classifier = TrainingDataClassifier(config)
-        
-        # Set up status update callback
-        def status_callback(entry_num, total_entries, category, progress):
-            pipeline_status.update({
-                'current_entry': entry_num,
-                'total_entries': total_entries,
-                'current_category': category,
-                'progress': progress,
-                'status_message': f'Processing entry {entry_num}/{total_entries} - Category: {category}',
-                'is_running': True  # Ensure running state is maintained
-            })
-            
-            # Check for cancellation
-            if pipeline_status['is_cancelled']:
-                raise Exception("Pipeline cancelled by user")
-        
-        # Add callback to config
-        config['status_callback'] = status_callback
-        
-        try:
-            result = await classifier.run()
-            
-            # Get the latest results file
-            result_file = get_latest_results_file()
-            if result_file:
-                result_filename = os.path.basename(result_file)
-                pipeline_status.update({
-                    'is_running': False,
-                    'status_message': 'Pipeline completed successfully',
-                    'progress': 100,
-                    'error': None
-                })
-                logger.info("Pipeline completed successfully", extra={
-                    'result_file': result_filename,
-                    'session_id': session.get('session_id')
-                })
-                return jsonify({
-                    'status': 'success',
-                    'message': 'Pipeline completed successfully',
-                    'result_file': result_filename
-                })
-            else:
-                pipeline_status.update({
-                    'is_running': False,
-                    'error': 'No results file found',
-                    'status_message': 'Pipeline completed but no results file was found'
-                })
-                logger.error("Pipeline completed but no results file was found", extra={
-                    'session_id': session.get('session_id')
-                })
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Pipeline completed but no results file was found'
-                }), 500
-                
-        except Exception as e:
-            if pipeline_status['is_cancelled']:
-                pipeline_status.update({
-                    'is_running': False,
-                    'status_message': 'Pipeline cancelled by user',
-                    'error': 'Pipeline cancelled by user'
-                })
-                return jsonify({
-                    'status': 'cancelled',
-                    'message': 'Pipeline cancelled by user'
-                })
-            raise
+        # Run the pipeline in a background worker; the client follows it via /pipeline_status
+        job_id = job_runner.submit(config, owner=session.get('session_id'), api_key=api_key)
+        session['job_id'] = job_id
+        logger.info("Pipeline job queued", extra={
+            'job_id': job_id,
+            'session_id': session.get('session_id')
+        })
+        return jsonify({
+            'status': 'queued',
+            'message': 'Pipeline job queued',
+            'job_id': job_id
+        }), 202
             
     except Exception as e:
         error_message = str(e)
@@ -715,12 +708,6 @@ async def run_pipeline():
             'session_id': session.get('session_id')
         })
         
-        pipeline_status.update({
-            'is_running': False,
-            'error': error_message,
-            'status_message': f'Error running pipeline: {error_message}'
-        })
-        
         return jsonify({
             'status': 'error',
             'message': f'Error running pipeline: {error_message}'
@@ -732,6 +719,40 @@ def download_results(filename):
     file_path = os.path.join(results_dir, filename)
     return send_file(file_path, as_attachment=True)
 
+@app.route('/job_results/<job_id>')
+def job_results(job_id):
+    """
+    Completed results of a job, also while it is still running
+
+    Query parameters: format (ndjson, csv or xlsx), cursor (position of the
+    last result already received, default 0) and limit (page size; xlsx
+    snapshots include all results after the cursor). The X-Next-Cursor
+    header holds the cursor for the next request.
+    """
+    job = job_runner.get(job_id)
+    if job is None or not owns_job(job):
+        return jsonify(NOT_FOUND), 404
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'status': 'error', 'message': f"Unsupported format: {export_format}"}), 400
+    cursor = max(request.args.get('cursor', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+    
+    rows = job_store.get_results(job_id, after=cursor, limit=None if export_format == 'xlsx' else limit)
+    headers = {
+        'X-Next-Cursor': str(rows[-1]['seq'] if rows else cursor),
+        'X-Job-State': job['state'],
+        'Cache-Control': 'no-cache'
+    }
+    if export_format == 'ndjson':
+        body = ndjson_lines(rows)
+    elif export_format == 'csv':
+        body = csv_text(rows, header=cursor == 0)
+    else:
+        body = xlsx_snapshot(rows)
+        headers['Content-Disposition'] = f'attachment; filename="results_{job_id}_partial.xlsx"'
+    return Response(body, mimetype=EXPORT_FORMATS[export_format], headers=headers)
+
 @app.route('/restart_service', methods=['POST'])
 def restart_service():
     def do_restart():
@@ -745,6 +766,7 @@ def restart_service():
 def signal_handler(signum, frame):
     """Handle shutdown signals gracefully"""
     print("\nShutting down server...")
+    job_runner.shutdown()
     sys.exit(0)
 
 # Register signal handlers
@@ -759,15 +781,6 @@ def handle_error(error):
     stack_trace = traceback.format_exc()
     logger.error(f"Unhandled error: {error_message}\n{stack_trace}")
     
-    # Update pipeline status if it exists
-    global pipeline_status
-    if 'pipeline_status' in globals():
-        pipeline_status.update({
-            'is_running': False,
-            'error': error_message,
-            'status_message': f'Error: {error_message}'
-        })
-    
     return jsonify({
         'status': 'error',
         'message': error_message
@@ -0,0 +1,350 @@
+"""
+Multi-process job-state store for pipeline jobs
+
+Job state lives in a SQLite database in WAL mode, so every gunicorn worker
+and every job worker process sees the same state: status and cancel
+requests work no matter which process handles them, and each job has its
+own record instead of sharing a single global.
+
+Updates are single statements or short transactions, which keeps progress
+updates atomic and cheap. Every change bumps the job's version, so readers
+can tell cheaply whether anything happened. Claiming a queued job runs
+inside an IMMEDIATE transaction so the concurrency limit holds across
+processes. Metrics snapshots are kept per unfinished job; when a job
+finishes, its snapshot is added to one running total, so the /metrics
+endpoint merges a bounded number of snapshots however many jobs have run.
+"""
+
+import json
+import os
+import socket
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.metrics import merge_snapshots
+from utils.sqlite_store import SQLiteStore
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id           TEXT PRIMARY KEY,
+    owner            TEXT,
+    state            TEXT NOT NULL,
+    config           TEXT NOT NULL,
+    created_at       REAL NOT NULL,
+    started_at       REAL,
+    finished_at      REAL,
+    updated_at       REAL NOT NULL,
+    current_entry    INTEGER NOT NULL DEFAULT 0,
+    total_entries    INTEGER NOT NULL DEFAULT 0,
+    current_category TEXT NOT NULL DEFAULT '',
+    progress         INTEGER NOT NULL DEFAULT 0,
+    status_message   TEXT NOT NULL DEFAULT '',
+    error            TEXT,
+    result_file      TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    worker_host      TEXT,
+    worker_pid       INTEGER,
+    dispatcher       TEXT,
+    completed_tasks  INTEGER NOT NULL DEFAULT 0,
+    total_tasks      INTEGER NOT NULL DEFAULT 0,
+    version          INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, created_at);
+CREATE TABLE IF NOT EXISTS job_results (
+    seq         INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id      TEXT NOT NULL,
+    title       TEXT NOT NULL,
+    description TEXT NOT NULL,
+    category    TEXT NOT NULL,
+    ai_code     TEXT NOT NULL,
+    confidence  REAL NOT NULL,
+    reasoning   TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS job_results_job ON job_results (job_id, seq);
+CREATE TABLE IF NOT EXISTS job_categories (
+    job_id    TEXT NOT NULL,
+    category  TEXT NOT NULL,
+    completed INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (job_id, category)
+);
+CREATE TABLE IF NOT EXISTS job_metrics (
+    job_id     TEXT PRIMARY KEY,
+    metrics    TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS finished_metrics (
+    id         INTEGER PRIMARY KEY CHECK (id = 1),
+    metrics    TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+# Columns added after the first release of the store
+MIGRATIONS = {
+    'completed_tasks': "ALTER TABLE jobs ADD COLUMN completed_tasks INTEGER NOT NULL DEFAULT 0",
+    'total_tasks': "ALTER TABLE jobs ADD COLUMN total_tasks INTEGER NOT NULL DEFAULT 0",
+    'version': "ALTER TABLE jobs ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+    'dispatcher': "ALTER TABLE jobs ADD COLUMN dispatcher TEXT",
+}
+
+# Columns a worker may update through update_progress()
+PROGRESS_FIELDS = ('current_entry', 'total_entries', 'current_category', 'progress', 'status_message',
+                   'completed_tasks', 'total_tasks')
+
+
+class JobStore(SQLiteStore):
+    """SQLite-backed store of pipeline jobs, safe to share between processes"""
+
+    def __init__(self, path: str):
+        super().__init__(path, SCHEMA)
+        conn = self._connection()
+        columns = {row['name'] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for column, statement in MIGRATIONS.items():
+            if column not in columns:
+                conn.execute(statement)
+        # Snapshots of jobs that finished before finish() folded them into the totals
+        if self._finished_snapshots(conn):
+            self._transaction(lambda conn: self._fold_metrics(conn, self._finished_snapshots(conn)))
+
+    def create(self, job_id: str, config: Dict[str, Any], owner: Optional[str] = None,
+               dispatcher: Optional[str] = None) -> None:
+        """
+        Add a queued job
+
+        A job with a `dispatcher` (see process_id()) can only be started by
+        that process, e.g. because only it holds the job's API key.
+        """
+        now = time.time()
+        self._connection().execute(
+            "INSERT INTO jobs (job_id, owner, state, config, created_at, updated_at, status_message, dispatcher) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, 'Waiting for a free pipeline worker...', ?)",
+            (job_id, owner, json.dumps(config), now, now, dispatcher)
+        )
+
+    def claim_next(self, max_running: int, dispatcher: Optional[str] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Atomically move the oldest queued job that `dispatcher` may start to
+        'running' if fewer than max_running jobs are running; returns
+        (job_id, config) or None
+        """
+        def statements(conn):
+            running = conn.execute("SELECT COUNT(*) FROM jobs WHERE state = 'running'").fetchone()[0]
+            if running >= max_running:
+                return None
+            row = conn.execute(
+                "SELECT job_id, config FROM jobs WHERE state = 'queued' AND (dispatcher IS NULL OR dispatcher = ?) "
+                "ORDER BY created_at LIMIT 1",
+                (dispatcher,)
+            ).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET state = 'running', started_at = ?, updated_at = ?, version = version + 1, "
+                "status_message = 'Starting classification...', worker_host = ? WHERE job_id = ?",
+                (now, now, socket.gethostname(), row['job_id'])
+            )
+            return row['job_id'], json.loads(row['config'])
+
+        return self._transaction(statements)
+
+    def set_worker(self, job_id: str, pid: int) -> None:
+        """Record the process executing a job"""
+        self._connection().execute(
+            "UPDATE jobs SET worker_pid = ?, worker_host = ?, updated_at = ? WHERE job_id = ?",
+            (pid, socket.gethostname(), time.time(), job_id)
+        )
+
+    def update_progress(self, job_id: str, category_done: Optional[str] = None, **fields) -> None:
+        """
+        Update progress fields of a running job in a single transaction;
+        category_done counts one finished task of that category
+        """
+        fields = {k: v for k, v in fields.items() if k in PROGRESS_FIELDS}
+        assignments = ''.join(f"{k} = ?, " for k in fields)
+
+        def statements(conn):
+            conn.execute(
+                f"UPDATE jobs SET {assignments}version = version + 1, updated_at = ? "
+                "WHERE job_id = ? AND state = 'running'",
+                (*fields.values(), time.time(), job_id)
+            )
+            if category_done:
+                conn.execute(
+                    "INSERT INTO job_categories (job_id, category, completed) VALUES (?, ?, 1) "
+                    "ON CONFLICT (job_id, category) DO UPDATE SET completed = completed + 1",
+                    (job_id, category_done)
+                )
+
+        self._transaction(statements, immediate=False)
+
+    def finish(self, job_id: str, state: str, error: Optional[str] = None,
+               result_file: Optional[str] = None) -> None:
+        """Record the final state of a job and fold its metrics into the totals of finished jobs"""
+        now = time.time()
+        progress_sql = ", progress = 100" if state == 'done' else ""
+
+        def statements(conn):
+            cursor = conn.execute(
+                f"UPDATE jobs SET state = ?, error = ?, result_file = ?, finished_at = ?, updated_at = ?, "
+                f"version = version + 1{progress_sql} "
+                "WHERE job_id = ? AND state IN ('queued', 'running')",
+                (state, error, result_file, now, now, job_id)
+            )
+            if cursor.rowcount:
+                self._fold_metrics(conn, [job_id])
+
+        self._transaction(statements)
+
+    def request_cancel(self, job_id: str, message: str) -> bool:
+        """
+        Cancel a job: queued jobs are cancelled directly, running jobs are
+        flagged for their worker. Returns False if the job is unknown or finished.
+        """
+        conn = self._connection()
+        now = time.time()
+        cursor = conn.execute(
+            "UPDATE jobs SET state = 'cancelled', cancel_requested = 1, error = ?, finished_at = ?, updated_at = ?, "
+            "version = version + 1 "
+            "WHERE job_id = ? AND state = 'queued'",
+            (message, now, now, job_id)
+        )
+        if cursor.rowcount:
+            return True
+        cursor = conn.execute(
+            "UPDATE jobs SET cancel_requested = 1, status_message = 'Cancellation requested...', updated_at = ?, "
+            "version = version + 1 "
+            "WHERE job_id = ? AND state = 'running'",
+            (now, job_id)
+        )
+        return cursor.rowcount > 0
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        row = self._connection().execute(
+            "SELECT cancel_requested FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job record (without its config), or None if unknown"""
+        return self.get_many([job_id]).get(job_id)
+
+    def get_many(self, job_ids) -> Dict[str, Dict[str, Any]]:
+        """Return job records with their per-category completions, keyed by job id"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return {}
+        placeholders = ', '.join('?' for _ in job_ids)
+        conn = self._connection()
+        jobs = {}
+        for row in conn.execute(f"SELECT * FROM jobs WHERE job_id IN ({placeholders})", job_ids):
+            job = dict(row)
+            job.pop('config')
+            job['category_counts'] = {}
+            jobs[job['job_id']] = job
+        for row in conn.execute(
+            f"SELECT job_id, category, completed FROM job_categories WHERE job_id IN ({placeholders})", job_ids
+        ):
+            jobs[row['job_id']]['category_counts'][row['category']] = row['completed']
+        return jobs
+
+    def add_result(self, job_id: str, result: Dict[str, Any]) -> int:
+        """Append a completed classification result of a job; returns its cursor position"""
+        cursor = self._connection().execute(
+            "INSERT INTO job_results (job_id, title, description, category, ai_code, confidence, reasoning) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, result['title'], result['description'], result['category'],
+             str(result['ai_code']), float(result['confidence']), result.get('reasoning') or '')
+        )
+        return cursor.lastrowid
+
+    def get_results(self, job_id: str, after: int = 0, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Results of a job in completion order, starting after the cursor position `after`"""
+        rows = self._connection().execute(
+            "SELECT seq, title, description, category, ai_code, confidence, reasoning FROM job_results "
+            "WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (job_id, after, -1 if limit is None else limit)
+        )
+        return [dict(row) for row in rows]
+
+    def set_metrics(self, job_id: str, snapshot: Dict[str, Any]) -> None:
+        """Store the latest metrics snapshot of an unfinished job (see utils/metrics.py)"""
+        self._connection().execute(
+            "INSERT OR REPLACE INTO job_metrics (job_id, metrics, updated_at) SELECT ?, ?, ? "
+            "WHERE EXISTS (SELECT 1 FROM jobs WHERE job_id = ? AND state IN ('queued', 'running'))",
+            (job_id, json.dumps(snapshot), time.time(), job_id)
+        )
+
+    def all_metrics(self) -> List[Dict[str, Any]]:
+        """
+        Metrics snapshots for the /metrics endpoint: one per unfinished job
+        plus the running totals of all finished jobs
+        """
+        rows = self._connection().execute(
+            "SELECT metrics FROM job_metrics UNION ALL SELECT metrics FROM finished_metrics"
+        )
+        return [json.loads(row['metrics']) for row in rows]
+
+    @staticmethod
+    def _finished_snapshots(conn) -> List[str]:
+        """Jobs that are finished (or gone) but still have a metrics snapshot of their own"""
+        return [row['job_id'] for row in conn.execute(
+            "SELECT m.job_id FROM job_metrics m LEFT JOIN jobs j ON j.job_id = m.job_id "
+            "WHERE j.state IS NULL OR j.state NOT IN ('queued', 'running')"
+        )]
+
+    @staticmethod
+    def _fold_metrics(conn, job_ids: List[str]) -> None:
+        """Add the snapshots of finished jobs to the totals and drop them, so /metrics stays cheap"""
+        if not job_ids:
+            return
+        placeholders = ', '.join('?' for _ in job_ids)
+        snapshots = [json.loads(row['metrics']) for row in conn.execute(
+            f"SELECT metrics FROM job_metrics WHERE job_id IN ({placeholders})", job_ids
+        )]
+        if not snapshots:
+            return
+        row = conn.execute("SELECT metrics FROM finished_metrics WHERE id = 1").fetchone()
+        if row is not None:
+            snapshots.insert(0, json.loads(row['metrics']))
+        conn.execute(
+            "INSERT OR REPLACE INTO finished_metrics (id, metrics, updated_at) VALUES (1, ?, ?)",
+            (json.dumps(merge_snapshots(snapshots)), time.time())
+        )
+        conn.execute(f"DELETE FROM job_metrics WHERE job_id IN ({placeholders})", job_ids)
+
+    def fail_orphaned(self, job_id: str, message: str) -> bool:
+        """Mark a running job as failed if its worker process on this host has exited"""
+        job = self.get(job_id)
+        if not job or job['state'] != 'running' or not job['worker_pid']:
+            return False
+        if job['worker_host'] != socket.gethostname() or _pid_alive(job['worker_pid']):
+            return False
+        self.finish(job_id, 'failed', error=message)
+        return True
+
+    def fail_stranded(self, job_id: str, message: str) -> bool:
+        """Mark a queued job as failed if the process on this host that had to start it has exited"""
+        job = self.get(job_id)
+        if not job or job['state'] != 'queued' or not job['dispatcher']:
+            return False
+        host, _, pid = job['dispatcher'].rpartition(':')
+        if host != socket.gethostname() or not pid.isdigit() or _pid_alive(int(pid)):
+            return False
+        self.finish(job_id, 'failed', error=message)
+        return True
+
+
+def process_id() -> str:
+    """Identifies this process across the processes sharing a store ('host:pid')"""
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
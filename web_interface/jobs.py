@@ -0,0 +1,297 @@
+"""
+Background job runner for pipeline runs started from the web interface
+
+Submitting a run returns a job id immediately; the pipeline itself runs in a
+dedicated pool of worker processes, so web workers stay responsive and runs
+are not bound by the HTTP/gunicorn request timeout.
+
+Job state is kept in a shared JobStore (SQLite), so any gunicorn worker can
+report status or cancel any job, and the concurrency limit is enforced
+across all web processes.
+
+API keys are never written to the store or to os.environ: the key entered
+in the web form and the inline keys of configured endpoints are split off
+the job's config (split_secrets). The web process that received the job
+keeps them in memory, only that process may start the job (JobStore
+dispatcher), and it hands them to the job's worker process as an argument.
+If that web process exits first, the job fails and has to be started again.
+
+Job states:
+- queued:    waiting for a free worker
+- running:   pipeline is executing
+- done:      finished, result_file is set
+- failed:    finished with an error
+- cancelled: stopped on user request
+"""
+
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Optional, Tuple
+
+from web_interface.job_store import JobStore, process_id
+
+JOB_STATES = ('queued', 'running', 'done', 'failed', 'cancelled')
+FINISHED_STATES = ('done', 'failed', 'cancelled')
+
+CANCEL_MESSAGE = "Pipeline cancelled by user"
+STRANDED_MESSAGE = "The web server process holding the job's API key exited before the job started; start it again"
+
+# How often each web process looks for queued jobs it can start
+DISPATCH_INTERVAL = 2.0
+
+# How often a running job checks for a cancel request (seconds)
+CANCEL_POLL_INTERVAL = 0.2
+
+# How often a running job publishes its metrics snapshot (seconds)
+METRICS_PUSH_INTERVAL = 2.0
+
+logger = logging.getLogger('job_runner')
+
+
+def _init_worker(log_dir: str):
+    """Set up logging in a freshly spawned worker process"""
+    from run_pipeline import CONFIG
+    from utils.async_logging import setup_async_logging
+
+    os.makedirs(log_dir, exist_ok=True)
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    formatter = logging.Formatter(json.dumps(CONFIG['logging']['format']), datefmt='%Y-%m-%d %H:%M:%S')
+    setup_async_logging(
+        os.path.join(log_dir, f'job_worker_{os.getpid()}_{timestamp}.log'),
+        formatter,
+        trace_file=os.path.join(log_dir, f'job_worker_trace_{os.getpid()}_{timestamp}.jsonl.gz'),
+        console=False
+    )
+
+
+def split_secrets(config: Dict[str, Any], api_key: Optional[str] = None) -> Tuple[Dict[str, Any], Dict[str, Any]]:
+    """
+    The config without API keys, safe to store, and the keys for with_secrets()
+
+    Secrets are the form's `api_key` and the inline api_key of each
+    configured endpoint (by position); api_key_env entries hold no secret.
+    """
+    secrets: Dict[str, Any] = {}
+    if api_key:
+        secrets['api_key'] = api_key
+    entries = (config.get('gpt') or {}).get('endpoints') or []
+    endpoint_keys = {index: entry['api_key'] for index, entry in enumerate(entries) if entry.get('api_key')}
+    if endpoint_keys:
+        secrets['endpoint_keys'] = endpoint_keys
+        entries = [{key: value for key, value in entry.items() if key != 'api_key'} for entry in entries]
+        config = {**config, 'gpt': {**config['gpt'], 'endpoints': entries}}
+    return config, secrets
+
+
+def with_secrets(config: Dict[str, Any], secrets: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Config with the keys split off by split_secrets() put back
+
+    The form's key is used by the endpoints without a key of their own
+    (without configured endpoints: the default OpenAI endpoint). Keys only
+    live in the job's config, not in the worker's environment, so later jobs
+    of the same worker process cannot pick them up.
+    """
+    if not secrets:
+        return config
+    endpoint_keys = secrets.get('endpoint_keys') or {}
+    entries = [{**entry, 'api_key': endpoint_keys[index]} if index in endpoint_keys else entry
+               for index, entry in enumerate(config['gpt'].get('endpoints') or [])]
+    api_key = secrets.get('api_key')
+    if api_key:
+        entries = [entry if entry.get('api_key') or entry.get('api_key_env') else {**entry, 'api_key': api_key}
+                   for entry in entries or [{}]]
+    config['gpt']['endpoints'] = entries
+    return config
+
+
+def _run_job(job_id: str, config: Dict[str, Any], store_path: str,
+             secrets: Optional[Dict[str, Any]] = None) -> None:
+    """Execute one pipeline run inside a worker process and record its outcome"""
+    from run_pipeline import TrainingDataClassifier
+    from utils.metrics import METRICS
+
+    config = with_secrets(config, secrets)
+    store = JobStore(store_path)
+    store.set_worker(job_id, os.getpid())
+    if (config.get('tracing') or {}).get('enabled'):
+        # Trace spans of the run show which job it was and how long it waited in the queue
+        job = store.get(job_id) or {}
+        queued = (job['started_at'] - job['created_at']) if job.get('started_at') else None
+        config['tracing']['attributes'] = {'job.id': job_id, 'job.queue_seconds': queued}
+    if (config.get('fair_share') or {}).get('enabled'):
+        config['fair_share']['job_id'] = job_id  # The job's share of the API budget is tracked by job id
+    last_push = [0.0]
+
+    def push_metrics(force: bool = False):
+        # Served by the web app's /metrics endpoint; throttled to keep progress updates cheap
+        now = time.monotonic()
+        if force or now - last_push[0] >= METRICS_PUSH_INTERVAL:
+            last_push[0] = now
+            store.set_metrics(job_id, METRICS.snapshot())
+
+    def status_callback(entry_num, total_entries, category, progress, completed_tasks=0, total_tasks=0):
+        # The classifier passes a category when a task of that category has finished
+        store.update_progress(
+            job_id,
+            category_done=category or None,
+            current_entry=entry_num,
+            total_entries=total_entries,
+            current_category=category,
+            progress=progress,
+            completed_tasks=completed_tasks,
+            total_tasks=total_tasks,
+            status_message=f'Processing entry {entry_num}/{total_entries} - Category: {category}'
+        )
+        push_metrics()
+
+    def result_callback(result):
+        # Completed results are available for download while the job is running
+        store.add_result(job_id, result.model_dump())
+
+    config['status_callback'] = status_callback
+    config['result_callback'] = result_callback
+    classifier = TrainingDataClassifier(config)
+    try:
+        completed = asyncio.run(_run_cancellable(classifier, store, job_id))
+    except asyncio.CancelledError:
+        push_metrics(force=True)
+        # Completed results were saved by the classifier before it stopped
+        result_file = os.path.basename(classifier.output_path) if classifier.output_path else None
+        store.finish(job_id, 'cancelled', error=CANCEL_MESSAGE, result_file=result_file)
+        return
+    except Exception as e:
+        push_metrics(force=True)
+        store.finish(job_id, 'failed', error=str(e))
+        return
+
+    push_metrics(force=True)
+    if not completed:
+        store.finish(job_id, 'failed', error="Pipeline did not complete, see the job worker log for details")
+    elif not classifier.output_path:
+        store.finish(job_id, 'failed', error='No results file found')
+    else:
+        store.finish(job_id, 'done', result_file=os.path.basename(classifier.output_path))
+
+
+async def _run_cancellable(classifier, store: JobStore, job_id: str) -> bool:
+    """Run the classifier as a task and cancel it as soon as a cancel request shows up"""
+    task = asyncio.create_task(classifier.run())
+    while not task.done():
+        await asyncio.wait({task}, timeout=CANCEL_POLL_INTERVAL)
+        if not task.done() and store.is_cancel_requested(job_id):
+            task.cancel()
+            break
+    return await task
+
+
+class JobRunner:
+    """Runs pipeline jobs from a shared JobStore in a pool of worker processes"""
+
+    def __init__(self, store: JobStore, max_concurrent_jobs: int = 2, log_dir: Optional[str] = None):
+        self.store = store
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.log_dir = log_dir or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'log')
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._active = 0  # Jobs of this process currently in the pool
+        self._secrets: Dict[str, Dict[str, Any]] = {}  # API keys of jobs submitted to this process, until they start
+        self._stop = threading.Event()
+
+    def _ensure_started(self):
+        """Start the worker pool and dispatcher on first use (after gunicorn has forked)"""
+        if self._executor is not None:
+            return
+        # Spawned workers don't inherit the web process' threads, locks or sockets
+        context = multiprocessing.get_context('spawn')
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.max_concurrent_jobs,
+            mp_context=context,
+            initializer=_init_worker,
+            initargs=(self.log_dir,)
+        )
+        threading.Thread(target=self._dispatch_loop, name='job-dispatcher', daemon=True).start()
+
+    def submit(self, config: Dict[str, Any], owner: Optional[str] = None, api_key: Optional[str] = None) -> str:
+        """Queue a pipeline run and return its job id; API keys are kept in memory only (see module docstring)"""
+        config = {k: v for k, v in config.items() if k not in ('status_callback', 'result_callback')}
+        config, secrets = split_secrets(config, api_key)
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if secrets:
+                self._secrets[job_id] = secrets
+            self.store.create(job_id, config, owner=owner, dispatcher=process_id() if secrets else None)
+        logger.info("Job submitted", extra={'job_id': job_id, 'owner': owner})
+        with self._lock:
+            self._ensure_started()
+        self._dispatch()
+        return job_id
+
+    def _dispatch(self):
+        """Start queued jobs while the global concurrency limit allows it"""
+        with self._lock:
+            if self._executor is None:
+                return
+            while self._active < self.max_concurrent_jobs:
+                claimed = self.store.claim_next(self.max_concurrent_jobs, dispatcher=process_id())
+                if claimed is None:
+                    break
+                job_id, config = claimed
+                self._active += 1
+                future = self._executor.submit(_run_job, job_id, config, self.store.path,
+                                               self._secrets.pop(job_id, None))
+                future.add_done_callback(lambda f, job_id=job_id: self._on_done(job_id, f))
+                logger.info("Job started", extra={'job_id': job_id})
+
+    def _dispatch_loop(self):
+        # Picks up jobs queued by other processes once capacity frees up
+        while not self._stop.wait(DISPATCH_INTERVAL):
+            try:
+                self._dispatch()
+            except Exception as e:
+                logger.error(f"Job dispatch failed: {str(e)}")
+
+    def _on_done(self, job_id: str, future: Future):
+        with self._lock:
+            self._active -= 1
+        if future.cancelled():
+            self.store.finish(job_id, 'failed', error='Web server shut down before the job started')
+        elif future.exception() is not None:
+            # The worker process itself failed (e.g. it was killed)
+            self.store.finish(job_id, 'failed', error=str(future.exception()) or 'Job worker failed')
+        job = self.store.get(job_id)
+        logger.info("Job finished", extra={'job_id': job_id, 'state': job['state'], 'error': job['error']})
+        if not self._stop.is_set():
+            self._dispatch()
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a snapshot of a job's state and progress, or None if unknown"""
+        job = self.store.get(job_id)
+        if job and job['state'] == 'running' and self.store.fail_orphaned(job_id, 'Job worker exited unexpectedly'):
+            job = self.store.get(job_id)
+        elif job and job['state'] == 'queued' and self.store.fail_stranded(job_id, STRANDED_MESSAGE):
+            job = self.store.get(job_id)
+        return job
+
+    def cancel(self, job_id: str) -> bool:
+        """Request cancellation; returns False if the job is unknown or already finished"""
+        # Queued jobs are cancelled directly; running jobs cancel their pipeline task when they see the flag
+        cancelled = self.store.request_cancel(job_id, CANCEL_MESSAGE)
+        with self._lock:
+            self._secrets.pop(job_id, None)
+        return cancelled
+
+    def shutdown(self):
+        """Stop the worker pool (running jobs are allowed to finish)"""
+        self._stop.set()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,177 @@
+"""
+Server-sent progress events for pipeline jobs
+
+Browsers follow a job through an EventSource on /pipeline_events/<job_id>
+instead of polling /pipeline_status every second.
+
+One ProgressBroadcaster per web process polls the job store for all
+watched jobs in a single query, and only when a job's version changed
+builds its event and encodes it once. Every open stream just waits on a
+condition and writes the shared, pre-encoded event, so many browsers
+watching the same job cost almost nothing, and rapid progress updates are
+coalesced into at most one event per poll interval.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from web_interface.job_store import JobStore
+from web_interface.jobs import FINISHED_STATES
+
+# How often the store is polled for watched jobs (seconds)
+POLL_INTERVAL = 0.5
+
+# Keep-alive comment interval, so proxies don't close idle streams (seconds)
+KEEPALIVE_INTERVAL = 15.0
+
+# Streams are closed after this long; the browser reconnects automatically
+MAX_STREAM_SECONDS = 300.0
+
+# Reconnect delay advertised to the browser (milliseconds)
+RETRY_MS = 2000
+
+# Running jobs without any update for this long are checked for a dead worker
+STALE_AFTER = 30.0
+
+logger = logging.getLogger('progress_events')
+
+
+def progress_rates(job: Dict[str, Any], now: Optional[float] = None) -> Dict[str, Optional[float]]:
+    """Throughput (tasks/s since the job started) and estimated seconds remaining"""
+    now = now or time.time()
+    completed = job.get('completed_tasks') or 0
+    total = job.get('total_tasks') or 0
+    started = job.get('started_at')
+    if not started or completed <= 0:
+        return {'throughput': None, 'eta_seconds': None}
+    end = job.get('finished_at') or now
+    elapsed = max(end - started, 1e-6)
+    throughput = completed / elapsed
+    eta = max(total - completed, 0) / throughput if total and job.get('state') == 'running' else None
+    return {'throughput': round(throughput, 3), 'eta_seconds': round(eta, 1) if eta is not None else None}
+
+
+def encode_event(data: Dict[str, Any], event: str = 'progress', event_id: Optional[int] = None) -> bytes:
+    """Encode one server-sent event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False, default=str)}")
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+class ProgressBroadcaster:
+    """Shares one store poller between all progress streams of a web process"""
+
+    def __init__(self, store: JobStore, build_event: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 interval: float = POLL_INTERVAL):
+        """
+        Args:
+            store: Shared job store
+            build_event: Turns a job record (with category_counts) into the event payload
+            interval: Poll interval in seconds
+        """
+        self.store = store
+        self.build_event = build_event
+        self.interval = interval
+        self._condition = threading.Condition()
+        self._watchers: Dict[str, int] = {}
+        self._events: Dict[str, Tuple[int, bool, bytes]] = {}  # job_id -> (version, finished, encoded)
+        self._thread: Optional[threading.Thread] = None
+
+    def _ensure_started(self):
+        # Started lazily so the thread is created after gunicorn has forked
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._poll_loop, name='progress-events', daemon=True)
+            self._thread.start()
+
+    def _poll_loop(self):
+        while True:
+            with self._condition:
+                while not self._watchers:
+                    self._events.clear()
+                    self._condition.wait()
+                job_ids = list(self._watchers)
+            try:
+                self._poll(job_ids)
+            except Exception as e:
+                logger.error(f"Polling job progress failed: {str(e)}")
+            time.sleep(self.interval)
+
+    def _poll(self, job_ids):
+        jobs = self.store.get_many(job_ids)
+        now = time.time()
+        changed = {}
+        for job_id, job in jobs.items():
+            if job['state'] == 'running' and now - job['updated_at'] > STALE_AFTER:
+                if self.store.fail_orphaned(job_id, 'Job worker exited unexpectedly'):
+                    continue  # Picked up with its final state on the next poll
+            cached = self._events.get(job_id)
+            if cached and cached[0] == job['version']:
+                continue
+            finished = job['state'] in FINISHED_STATES
+            event = 'finished' if finished else 'progress'
+            changed[job_id] = (job['version'], finished, encode_event(self.build_event(job), event, job['version']))
+        if changed:
+            with self._condition:
+                self._events.update(changed)
+                self._condition.notify_all()
+
+    def current(self, job_id: str) -> Optional[Tuple[int, bool, bytes]]:
+        """Latest encoded event of a watched job, read directly from the store if not polled yet"""
+        with self._condition:
+            cached = self._events.get(job_id)
+        if cached:
+            return cached
+        job = self.store.get_many([job_id]).get(job_id)
+        if job is None:
+            return None
+        finished = job['state'] in FINISHED_STATES
+        event = 'finished' if finished else 'progress'
+        return job['version'], finished, encode_event(self.build_event(job), event, job['version'])
+
+    def stream(self, job_id: str, last_version: int = -1,
+               max_seconds: float = MAX_STREAM_SECONDS) -> Iterator[bytes]:
+        """Yield encoded events for a job until it finishes or the stream times out"""
+        with self._condition:
+            self._watchers[job_id] = self._watchers.get(job_id, 0) + 1
+            self._ensure_started()
+            self._condition.notify_all()
+        try:
+            yield f"retry: {RETRY_MS}\n\n".encode('utf-8')
+            deadline = time.monotonic() + max_seconds
+            last_sent = time.monotonic()
+            snapshot = self.current(job_id)
+            if snapshot is None:
+                yield encode_event({'job_id': job_id, 'error': 'Unknown job'}, 'unknown')
+                return
+            while True:
+                version, finished, encoded = snapshot
+                # The final event is always sent, so a reconnecting browser can close its stream
+                if version != last_version or finished:
+                    yield encoded
+                    last_version = version
+                    last_sent = time.monotonic()
+                if finished:
+                    return
+                now = time.monotonic()
+                if now >= deadline:
+                    return
+                if now - last_sent >= KEEPALIVE_INTERVAL:
+                    yield b": keep-alive\n\n"
+                    last_sent = now
+                with self._condition:
+                    self._condition.wait_for(
+                        lambda: self._events.get(job_id, snapshot)[0] != last_version,
+                        timeout=min(KEEPALIVE_INTERVAL, deadline - now)
+                    )
+                    snapshot = self._events.get(job_id, snapshot)
+        finally:
+            with self._condition:
+                self._watchers[job_id] -= 1
+                if not self._watchers[job_id]:
+                    del self._watchers[job_id]
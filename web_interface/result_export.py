@@ -0,0 +1,59 @@
+"""
+Export of a job's completed results from the job store
+
+Results are appended to the store as each classification completes, so a
+running job can be downloaded at any time. Pages are addressed by a cursor
+(the position of the last result already received), which lets clients
+fetch only what is new instead of the whole run again.
+
+Formats:
+- ndjson: one JSON object per result
+- csv:    one row per result
+- xlsx:   snapshot workbook in the same layout as results_<timestamp>.xlsx
+"""
+
+import csv
+import io
+import json
+from typing import Any, Dict, Iterator, List
+
+RESULT_FIELDS = ['seq', 'title', 'description', 'category', 'ai_code', 'confidence', 'reasoning']
+
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+}
+
+# Results per page unless the client asks for a different limit
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+
+def ndjson_lines(rows: List[Dict[str, Any]]) -> Iterator[str]:
+    """Yield one JSON line per result"""
+    for row in rows:
+        yield json.dumps({field: row[field] for field in RESULT_FIELDS}, ensure_ascii=False) + '\n'
+
+
+def csv_text(rows: List[Dict[str, Any]], header: bool = True) -> str:
+    """Results as CSV; follow-up pages can leave out the header"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=RESULT_FIELDS, extrasaction='ignore')
+    if header:
+        writer.writeheader()
+    writer.writerows(rows)
+    return buffer.getvalue()
+
+
+def xlsx_snapshot(rows: List[Dict[str, Any]]) -> bytes:
+    """Workbook with one row per entry, laid out like the pipeline's results file"""
+    from run_pipeline import ProcessingResult, ResultsManager
+
+    results = [
+        ProcessingResult(**{field: row[field] for field in RESULT_FIELDS if field != 'seq'})
+        for row in rows
+    ]
+    buffer = io.BytesIO()
+    ResultsManager().build_results_frame(results).to_excel(buffer, index=False)
+    return buffer.getvalue()